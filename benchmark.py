@@ -0,0 +1,227 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from export_fichiers import FORMATS, ecrire
+from generateur_journaux import DEVISES_DEFAUT, ecrire_xlsx, journal_achats, journal_ventes
+from lecture_excel import lire_excel
+from schema_journal import memoire
+from taux_change import StubProvider
+
+# Banc d'essai des contrôles sur journaux synthétiques : durée et pic mémoire de chaque
+# étape (lecture, normalisation, numérotation, contrôles, devises, export), résultats en JSON
+# pour comparer deux versions.
+#
+#   python benchmark.py --lignes 10000 100000 --sortie bench.json
+#   python benchmark.py --lignes 100000 --reference bench.json
+#   python benchmark.py --lignes 1000000 --sans-lecture --processus 16
+#
+# Les devises passent par StubProvider (aucun appel réseau). Les durées sont mesurées sans
+# tracemalloc, qui ralentit fortement le code Python ; les pics mémoire viennent d'une
+# seconde exécution instrumentée.
+
+SEUIL_REGRESSION = 1.2
+
+
+def _exports(mesure: "Mesure", df: pd.DataFrame) -> None:
+    # Écriture des exports Streamlit, sans leur cache d'octets
+    for fmt in FORMATS:
+        mesure(f"export_{fmt}", lambda: ecrire(df, fmt, BytesIO()), len(df))
+
+
+class Mesure:
+    def __init__(self, memoire: bool):
+        self.memoire = memoire
+        self.etapes: Dict[str, Dict] = {}
+
+    def __call__(self, etape: str, fonction: Callable, lignes: int):
+        if self.memoire:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        debut = time.perf_counter()
+        resultat = fonction()
+        duree = time.perf_counter() - debut
+        mesure = {"lignes": lignes, "duree_s": duree}
+        if self.memoire:
+            mesure["pic_mo"] = (tracemalloc.get_traced_memory()[1] - base) / 1024 ** 2
+        self.etapes[etape] = mesure
+        return resultat
+
+
+def _pipeline_achats(xlsx: bytes, mesure: Mesure, avec_lecture: bool, df_source: pd.DataFrame,
+                     processus: Optional[int]) -> None:
+    n = len(df_source)
+    if avec_lecture:
+        df = mesure("lecture", lambda: lire_excel(xlsx, header_row=1), n)
+    else:
+        df = df_source.copy()
+    mesure("normalisation", lambda: achats.normalize_achats(df), n)
+    mesure.etapes["normalisation"]["tableau_mo"] = memoire(df) / 1024 ** 2
+
+    def numeroter():
+        df["n° de piece"] = achats.fill_numeros_piece(df)
+    mesure("numerotation", numeroter, n)
+
+    logs, ko, indices = mesure("controles", lambda: achats.check_pieces(df, processus=processus), n)
+    corrige = df.drop(index=indices)
+    _exports(mesure, corrige)
+
+
+def _pipeline_ventes(xlsx: bytes, mesure: Mesure, avec_lecture: bool, df_source: pd.DataFrame,
+                     processus: Optional[int]) -> None:
+    n = len(df_source)
+    if avec_lecture:
+        df = mesure("lecture", lambda: lire_excel(xlsx, header_row=1), n)
+    else:
+        df = df_source.copy()
+    df = mesure("normalisation", lambda: ventes.prepare_ventes(df), n)
+    mesure.etapes["normalisation"]["tableau_mo"] = memoire(df) / 1024 ** 2
+    provider = StubProvider()
+    mesure("devises", lambda: ventes.convert_currencies(df, provider=provider, cache=None), n)
+    mesure("controles", lambda: ventes.check_factures(df, processus=processus), n)
+    _exports(mesure, df)
+
+
+def _meilleur(executions: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+    resultat: Dict[str, Dict] = {}
+    for etape in executions[0]:
+        resultat[etape] = dict(min(executions, key=lambda e: e[etape]["duree_s"])[etape])
+        resultat[etape]["lignes_par_s"] = resultat[etape]["lignes"] / max(resultat[etape]["duree_s"], 1e-9)
+    return resultat
+
+
+def run_benchmark(
+    tailles: List[int],
+    journaux: List[str],
+    lignes_par_piece: float = 4,
+    taux_erreurs: float = 0.05,
+    taux_lignes_vides: float = 0.02,
+    devises: Optional[Dict[str, float]] = None,
+    repetitions: int = 1,
+    avec_lecture: bool = True,
+    memoire: bool = True,
+    seed: int = 0,
+    processus: Optional[int] = None,
+) -> Dict:
+    resultats = []
+    for journal in journaux:
+        for taille in tailles:
+            if journal == "achats":
+                df = journal_achats(taille, lignes_par_piece, taux_erreurs, taux_lignes_vides, seed=seed)
+                pipeline = _pipeline_achats
+            else:
+                df = journal_ventes(taille, lignes_par_piece, taux_erreurs, taux_lignes_vides, devises, seed=seed)
+                pipeline = _pipeline_ventes
+            xlsx = ecrire_xlsx(df).getvalue() if avec_lecture else b""
+
+            executions = []
+            for _ in range(repetitions):
+                mesure = Mesure(memoire=False)
+                pipeline(xlsx, mesure, avec_lecture, df, processus)
+                executions.append(mesure.etapes)
+            etapes = _meilleur(executions)
+
+            if memoire:
+                mesure = Mesure(memoire=True)
+                tracemalloc.start()
+                try:
+                    pipeline(xlsx, mesure, avec_lecture, df, processus)
+                finally:
+                    tracemalloc.stop()
+                for etape, m in mesure.etapes.items():
+                    etapes[etape]["pic_mo"] = m["pic_mo"]
+
+            resultats.append({"journal": journal, "lignes": taille, "etapes": etapes})
+            total = sum(e["duree_s"] for e in etapes.values())
+            print(f"{journal:>6} {taille:>9} lignes | total {total:8.3f}s | " + " | ".join(
+                f"{nom} {e['duree_s']:.3f}s" + (f" {e['pic_mo']:.0f} Mo" if "pic_mo" in e else "")
+                for nom, e in etapes.items()
+            ))
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plateforme": platform.platform(),
+        "parametres": {
+            "lignes_par_piece": lignes_par_piece,
+            "taux_erreurs": taux_erreurs,
+            "taux_lignes_vides": taux_lignes_vides,
+            "devises": devises or DEVISES_DEFAUT,
+            "repetitions": repetitions,
+            "seed": seed,
+            "processus": processus,
+        },
+        "resultats": resultats,
+    }
+
+
+def comparer(actuel: Dict, reference: Dict, seuil: float = SEUIL_REGRESSION) -> List[str]:
+    # Renvoie les étapes plus lentes que la référence au-delà du seuil
+    anciens = {(r["journal"], r["lignes"]): r["etapes"] for r in reference["resultats"]}
+    regressions = []
+    for r in actuel["resultats"]:
+        avant = anciens.get((r["journal"], r["lignes"]))
+        if not avant:
+            continue
+        for etape, m in r["etapes"].items():
+            if etape not in avant:
+                continue
+            ratio = m["duree_s"] / max(avant[etape]["duree_s"], 1e-9)
+            ligne = f"{r['journal']:>6} {r['lignes']:>9} {etape:<14} {avant[etape]['duree_s']:8.3f}s → {m['duree_s']:8.3f}s (x{ratio:.2f})"
+            print(("⚠️ " if ratio > seuil else "   ") + ligne)
+            if ratio > seuil:
+                regressions.append(ligne)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Mesure chaque étape des contrôles sur des journaux synthétiques.")
+    parser.add_argument("--lignes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--journal", choices=["achats", "ventes"], nargs="+", default=["achats", "ventes"])
+    parser.add_argument("--lignes-par-piece", type=float, default=4)
+    parser.add_argument("--taux-erreurs", type=float, default=0.05)
+    parser.add_argument("--taux-lignes-vides", type=float, default=0.02)
+    parser.add_argument("--devises", type=json.loads, default=None,
+                        help='Répartition des devises en JSON, ex. \'{"€": 0.8, "$": 0.2}\'')
+    parser.add_argument("--repetitions", type=int, default=1, help="Meilleure durée sur N exécutions")
+    parser.add_argument("--sans-lecture", action="store_true", help="Ne pas mesurer la lecture du xlsx (lente)")
+    parser.add_argument("--sans-memoire", action="store_true", help="Ne pas mesurer les pics mémoire")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processus", type=int, default=None,
+                        help="Contrôles répartis sur N processus (cf. controle_parallele)")
+    parser.add_argument("--sortie", help="Fichier JSON des résultats")
+    parser.add_argument("--reference", help="Résultats JSON d'une version précédente à comparer")
+    args = parser.parse_args(argv)
+
+    resultats = run_benchmark(
+        args.lignes, args.journal, args.lignes_par_piece, args.taux_erreurs, args.taux_lignes_vides,
+        args.devises, args.repetitions, not args.sans_lecture, not args.sans_memoire, args.seed,
+        args.processus,
+    )
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = json.load(f)
+        print()
+        return 1 if comparer(resultats, reference) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Banc d'essai du démarrage à froid : chaque mesure se fait dans un nouvel interpréteur
+# (aucun module en cache), comme au premier rerun d'un conteneur ou d'un worker redémarré.
+#
+#   python benchmark_demarrage.py --sortie demarrage.json
+#   python benchmark_demarrage.py --reference demarrage.json
+#
+# Mesures : durée d'import des pages et des modules de contrôle, modules lourds chargés par
+# l'import des pages (ils ne doivent l'être qu'une fois un fichier choisi), et durée du
+# premier rendu de interface_streamlit (AppTest, sans serveur).
+
+SEUIL_REGRESSION = 1.2
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+
+IMPORTS = {
+    "streamlit": "streamlit",
+    "pages": "controle_achats, controle_ventes",
+    "controles": "controle_achats_logic, controle_ventes_logic",
+    "interface_complete": "controle_achats, controle_ventes, validation_incrementale, rapport_controle, export_fichiers",
+}
+MODULES_LOURDS = ["pandas", "numpy", "pyarrow", "requests", "openpyxl", "xlsx2csv", "xlsxwriter"]
+
+_MESURE_IMPORT = """
+import json, sys, time
+debut = time.perf_counter()
+import {modules}
+duree = time.perf_counter() - debut
+print(json.dumps({{"duree_s": duree, "lourds": [m for m in {lourds!r} if m in sys.modules]}}))
+"""
+
+_MESURE_RENDU = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+debut = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({chemin!r}, default_timeout=120)
+at.run()
+print(json.dumps({{"duree_s": time.perf_counter() - debut, "erreurs": len(at.exception)}}))
+"""
+
+
+def _executer(code: str) -> Dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [DOSSIER, os.environ.get("PYTHONPATH")])))
+    sortie = subprocess.run(
+        [sys.executable, "-c", code], cwd=DOSSIER, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(sortie.strip().splitlines()[-1])
+
+
+def mesurer_import(modules: str, repetitions: int) -> Dict:
+    mesures = [_executer(_MESURE_IMPORT.format(modules=modules, lourds=MODULES_LOURDS)) for _ in range(repetitions)]
+    meilleure = min(mesures, key=lambda m: m["duree_s"])
+    return {"duree_s": meilleure["duree_s"], "modules_lourds": meilleure["lourds"]}
+
+
+def mesurer_premier_rendu(repetitions: int) -> Dict:
+    chemin = os.path.join(DOSSIER, "interface_streamlit.py")
+    mesures = [_executer(_MESURE_RENDU.format(chemin=chemin)) for _ in range(repetitions)]
+    return min(mesures, key=lambda m: m["duree_s"])
+
+
+def run_benchmark(repetitions: int = 3, rendu: bool = True) -> Dict:
+    etapes: Dict[str, Dict] = {}
+    for nom, modules in IMPORTS.items():
+        etapes[f"import_{nom}"] = mesurer_import(modules, repetitions)
+    if rendu:
+        etapes["premier_rendu"] = mesurer_premier_rendu(repetitions)
+
+    for nom, m in etapes.items():
+        details = f" | lourds : {', '.join(m['modules_lourds']) or '—'}" if "modules_lourds" in m else ""
+        print(f"{nom:<28} {m['duree_s']:8.3f}s{details}")
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plateforme": platform.platform(),
+        "repetitions": repetitions,
+        "etapes": etapes,
+    }
+
+
+def comparer(actuel: Dict, reference: Dict, seuil: float = SEUIL_REGRESSION) -> List[str]:
+    # Renvoie les mesures plus lentes que la référence au-delà du seuil
+    regressions = []
+    for etape, m in actuel["etapes"].items():
+        avant = reference["etapes"].get(etape)
+        if not avant:
+            continue
+        ratio = m["duree_s"] / max(avant["duree_s"], 1e-9)
+        ligne = f"{etape:<28} {avant['duree_s']:8.3f}s → {m['duree_s']:8.3f}s (x{ratio:.2f})"
+        print(("⚠️ " if ratio > seuil else "   ") + ligne)
+        if ratio > seuil:
+            regressions.append(ligne)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Mesure le démarrage à froid de l'interface Streamlit.")
+    parser.add_argument("--repetitions", type=int, default=3, help="Meilleure durée sur N interpréteurs")
+    parser.add_argument("--sans-rendu", action="store_true", help="Ne pas mesurer le premier rendu (AppTest)")
+    parser.add_argument("--sortie", help="Fichier JSON des résultats")
+    parser.add_argument("--reference", help="Résultats JSON d'une version précédente à comparer")
+    args = parser.parse_args(argv)
+
+    resultats = run_benchmark(args.repetitions, not args.sans_rendu)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = json.load(f)
+        print()
+        return 1 if comparer(resultats, reference) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from generateur_journaux import ecrire_xlsx, journal_achats, journal_ventes
+from lecture_excel import choisir_moteur, lire_excel, moteurs_disponibles
+
+# Banc d'essai des moteurs de lecture xlsx (cf. lecture_excel) sur des journaux synthétiques
+# aux tailles de nos exports : chaque moteur installé, avec et sans projection sur les
+# colonnes des contrôles, comparé à pandas.read_excel (openpyxl), et le moteur que le choix
+# automatique retient pour chaque classeur.
+#
+#   python benchmark_lecture.py --lignes 10000 100000 --sortie lecture.json
+#   python benchmark_lecture.py --lignes 100000 --reference lecture.json
+
+SEUIL_REGRESSION = 1.2
+COLONNES_CONTROLES = {
+    "achats": achats.COLONNES_TEXTE + achats.COLONNES_MONTANTS,
+    "ventes": ventes.COLONNES_VENTES,
+}
+
+
+def _meilleure(fonction: Callable[[], pd.DataFrame], repetitions: int) -> float:
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return min(durees)
+
+
+def run_benchmark(tailles: List[int], journaux: List[str], repetitions: int = 1, seed: int = 0) -> Dict:
+    resultats = []
+    for journal in journaux:
+        for taille in tailles:
+            generer = journal_achats if journal == "achats" else journal_ventes
+            xlsx = ecrire_xlsx(generer(taille, seed=seed)).getvalue()
+            colonnes = COLONNES_CONTROLES[journal]
+
+            variantes: Dict[str, Callable[[], pd.DataFrame]] = {
+                "read_excel": lambda: pd.read_excel(BytesIO(xlsx), header=1, engine="openpyxl"),
+            }
+            for moteur in moteurs_disponibles():
+                variantes[moteur] = lambda m=moteur: lire_excel(xlsx, 1, moteur=m)
+                variantes[f"{moteur}_colonnes"] = lambda m=moteur: lire_excel(xlsx, 1, colonnes, moteur=m)
+            durees = {nom: _meilleure(f, repetitions) for nom, f in variantes.items()}
+
+            auto = choisir_moteur(xlsx)[0]
+            resultats.append({
+                "journal": journal, "lignes": taille, "octets": len(xlsx), "auto": auto, "durees_s": durees,
+            })
+            print(f"{journal:>6} {taille:>9} lignes {len(xlsx) / 1024 ** 2:6.1f} Mo | auto {auto:<9} | " + " | ".join(
+                f"{nom} {d:.3f}s" for nom, d in durees.items()
+            ))
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plateforme": platform.platform(),
+        "moteurs": moteurs_disponibles(),
+        "repetitions": repetitions,
+        "resultats": resultats,
+    }
+
+
+def comparer(actuel: Dict, reference: Dict, seuil: float = SEUIL_REGRESSION) -> List[str]:
+    # Renvoie les lectures plus lentes que la référence au-delà du seuil
+    anciens = {(r["journal"], r["lignes"]): r["durees_s"] for r in reference["resultats"]}
+    regressions = []
+    for r in actuel["resultats"]:
+        avant = anciens.get((r["journal"], r["lignes"]))
+        if not avant:
+            continue
+        for nom, duree in r["durees_s"].items():
+            if nom not in avant:
+                continue
+            ratio = duree / max(avant[nom], 1e-9)
+            ligne = f"{r['journal']:>6} {r['lignes']:>9} {nom:<20} {avant[nom]:8.3f}s → {duree:8.3f}s (x{ratio:.2f})"
+            print(("⚠️ " if ratio > seuil else "   ") + ligne)
+            if ratio > seuil:
+                regressions.append(ligne)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare les moteurs de lecture xlsx sur des journaux synthétiques.")
+    parser.add_argument("--lignes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--journal", choices=["achats", "ventes"], nargs="+", default=["achats", "ventes"])
+    parser.add_argument("--repetitions", type=int, default=1, help="Meilleure durée sur N lectures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sortie", help="Fichier JSON des résultats")
+    parser.add_argument("--reference", help="Résultats JSON d'une version précédente à comparer")
+    args = parser.parse_args(argv)
+
+    resultats = run_benchmark(args.lignes, args.journal, args.repetitions, args.seed)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = json.load(f)
+        print()
+        return 1 if comparer(resultats, reference) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from controle_achats_logic import _fill_numeros_piece_boucle, fill_numeros_piece
+
+
+def journal_synthetique(nb_pieces: int, lignes_par_piece: int = 4, taux_vides: float = 0.6, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    comptes, pieces = [], []
+    for p in range(nb_pieces):
+        code = f"{p % 12 + 1:02d}-{p + 1}"
+        for ligne in range(lignes_par_piece):
+            comptes.append("401000" if ligne == 0 else "604110")
+            pieces.append("" if rng.random() < taux_vides else code)
+    return pd.DataFrame({"Compte Généraux": comptes, "n° de piece": pieces})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare la boucle iterrows et le remplissage vectorisé des n° de pièce.")
+    parser.add_argument("--pieces", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--lignes", type=int, default=4)
+    args = parser.parse_args()
+
+    for nb in args.pieces:
+        df = journal_synthetique(nb, args.lignes)
+
+        t0 = time.perf_counter()
+        vectorise = fill_numeros_piece(df)
+        t_vect = time.perf_counter() - t0
+
+        boucle = df.copy()
+        t0 = time.perf_counter()
+        _fill_numeros_piece_boucle(boucle)
+        t_boucle = time.perf_counter() - t0
+
+        identique = (boucle["n° de piece"].to_numpy() == vectorise.to_numpy()).all()
+        print(
+            f"{len(df):>9} lignes | boucle {t_boucle:8.3f}s | vectorisé {t_vect:8.3f}s | "
+            f"x{t_boucle / max(t_vect, 1e-9):7.1f} | {'identique' if identique else '⚠️ DIFFÉRENT'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Mémoïsation des contrôles entre les reruns Streamlit : chaque widget (saisie dans le
+# data_editor, clic) relance tout le script, mais tant que le tableau source n'a pas changé
+# le résultat est le même. On le garde en mémoire, indexé par l'empreinte du contenu du
+# tableau et la version des règles, avec une limite de taille (LRU).
+
+TAILLE_MAX_DEFAUT = 512 * 1024 ** 2
+
+# (logs ou Rapport, pièces / factures KO, nombre de KO, tableau corrigé)
+ResultatControle = Tuple[Any, List[str], int, pd.DataFrame]
+
+
+def fingerprint(df: pd.DataFrame, *contexte: str) -> str:
+    h = hashlib.sha256()
+    h.update(repr((list(map(str, df.columns)), [str(t) for t in df.dtypes], contexte)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _taille(resultat: ResultatControle) -> int:
+    logs, ko, _, df = resultat
+    taille_logs = logs.taille() if hasattr(logs, "taille") else sum(len(l) for l in logs)
+    return int(df.memory_usage(deep=True).sum()) + taille_logs + sum(len(str(k)) for k in ko)
+
+
+def _copie_logs(logs):
+    return list(logs) if isinstance(logs, list) else logs
+
+
+class CheckCache:
+    def __init__(self, taille_max: int = TAILLE_MAX_DEFAUT):
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        self._entrees: "OrderedDict[str, Tuple[ResultatControle, int]]" = OrderedDict()
+        self._octets = 0
+        self._verrou = threading.Lock()
+
+    def get(self, cle: str) -> Optional[ResultatControle]:
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+        # Copies : l'interface modifie le tableau après coup ; un Rapport n'est jamais modifié
+        logs, ko, nb_ko, df = entree[0]
+        return _copie_logs(logs), list(ko), nb_ko, df.copy()
+
+    def put(self, cle: str, resultat: ResultatControle) -> ResultatControle:
+        logs, ko, nb_ko, df = resultat
+        stocke = (_copie_logs(logs), list(ko), nb_ko, df.copy())
+        taille = _taille(stocke)
+        with self._verrou:
+            if cle in self._entrees:
+                self._octets -= self._entrees.pop(cle)[1]
+            if taille <= self.taille_max:
+                self._entrees[cle] = (stocke, taille)
+                self._octets += taille
+            while self._octets > self.taille_max:
+                _, (_, t) = self._entrees.popitem(last=False)
+                self._octets -= t
+        return resultat
+
+    def invalidate(self, cle: Optional[str]) -> None:
+        with self._verrou:
+            if cle in self._entrees:
+                self._octets -= self._entrees.pop(cle)[1]
+
+    def clear(self) -> None:
+        with self._verrou:
+            self._entrees.clear()
+            self._octets = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entrees": len(self._entrees), "octets": self._octets}
+
+
+_cache: Optional[CheckCache] = None
+_verrou_cache = threading.Lock()
+
+
+def get_check_cache() -> CheckCache:
+    global _cache
+    with _verrou_cache:
+        if _cache is None:
+            _cache = CheckCache()
+        return _cache
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+import uuid
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+# Cache des fichiers importés : le DataFrame issu de safe_read_excel est stocké en Parquet,
+# indexé par l'empreinte SHA-256 du contenu et des paramètres de lecture (dont la version
+# et le moteur de lecture_excel, cf. parametres_cache). Un fichier déjà importé (même par
+# un autre utilisateur) est relu sans repasser par le lecteur xlsx.
+
+DOSSIER_DEFAUT = os.environ.get(
+    "CACHE_LECTURE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "myagency", "lectures")
+)
+TAILLE_MAX_DEFAUT = int(os.environ.get("CACHE_LECTURE_TAILLE_MAX", 2 * 1024 ** 3))
+
+
+def _contenu(uploaded) -> bytes:
+    if hasattr(uploaded, "getvalue"):
+        return uploaded.getvalue()
+    uploaded.seek(0)
+    data = uploaded.read()
+    uploaded.seek(0)
+    return data
+
+
+def normaliser_pour_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    # Les colonnes Excel mélangent souvent nombres et textes (ex. Compte Tiers : 401000 et
+    # « 401ABC ») ; Arrow les refuse, on passe alors les valeurs non nulles en texte.
+    # Les contrôles font de toute façon astype(str) / str(...) sur ces colonnes.
+    import pyarrow as pa
+
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+class ParseCache:
+    def __init__(self, dossier: str = DOSSIER_DEFAUT, taille_max: int = TAILLE_MAX_DEFAUT):
+        self.dossier = dossier
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._verrou = threading.Lock()
+        os.makedirs(dossier, exist_ok=True)
+
+    @staticmethod
+    def cle(contenu: bytes, **params) -> str:
+        h = hashlib.sha256(contenu)
+        h.update(repr(sorted(params.items())).encode())
+        return h.hexdigest()
+
+    def _chemin(self, cle: str) -> str:
+        return os.path.join(self.dossier, f"{cle}.parquet")
+
+    def get(self, cle: str) -> Optional[pd.DataFrame]:
+        chemin = self._chemin(cle)
+        try:
+            df = pd.read_parquet(chemin)
+            os.utime(chemin)  # la date de modification sert d'horodatage LRU
+        except (FileNotFoundError, OSError, ValueError):
+            with self._verrou:
+                self.misses += 1
+            return None
+        with self._verrou:
+            self.hits += 1
+        return df
+
+    def put(self, cle: str, df: pd.DataFrame) -> pd.DataFrame:
+        normalise = normaliser_pour_parquet(df)
+        tmp = os.path.join(self.dossier, f".{cle}.{uuid.uuid4().hex}.tmp")
+        try:
+            normalise.to_parquet(tmp, index=False)
+            os.replace(tmp, self._chemin(cle))
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return df
+        self._evincer()
+        return normalise
+
+    def _evincer(self) -> None:
+        with self._verrou:
+            entrees = []
+            for nom in os.listdir(self.dossier):
+                if nom.endswith(".parquet"):
+                    try:
+                        st = os.stat(os.path.join(self.dossier, nom))
+                    except FileNotFoundError:
+                        continue
+                    entrees.append((st.st_mtime, st.st_size, nom))
+            total = sum(taille for _, taille, _ in entrees)
+            for _, taille, nom in sorted(entrees):
+                if total <= self.taille_max:
+                    break
+                try:
+                    os.remove(os.path.join(self.dossier, nom))
+                except FileNotFoundError:
+                    pass
+                total -= taille
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._verrou:
+            for nom in os.listdir(self.dossier):
+                if nom.endswith(".parquet"):
+                    os.remove(os.path.join(self.dossier, nom))
+
+    def stats(self) -> Dict[str, int]:
+        fichiers = [n for n in os.listdir(self.dossier) if n.endswith(".parquet")]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entrees": len(fichiers),
+            "octets": sum(os.path.getsize(os.path.join(self.dossier, n)) for n in fichiers),
+        }
+
+    def read(self, uploaded, lire: Callable[[], pd.DataFrame], **params) -> pd.DataFrame:
+        cle = self.cle(_contenu(uploaded), **params)
+        df = self.get(cle)
+        if df is not None:
+            return df
+        return self.put(cle, lire())
+
+
+_cache: Optional[ParseCache] = None
+_verrou_cache = threading.Lock()
+
+
+def get_parse_cache() -> ParseCache:
+    global _cache
+    with _verrou_cache:
+        if _cache is None:
+            _cache = ParseCache()
+        return _cache
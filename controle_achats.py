@@ -1,49 +1,145 @@
 
 import streamlit as st
-import pandas as pd
-from io import BytesIO, StringIO
-import re, sys
-from typing import List, Tuple
-from controle_achats_logic import run_checks
-
-def safe_read_excel(uploaded, header_row: int = 1) -> pd.DataFrame:
-    try:
-        return pd.read_excel(uploaded, header=header_row, engine="openpyxl")
-    except Exception as err:
-        st.warning(f"openpyxl a échoué ; utilisation de xlsx2csv → {err}")
-        from xlsx2csv import Xlsx2csv
-        uploaded.seek(0)
-        csv_buffer = StringIO()
-        Xlsx2csv(BytesIO(uploaded.read()), outputencoding="utf-8").convert(csv_buffer)
-        csv_buffer.seek(0)
-        return pd.read_csv(csv_buffer, header=header_row)
-
-def dataframe_to_excel_bytes(df: pd.DataFrame) -> BytesIO:
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False)
-    buf.seek(0)
-    return buf
+import sys
+from io import BytesIO
+from typing import TYPE_CHECKING, Callable, Optional
+from profilage import Profil, afficher_performance, etape
+from ressources_streamlit import index_fichiers, prechauffer, service_controles, suivre_travail
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from cache_controles import ResultatControle
+
+# Pas d'effet de bord à l'import, et rien de plus lourd que streamlit : pandas et les
+# modules de contrôle ne sont importés qu'une fois un fichier choisi (préchargés entre-temps
+# par prechauffer). Lecture et contrôle tournent dans le service de contrôle
+# (cf. service_controles) : la page suit le travail sans bloquer son thread.
+
+ETAPES = ["normalisation", "numerotation", "controles"]
+
+def _read_excel(uploaded, header_row: int = 1, avertir: Callable[[str], None] = st.warning) -> "pd.DataFrame":
+    # Moteur choisi d'après le classeur, les autres en secours (cf. lecture_excel)
+    from lecture_excel import lire_excel
+
+    return lire_excel(uploaded, header_row, avertir=avertir)
+
+def _safe_read_excel(uploaded, header_row: int = 1, avertir: Callable[[str], None] = st.warning) -> "pd.DataFrame":
+    from cache_lecture import get_parse_cache
+    from lecture_excel import parametres_cache
+
+    return get_parse_cache().read(
+        uploaded,
+        lambda: _read_excel(uploaded, header_row, avertir),
+        lecteur="achats",
+        header_row=header_row,
+        **parametres_cache(uploaded),
+    )
+
+def safe_read_excel(uploaded, header_row: int = 1, avertir: Callable[[str], None] = st.warning) -> "pd.DataFrame":
+    with etape("lecture") as mesure:
+        df = _safe_read_excel(uploaded, header_row, avertir)
+        if mesure:
+            mesure.lignes = len(df)
+    return df
+
+def _controler(uploaded) -> Optional["ResultatControle"]:
+    # Soumet lecture (premier passage) et contrôle au service ; None tant que le travail
+    # n'est pas terminé (le fragment de suivi relance la page à la fin)
+    from cache_controles import fingerprint, get_check_cache
+    from controle_achats_logic import regles_achats
+
+    service = service_controles()
+    travail = service.travail(st.session_state.get("travail_achats"))
+    if travail is None:
+        contenu = BytesIO(uploaded.getvalue())
+        df_source = st.session_state.get("df_source")
+        validateur = st.session_state.validateur_achats
+
+        def controler(travail):
+            source = df_source if df_source is not None else safe_read_excel(contenu, 1, travail.avertir)
+            empreinte = fingerprint(source, "achats", regles_achats().signature())
+            cache = get_check_cache()
+            resultat = cache.get(empreinte)
+            if resultat is None:
+                df = source.copy()
+                # Après « Valider les corrections », seules les pièces modifiées sont recontrôlées
+                rapport, ko_pieces, nb_ko = validateur.validate(df)
+                resultat = cache.put(empreinte, (rapport, ko_pieces, nb_ko, df))
+            return source, empreinte, resultat
+
+        etapes = ETAPES if df_source is not None else ["lecture"] + ETAPES
+        # Pics mémoire par étape si le panneau Performance est coché
+        travail = service.soumettre(
+            controler, "Contrôle des achats", etapes, memoire=st.session_state.get("perf_achats", False)
+        )
+        st.session_state.travail_achats = travail.id
+
+    if not travail.termine:
+        suivre_travail(travail.id)
+        return None
+    for message in travail.avertissements:
+        st.warning(message)
+    service.oublier(st.session_state.pop("travail_achats"))
+    if travail.erreur is not None:
+        # Travail oublié : le rerun suivant (ou un autre fichier) en soumet un nouveau
+        st.error(f"❌ Contrôle impossible : {travail.erreur}")
+        return None
+    st.session_state.profil_travail_achats = travail.profil
+    st.session_state.df_source, st.session_state.empreinte_achats, resultat = travail.resultat
+    return resultat
 
 def run_interface():
+    prechauffer()
+    # Panneau optionnel : le suivi mémoire (tracemalloc) ralentit les contrôles
+    perf = st.sidebar.checkbox("⏱️ Performance", key="perf_achats")
+    with Profil(memoire=perf) as profil:
+        _interface()
+    if perf:
+        afficher_performance(profil, cle="perf_achats")
+        if "profil_travail_achats" in st.session_state:
+            afficher_performance(
+                st.session_state.profil_travail_achats, cle="perf_achats_travail", titre="⏱️ Dernier contrôle"
+            )
+
+def _interface():
     st.title("📊 Contrôle automatique des écritures d'achats")
 
     uploaded = st.file_uploader("Importe ton fichier Excel des achats", type=["xlsx"])
 
     if uploaded:
-        if "df_source" not in st.session_state:
-            st.session_state.df_source = safe_read_excel(uploaded, header_row=1)
+        from cache_controles import get_check_cache
+        from export_fichiers import bouton_telechargement
+        from fusion_corrections import afficher_journal, appliquer_corrections, cumuler
+        from rapport_controle import afficher_constats
+        from validation_incrementale import IncrementalAchats
 
-        df = st.session_state.df_source.copy()
+        if "validateur_achats" not in st.session_state:
+            st.session_state.validateur_achats = IncrementalAchats()
 
-        logs, ko_pieces, nb_ko = run_checks(df)
+        # Les reruns déclenchés par les widgets réutilisent le résultat mémorisé
+        cache = get_check_cache()
+        resultat = cache.get(st.session_state.empreinte_achats) if "empreinte_achats" in st.session_state else None
+        if resultat is None:
+            resultat = _controler(uploaded)
+            if resultat is None:
+                return
+        rapport, ko_pieces, nb_ko, df = resultat
 
+        # Le rapport est partagé avec le cache : la ligne Concierge s'ajoute à l'affichage
+        pied = []
         if nb_ko == 0 and "Concierge" in df.columns:
             df.drop(columns=["Concierge"], inplace=True)
-            logs.append("✅ Colonne Concierge supprimée avant export.")
+            pied.append("✅ Colonne Concierge supprimée avant export.")
 
-        st.subheader("📝 Logs")
-        st.code("\n".join(logs), language="text")
+        st.subheader("📝 Constats")
+        afficher_constats(rapport, "constats_achats", pied)
+        afficher_journal(st.session_state.get("corrections_achats"))
+        historique = st.sidebar.checkbox("🗂️ Comparer aux fichiers déjà contrôlés", key="index_achats")
+        if historique:
+            from index_historique import afficher_historique, source_fichier
+
+            source = source_fichier(uploaded.name, uploaded.getvalue())
+            afficher_historique(index_fichiers(), "achats", df, source, ko_pieces, (st.session_state.empreinte_achats, source))
 
         if nb_ko:
             st.warning(
@@ -64,28 +160,37 @@ def run_interface():
             )
 
             if st.button("✅ Valider les corrections"):
-                for _, r in edited.iterrows():
-                    idx = df[
-                        (df["n° de piece"] == r["n° de piece"]) & (df["Compte Généraux"] == "401000")
-                    ].index
-                    if not idx.empty:
-                        df.loc[
-                            idx,
-                            ["Compte Tiers", "Débit(€)", "Crédit (€)", "Libelle", "Concierge"]
-                        ] = r[
-                            ["Compte Tiers", "Débit(€)", "Crédit (€)", "Libelle", "Concierge"]
-                        ].values
-                st.session_state.df_source = df
-                st.success("✅ Modifications enregistrées. Clique sur le bouton ci-dessous pour relancer le contrôle.")
-                if st.button("🔁 Relancer le contrôle"):
-                    st._is_running_with_streamlit = True
-                    sys.exit()
+                # Une seule mise à jour indexée par colonne, sur les lignes 401000 des pièces éditées
+                try:
+                    modifications = appliquer_corrections(
+                        df, edited,
+                        ["Compte Tiers", "Débit(€)", "Crédit (€)", "Libelle", "Concierge"],
+                        cle="n° de piece",
+                        masque=(df["Compte Généraux"] == "401000").to_numpy(dtype=bool),
+                    )
+                except ValueError as err:
+                    st.error(f"❌ {err}")
+                else:
+                    st.session_state.corrections_achats = cumuler(
+                        st.session_state.get("corrections_achats"), modifications
+                    )
+                    st.session_state.df_source = df
+                    cache.invalidate(st.session_state.pop("empreinte_achats", None))
+                    st.success(
+                        f"✅ {len(modifications)} modification(s) enregistrée(s). "
+                        "Clique sur le bouton ci-dessous pour relancer le contrôle."
+                    )
+                    if st.button("🔁 Relancer le contrôle"):
+                        st._is_running_with_streamlit = True
+                        sys.exit()
         else:
             st.success("🎉 Plus aucun achat KO. Tu peux exporter le fichier corrigé.")
-            buf = dataframe_to_excel_bytes(df)
-            st.download_button(
-                "📥 Télécharger le fichier corrigé",
-                buf,
-                "achats_corriges.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+            # Le fichier n'entre dans l'historique qu'exporté, corrections validées
+            if bouton_telechargement(df, "achats_corriges", cle="export_achats") and historique:
+                from index_historique import enregistrer_historique
+
+                enregistrer_historique(index_fichiers(), "achats", df, source)
+
+
+if __name__ == "__main__":
+    run_interface()
@@ -1,7 +1,13 @@
 
+import numpy as np
 import pandas as pd
 import re
-from typing import List, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
+
+import profilage
+from regles import BLOQUANTE, FICHIER, GROUPE, LIGNE, Constat, Contexte, JeuRegles, Regle, jeu_client
+from schema_journal import SCHEMA_ACHATS, normaliser_texte, parser_montants
 
 REGEX_NUM_PIECE = re.compile(r"^(0[1-9]|1[0-2])-\d+$")
 REGEX_DATE_2025 = re.compile(r"^\d{2}/\d{2}/2025$")
@@ -11,31 +17,26 @@ COLONNES_TEXTE = [
     "Libelle", "Concierge", "n° de piece", "Analytique", "Code"
 ]
 COLONNES_MONTANTS = ["Débit(€)", "Crédit (€)"]
+COMPTES_AUTORISES = {"604110", "604000", "604900", "445660"}
+# À incrémenter à chaque changement de règle : invalide les résultats mémorisés
+REGLES_VERSION = "1"
 
-def run_checks(df: pd.DataFrame) -> Tuple[List[str], List[str], int]:
-    logs: List[str] = []
-    achats_ko: List[str] = []
-    indices_a_suppr: List[int] = []
+# (n° de pièce, constats, corrections, avoir ?, lignes vides [(index, compte)])
+ResultatAchat = Tuple[str, List[Constat], List[str], bool, List[Tuple[int, str]]]
 
-    for col in COLONNES_TEXTE:
-        df[col] = (
-            df[col]
-            .astype(str)
-            .str.strip()
-            .str.upper()
-            .replace({"NAN": "", "NONE": ""})
-        )
 
-    def inc(code: str) -> str:
-        mois, num = code.split("-")
-        return f"{mois}-{int(num)+1}"
+def _inc(code: str, pas: int = 1) -> str:
+    mois, num = code.split("-")
+    return f"{mois}-{int(num) + pas}"
 
+
+def _fill_numeros_piece_boucle(df: pd.DataFrame) -> None:
     last_code = None
     for i, row in df.iterrows():
         cur = df.at[i, "n° de piece"]
         if row["Compte Généraux"] == "401000":
             if pd.isna(cur) or cur.strip() == "":
-                new_code = "01-01" if last_code is None else inc(last_code)
+                new_code = "01-01" if last_code is None else _inc(last_code)
                 df.at[i, "n° de piece"] = new_code
                 last_code = new_code
             else:
@@ -43,142 +44,437 @@ def run_checks(df: pd.DataFrame) -> Tuple[List[str], List[str], int]:
         else:
             if (pd.isna(cur) or cur.strip() == "") and last_code:
                 df.at[i, "n° de piece"] = last_code
-    logs.append("✅ Les n° de pièce manquants ont été remplis automatiquement.")
+
+
+# Complète la colonne « n° de piece » sans modifier df : chaque ligne 401000 vide reçoit
+# le code de la 401000 précédente incrémenté (« 01-01 » s'il n'y en a pas encore), les
+# autres lignes vides reprennent le dernier code. last_code reprend la numérotation d'un bloc précédent.
+def fill_numeros_piece(df: pd.DataFrame, last_code: Optional[str] = None) -> pd.Series:
+    last_code = last_code or None
+    pieces = df["n° de piece"]
+    texte = pieces.fillna("").astype(str).str.strip().to_numpy(dtype=object)
+    vide = pieces.isna().to_numpy() | (texte == "")
+    is401 = (df["Compte Généraux"].astype(str).str.strip() == "401000").to_numpy()
+
+    resultat = pieces.to_numpy(dtype=object).copy()
+    pos401 = np.flatnonzero(is401)
+    vide401 = vide[pos401]
+    codes401 = texte[pos401].copy()
+
+    # Une 401000 vide au rang k après la dernière 401000 renseignée (l'ancre) vaut ancre + k
+    ancre = np.cumsum(~vide401)
+    rang = pd.Series(vide401.astype(int)).groupby(ancre).cumsum().to_numpy()
+    ancres = np.array([last_code] + list(codes401[~vide401]), dtype=object)
+
+    if vide401.any():
+        a, k = ancre[vide401], rang[vide401]
+        mois = np.full(len(ancres), "01", dtype=object)
+        num = np.zeros(len(ancres), dtype=np.int64)
+        for i in np.unique(a):
+            if ancres[i] is not None:
+                mois[i], n = ancres[i].split("-")
+                num[i] = int(n)
+        nouveaux = pd.Series(mois[a]).str.cat(pd.Series(num[a] + k).astype(str), sep="-").to_numpy(dtype=object)
+        nouveaux[(a == 0) & (last_code is None) & (k == 1)] = "01-01"
+        codes401[vide401] = nouveaux
+        resultat[pos401[vide401]] = nouveaux
+
+    dernier = np.full(len(resultat), None, dtype=object)
+    dernier[pos401] = codes401
+    dernier = pd.Series(dernier).ffill().to_numpy(dtype=object)
+    if last_code:
+        dernier[:pos401[0] if len(pos401) else len(dernier)] = last_code
+    a_remplir = ~is401 & vide & pd.notna(dernier) & (dernier != "")
+    resultat[a_remplir] = dernier[a_remplir]
+
+    return pd.Series(resultat, index=df.index, name="n° de piece")
+
+
+def _check_achat_legacy(df: pd.DataFrame, group: pd.DataFrame, idx: str) -> Tuple[List[str], List[str], bool]:
+    errors, corrections = [], []
+
+    if not (group["Code journal"] == "AC").all():
+        errors.append("Code journal différent de AC")
+    if not group["Date Facture"].astype(str).apply(lambda d: bool(REGEX_DATE_2025.match(d))).all():
+        errors.append("Date Facture hors format JJ/MM/2025")
+    if not REGEX_NUM_PIECE.match(idx):
+        errors.append("Format n° de pièce invalide")
+    if group["Libelle"].nunique() > 1 or group["Concierge"].nunique() > 1:
+        errors.append("Libelle ou Concierge non identiques")
+
+    ligne_401 = group[group["Compte Généraux"] == "401000"]
+    if ligne_401.empty:
+        errors.append("Manque ligne 401000")
+        return errors, corrections, False
+    if len(ligne_401) > 1:
+        errors.append("Plusieurs lignes 401000")
+        return errors, corrections, False
+
+    l401 = ligne_401.iloc[0]
+    idx_401 = l401.name
+    d401, c401 = l401["Débit(€)"], l401["Crédit (€)"]
+
+    autres = group[(group["Compte Généraux"] != "401000") & (group["Code"] != "A")]
+    s_deb, s_cred = autres["Débit(€)"].sum(), autres["Crédit (€)"].sum()
+
+    if d401 == 0 and c401 == 0:
+        if s_cred > 0 and s_deb == 0:
+            df.at[idx_401, "Débit(€)"] = s_cred
+            d401 = s_cred
+            corrections.append(f"Correction automatique : Débit 401000 mis à {s_cred:.2f}")
+        elif s_deb > 0 and s_cred == 0:
+            df.at[idx_401, "Crédit (€)"] = s_deb
+            c401 = s_deb
+            corrections.append(f"Correction automatique : Crédit 401000 mis à {s_deb:.2f}")
+        else:
+            errors.append("Ligne 401000 vide et incohérente")
+
+    facture_ok = d401 == 0 and c401 > 0
+    avoir_ok = c401 == 0 and d401 > 0
+    is_avoir = avoir_ok
+
+    if not (facture_ok or avoir_ok):
+        errors.append("Ligne 401000 : doit être (Débit 0 / Crédit >0) ou (Crédit 0 / Débit >0)")
+
+    if not str(l401["Compte Tiers"]).startswith("401"):
+        errors.append("Ligne 401000 : Compte Tiers invalide (doit commencer par 401)")
+
+    if (group[group["Compte Généraux"] != "401000"]["Compte Tiers"]
+        .fillna("").str.strip().ne("")).any():
+        errors.append("Autres lignes : Compte Tiers doit être vide")
+    if not group[group["Compte Généraux"] != "401000"]["Compte Généraux"].isin(COMPTES_AUTORISES).all():
+        errors.append("Comptes Généraux invalides")
+
+    if facture_ok:
+        if not (autres["Débit(€)"] > 0).all():
+            errors.append("Facture : Débit <= 0 sur lignes de charge")
+        if (autres["Crédit (€)"] != 0).any():
+            errors.append("Facture : Crédit non nul")
+    elif avoir_ok:
+        if not (autres["Crédit (€)"] > 0).all():
+            errors.append("Avoir : Crédit <= 0")
+        if (autres["Débit(€)"] != 0).any():
+            errors.append("Avoir : Débit non nul")
+
+    lignes_G = group[group["Code"] != "A"]
+    if facture_ok and round(lignes_G["Débit(€)"].sum() - c401, 2) != 0:
+        errors.append("Somme Débit ≠ Crédit 401000")
+    if avoir_ok and round(lignes_G["Crédit (€)"].sum() - d401, 2) != 0:
+        errors.append("Somme Crédit ≠ Débit 401000")
+
+    return errors, corrections, is_avoir
+
+
+def _check_achats_boucle(df: pd.DataFrame) -> List[ResultatAchat]:
+    resultats: List[ResultatAchat] = []
+    profil = profilage.profil_actif()
+    for npiece, achat in df.groupby("n° de piece", sort=False):
+        debut = time.perf_counter()
+        err, corr, is_avoir = _check_achat_legacy(df, achat, npiece)
+        err = [JEU_ACHATS.constat(e) for e in err]
+
+        achat_corrige = df.loc[achat.index]
+        mask_vides = (
+            (achat_corrige["Débit(€)"] == 0) &
+            (achat_corrige["Crédit (€)"] == 0) &
+            (achat_corrige["Compte Généraux"] != "401000")
+        )
+        lignes_vides = [
+            (idx, row["Compte Généraux"]) for idx, row in achat_corrige[mask_vides].iterrows()
+        ]
+        resultats.append((npiece, err, corr, is_avoir, lignes_vides))
+        if profil:
+            profil.groupe("controles", npiece, time.perf_counter() - debut, len(achat))
+    return resultats
+
+
+def _contexte_achats(df: pd.DataFrame) -> Contexte:
+    # Colonnes dérivées lues par les règles, calculées une fois pour tout le journal
+    ctx = Contexte(df, "n° de piece")
+    # Montants tels que les voit la boucle historique : sommes par pièce en float, écarts
+    # arrondis au centime à la comparaison (round(somme - 401000, 2)), pas ligne par ligne
+    ctx.debit = df["Débit(€)"].to_numpy(dtype=float)
+    ctx.credit = df["Crédit (€)"].to_numpy(dtype=float)
+    ctx.is401 = (df["Compte Généraux"] == "401000").to_numpy()
+    code_A = (df["Code"] == "A").to_numpy()
+    ctx.autres = ~ctx.is401 & ~code_A
+
+    ctx.nb_401 = ctx.compter(ctx.is401)
+    ctx.une_401 = ctx.nb_401 == 1
+    ctx.pos_401 = ctx.premiere(ctx.is401)
+    d = np.where(ctx.une_401, ctx.debit[ctx.pos_401], 0)
+    c = np.where(ctx.une_401, ctx.credit[ctx.pos_401], 0)
+
+    s_deb = ctx.somme(ctx.debit, ctx.autres)
+    s_cred = ctx.somme(ctx.credit, ctx.autres)
+    ctx.s_deb_G = ctx.somme(ctx.debit, ~code_A)
+    ctx.s_cred_G = ctx.somme(ctx.credit, ~code_A)
+
+    # Ligne 401000 à 0 / 0 : complétée par la somme des lignes de charge si elle est univoque
+    vide = ctx.une_401 & (d == 0) & (c == 0)
+    ctx.corr_debit = vide & (s_cred > 0) & (s_deb == 0)
+    ctx.corr_credit = vide & ~ctx.corr_debit & (s_deb > 0) & (s_cred == 0)
+    ctx.incoherente = vide & ~ctx.corr_debit & ~ctx.corr_credit
+    ctx.d401 = np.where(ctx.corr_debit, s_cred, d)
+    ctx.c401 = np.where(ctx.corr_credit, s_deb, c)
+
+    ctx.facture = ctx.une_401 & (ctx.d401 == 0) & (ctx.c401 > 0)
+    ctx.avoir = ctx.une_401 & (ctx.c401 == 0) & (ctx.d401 > 0)
+    return ctx
+
+
+def _date_hors_format(ctx: Contexte, p: Dict) -> np.ndarray:
+    motif = re.compile(rf"^\d{{2}}/\d{{2}}/{re.escape(str(p['annee']))}$")
+    return ~ctx.par_valeur("Date Facture", lambda v: v.astype(str).map(lambda d: bool(motif.match(d))))
+
+
+def _tiers_401_invalide(ctx: Contexte, p: Dict) -> np.ndarray:
+    tiers = pd.Series(ctx.df["Compte Tiers"].to_numpy(dtype=object)[ctx.pos_401], dtype=object)
+    return ~tiers.astype(str).str.startswith(p["prefixe_tiers"]).to_numpy(dtype=bool)
+
+
+def _tiers_autres_remplis(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ~ctx.is401 & ctx.df["Compte Tiers"].fillna("").str.strip().ne("").to_numpy(dtype=bool)
+
+
+def _une_401(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ctx.une_401
+
+
+def _facture(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ctx.facture
+
+
+def _avoir(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ctx.avoir
+
+
+def _ligne_401(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ctx.pos_401
+
+
+PARAMETRES_ACHATS = {
+    "code_journal": "AC",
+    "annee": 2025,
+    "prefixe_tiers": "401",
+    "comptes_autorises": sorted(COMPTES_AUTORISES),
+}
+
+# Ordre de déclaration = ordre des messages dans les logs d'une pièce
+REGLES_ACHATS = [
+    Regle("AC_JOURNAL", LIGNE, lambda c, p: (c.df["Code journal"] != p["code_journal"]).to_numpy(),
+          "Code journal différent de {code_journal}"),
+    Regle("AC_DATE", LIGNE, _date_hors_format, "Date Facture hors format JJ/MM/{annee}"),
+    Regle("AC_NUM_PIECE", GROUPE, lambda c, p: np.array([not REGEX_NUM_PIECE.match(str(n)) for n in c.groupes], dtype=bool),
+          "Format n° de pièce invalide"),
+    Regle("AC_LIBELLE", GROUPE, lambda c, p: (c.nb_valeurs("Libelle") > 1) | (c.nb_valeurs("Concierge") > 1),
+          "Libelle ou Concierge non identiques"),
+    Regle("AC_401_MANQUANTE", GROUPE, lambda c, p: c.nb_401 == 0, "Manque ligne 401000"),
+    Regle("AC_401_MULTIPLE", GROUPE, lambda c, p: c.nb_401 > 1, "Plusieurs lignes 401000"),
+    # Les règles suivantes supposent une seule ligne 401000
+    Regle("AC_401_VIDE", GROUPE, lambda c, p: c.incoherente, "Ligne 401000 vide et incohérente", cible=_ligne_401),
+    Regle("AC_401_SENS", GROUPE, lambda c, p: ~(c.facture | c.avoir),
+          "Ligne 401000 : doit être (Débit 0 / Crédit >0) ou (Crédit 0 / Débit >0)", si=_une_401,
+          cible=_ligne_401),
+    Regle("AC_401_TIERS", GROUPE, _tiers_401_invalide,
+          "Ligne 401000 : Compte Tiers invalide (doit commencer par {prefixe_tiers})", BLOQUANTE, si=_une_401,
+          cible=_ligne_401),
+    Regle("AC_TIERS_AUTRES", LIGNE, _tiers_autres_remplis, "Autres lignes : Compte Tiers doit être vide", si=_une_401),
+    Regle("AC_COMPTES", LIGNE,
+          lambda c, p: ~c.is401 & ~c.df["Compte Généraux"].isin([str(x) for x in p["comptes_autorises"]]).to_numpy(dtype=bool),
+          "Comptes Généraux invalides", si=_une_401),
+    Regle("AC_FACTURE_DEBIT", LIGNE, lambda c, p: c.autres & ~(c.debit > 0),
+          "Facture : Débit <= 0 sur lignes de charge", si=_facture),
+    Regle("AC_FACTURE_CREDIT", LIGNE, lambda c, p: c.autres & (c.credit != 0), "Facture : Crédit non nul", si=_facture),
+    Regle("AC_AVOIR_CREDIT", LIGNE, lambda c, p: c.autres & ~(c.credit > 0), "Avoir : Crédit <= 0", si=_avoir),
+    Regle("AC_AVOIR_DEBIT", LIGNE, lambda c, p: c.autres & (c.debit != 0), "Avoir : Débit non nul", si=_avoir),
+    Regle("AC_SOMME_DEBIT", GROUPE, lambda c, p: np.round(c.s_deb_G - c.c401, 2) != 0, "Somme Débit ≠ Crédit 401000",
+          si=_facture, cible=_ligne_401),
+    Regle("AC_SOMME_CREDIT", GROUPE, lambda c, p: np.round(c.s_cred_G - c.d401, 2) != 0, "Somme Crédit ≠ Débit 401000",
+          si=_avoir, cible=_ligne_401),
+    # Désactivée par défaut : un même n° de pièce en deux endroits du fichier
+    Regle("AC_PIECE_DISPERSEE", FICHIER,
+          lambda c, p: c.derniere() - c.premiere() + 1 != c.compter(c.valides),
+          "Lignes de la pièce non contiguës dans le fichier", active=False),
+]
+
+JEU_ACHATS = JeuRegles("achats", REGLES_ACHATS, PARAMETRES_ACHATS, REGLES_VERSION)
+
+
+def regles_achats(chemin: Optional[str] = None) -> JeuRegles:
+    # Jeu standard, ajusté par le jeu client (CONTROLE_REGLES) s'il y en a un
+    return jeu_client(JEU_ACHATS, chemin)
+
+
+def _check_achats_vectorise(df: pd.DataFrame, regles: JeuRegles) -> List[ResultatAchat]:
+    ctx = _contexte_achats(df)
+    if ctx.nb == 0:
+        return []
+    evaluation = regles.evaluer(ctx)
+
+    compte = df["Compte Généraux"]
+    vides = (ctx.debit == 0) & (ctx.credit == 0) & ~ctx.is401 & ctx.valides
+    lignes_vides: Dict[int, List[Tuple[int, str]]] = {}
+    for code, idx, cpt in zip(ctx.codes[vides], df.index[vides], compte[vides]):
+        lignes_vides.setdefault(code, []).append((idx, cpt))
+
+    resultats: List[ResultatAchat] = []
+    for g, npiece in enumerate(ctx.groupes):
+        corrections = []
+        if ctx.corr_debit[g]:
+            corrections.append(f"Correction automatique : Débit 401000 mis à {ctx.d401[g]:.2f}")
+        elif ctx.corr_credit[g]:
+            corrections.append(f"Correction automatique : Crédit 401000 mis à {ctx.c401[g]:.2f}")
+        resultats.append((npiece, evaluation.groupes[g], corrections, bool(ctx.avoir[g]), lignes_vides.get(g, [])))
+
+    for col, corr, montants in (("Débit(€)", ctx.corr_debit, ctx.d401), ("Crédit (€)", ctx.corr_credit, ctx.c401)):
+        if corr.any():
+            df.loc[df.index[ctx.pos_401[corr]], col] = montants[corr]
+
+    return resultats
+
+
+def normalize_achats(df: pd.DataFrame) -> None:
+    # Une passe par valeur distincte ; comptes, codes et dates en catégories (cf. schema_journal)
+    for col in COLONNES_TEXTE:
+        df[col] = normaliser_texte(df[col], SCHEMA_ACHATS[col])
 
     mask_445 = (df["Compte Généraux"] == "445660") & (df["Compte Tiers"] == "445660")
     df.loc[mask_445, "Compte Tiers"] = ""
-    logs.append("✅ La colonne Compte Tiers ne comprend plus de 445660 mal placés.")
 
     for col in COLONNES_MONTANTS:
-        df[col] = (
-            df[col]
-            .astype(str)
-            .str.replace(",", ".", regex=False)
-            .str.replace(r"[^\d.]", "", regex=True)
-            .astype(float)
-        )
+        df[col] = parser_montants(df[col])
 
-    def check_achat(group: pd.DataFrame, idx: str) -> Tuple[List[str], List[str], bool]:
-        errors, corrections = [], []
-
-        if not (group["Code journal"] == "AC").all():
-            errors.append("Code journal différent de AC")
-        if not group["Date Facture"].astype(str).apply(lambda d: bool(REGEX_DATE_2025.match(d))).all():
-            errors.append("Date Facture hors format JJ/MM/2025")
-        if not REGEX_NUM_PIECE.match(idx):
-            errors.append("Format n° de pièce invalide")
-        if group["Libelle"].nunique() > 1 or group["Concierge"].nunique() > 1:
-            errors.append("Libelle ou Concierge non identiques")
-
-        ligne_401 = group[group["Compte Généraux"] == "401000"]
-        if ligne_401.empty:
-            errors.append("Manque ligne 401000")
-            return errors, corrections, False
-        if len(ligne_401) > 1:
-            errors.append("Plusieurs lignes 401000")
-            return errors, corrections, False
-
-        l401 = ligne_401.iloc[0]
-        idx_401 = l401.name
-        d401, c401 = l401["Débit(€)"], l401["Crédit (€)"]
-
-        autres = group[(group["Compte Généraux"] != "401000") & (group["Code"] != "A")]
-        s_deb, s_cred = autres["Débit(€)"].sum(), autres["Crédit (€)"].sum()
-
-        if d401 == 0 and c401 == 0:
-            if s_cred > 0 and s_deb == 0:
-                df.at[idx_401, "Débit(€)"] = s_cred
-                d401 = s_cred
-                corrections.append(f"Correction automatique : Débit 401000 mis à {s_cred:.2f}")
-            elif s_deb > 0 and s_cred == 0:
-                df.at[idx_401, "Crédit (€)"] = s_deb
-                c401 = s_deb
-                corrections.append(f"Correction automatique : Crédit 401000 mis à {s_deb:.2f}")
-            else:
-                errors.append("Ligne 401000 vide et incohérente")
-
-        facture_ok = d401 == 0 and c401 > 0
-        avoir_ok = c401 == 0 and d401 > 0
-        is_avoir = avoir_ok
-
-        if not (facture_ok or avoir_ok):
-            errors.append("Ligne 401000 : doit être (Débit 0 / Crédit >0) ou (Crédit 0 / Débit >0)")
-
-        if not str(l401["Compte Tiers"]).startswith("401"):
-            errors.append("Ligne 401000 : Compte Tiers invalide (doit commencer par 401)")
-
-        comptes_autorises = {"604110", "604000", "604900", "445660"}
-        if (group[group["Compte Généraux"] != "401000"]["Compte Tiers"]
-            .fillna("").str.strip().ne("")).any():
-            errors.append("Autres lignes : Compte Tiers doit être vide")
-        if not group[group["Compte Généraux"] != "401000"]["Compte Généraux"].isin(comptes_autorises).all():
-            errors.append("Comptes Généraux invalides")
-
-        if facture_ok:
-            if not (autres["Débit(€)"] > 0).all():
-                errors.append("Facture : Débit <= 0 sur lignes de charge")
-            if (autres["Crédit (€)"] != 0).any():
-                errors.append("Facture : Crédit non nul")
-        elif avoir_ok:
-            if not (autres["Crédit (€)"] > 0).all():
-                errors.append("Avoir : Crédit <= 0")
-            if (autres["Débit(€)"] != 0).any():
-                errors.append("Avoir : Débit non nul")
-
-        lignes_G = group[group["Code"] != "A"]
-        if facture_ok and round(lignes_G["Débit(€)"].sum() - c401, 2) != 0:
-            errors.append("Somme Débit ≠ Crédit 401000")
-        if avoir_ok and round(lignes_G["Crédit (€)"].sum() - d401, 2) != 0:
-            errors.append("Somme Crédit ≠ Débit 401000")
-
-        return errors, corrections, is_avoir
-
-    erreurs_globales = 0
-    for npiece, achat in df.groupby("n° de piece", sort=False):
-        err, corr, is_avoir = check_achat(achat, npiece)
 
-        has_tiers_err = any("COMPTE TIERS INVALIDE" in e.upper() for e in err)
-        statut_ko = has_tiers_err
-        label = "❌" if statut_ko else "✅"
+def prepare_achats(df: pd.DataFrame, vectorized: bool = True, last_code: Optional[str] = None) -> List[str]:
+    # La numérotation ne dépend que des colonnes texte : elle peut suivre la normalisation complète
+    with profilage.etape("normalisation", len(df)):
+        normalize_achats(df)
 
-        logs.append(f"{label} Achat {npiece} : {'KO' if statut_ko else 'OK'}")
+    # Moteur colonnaire par défaut ; vectorized=False garde l'ancienne boucle pièce par pièce
+    with profilage.etape("numerotation", len(df)):
+        if vectorized:
+            df["n° de piece"] = fill_numeros_piece(df, last_code).astype(SCHEMA_ACHATS["n° de piece"])
+        else:
+            _fill_numeros_piece_boucle(df)
+
+    return [
+        "✅ Les n° de pièce manquants ont été remplis automatiquement.",
+        "✅ La colonne Compte Tiers ne comprend plus de 445660 mal placés.",
+    ]
+
+
+def check_pieces_resultats(
+    df: pd.DataFrame,
+    vectorized: bool = True,
+    regles: Optional[JeuRegles] = None,
+    processus: Optional[int] = None,
+) -> List[ResultatAchat]:
+    # vectorized=False : boucle historique pièce par pièce, règles standard uniquement.
+    # processus : contrôle des gros journaux réparti sur plusieurs cœurs (controle_parallele)
+    with profilage.etape("controles", len(df)):
+        if vectorized and processus:
+            from controle_parallele import controler_en_parallele
+
+            resultats = controler_en_parallele("achats", df, regles or regles_achats(), processus)
+        elif vectorized:
+            resultats = _check_achats_vectorise(df, regles or regles_achats())
+        else:
+            resultats = _check_achats_boucle(df)
+    profilage.compter("pieces_controlees", len(resultats))
+    return resultats
 
-        for c in corr:
-            logs.append(f"   🛠️  {c}")
 
-        if is_avoir:
-            logs.append(f"   🔄 Achat {npiece} détecté comme AVOIR")
+def piece_ko(resultat: ResultatAchat) -> bool:
+    # KO dès qu'un constat est bloquant (par défaut : Compte Tiers de la 401000 invalide)
+    return any(c.severite == BLOQUANTE for c in resultat[1])
 
-        for e in err:
-            bullet = "🔻" if "COMPTE TIERS INVALIDE" in e.upper() else "🟢"
-            logs.append(f"   {bullet} {e}")
 
-        achat_corrige = df.loc[achat.index]
-        mask_vides = (
-            (achat_corrige["Débit(€)"] == 0) &
-            (achat_corrige["Crédit (€)"] == 0) &
-            (achat_corrige["Compte Généraux"] != "401000")
+def logs_piece(resultat: ResultatAchat) -> Tuple[List[str], bool, List[int]]:
+    npiece, err, corr, is_avoir, lignes_vides = resultat
+    logs: List[str] = []
+
+    statut_ko = piece_ko(resultat)
+    label = "❌" if statut_ko else "✅"
+
+    logs.append(f"{label} Achat {npiece} : {'KO' if statut_ko else 'OK'}")
+
+    for c in corr:
+        logs.append(f"   🛠️  {c}")
+
+    if is_avoir:
+        logs.append(f"   🔄 Achat {npiece} détecté comme AVOIR")
+
+    for c in err:
+        bullet = "🔻" if c.severite == BLOQUANTE else "🟢"
+        logs.append(f"   {bullet} {c.message}")
+
+    for idx, compte in lignes_vides:
+        logs.append(
+            f"   🗑️  Suppression ligne vide (index {idx}, Compte {compte})"
         )
-        lignes_vides = achat_corrige[mask_vides]
-        if not lignes_vides.empty:
-            for idx, row in lignes_vides.iterrows():
-                logs.append(
-                    f"   🗑️  Suppression ligne vide (index {idx}, Compte {row['Compte Généraux']})"
-                )
-            indices_a_suppr.extend(lignes_vides.index)
-
-        if statut_ko:
-            erreurs_globales += 1
-            achats_ko.append(npiece)
-
-    if indices_a_suppr:
-        df.drop(index=indices_a_suppr, inplace=True)
-        logs.append(f"\n✅ {len(indices_a_suppr)} ligne(s) vide(s) supprimée(s).")
+
+    return logs, statut_ko, [idx for idx, _ in lignes_vides]
+
+
+def check_pieces(
+    df: pd.DataFrame,
+    vectorized: bool = True,
+    regles: Optional[JeuRegles] = None,
+    processus: Optional[int] = None,
+) -> Tuple[List[str], List[str], List[int]]:
+    logs: List[str] = []
+    achats_ko: List[str] = []
+    indices_a_suppr: List[int] = []
+
+    resultats = check_pieces_resultats(df, vectorized, regles, processus)
+    with profilage.etape("logs"):
+        for resultat in resultats:
+            lignes, statut_ko, indices = logs_piece(resultat)
+            logs.extend(lignes)
+            indices_a_suppr.extend(indices)
+            if statut_ko:
+                achats_ko.append(resultat[0])
+
+    return logs, achats_ko, indices_a_suppr
+
+
+def summary_logs(nb_supprimees: int, erreurs_globales: int) -> List[str]:
+    logs: List[str] = []
+    if nb_supprimees:
+        logs.append(f"\n✅ {nb_supprimees} ligne(s) vide(s) supprimée(s).")
 
     if erreurs_globales:
         logs.append(f"\n📋 Contrôle terminé : {erreurs_globales} achat(s) non conforme(s).")
     else:
         logs.append("\n📋 Contrôle terminé : toutes les écritures sont conformes ✅")
+    return logs
+
+
+def run_checks(
+    df: pd.DataFrame,
+    vectorized: bool = True,
+    regles: Optional[JeuRegles] = None,
+    processus: Optional[int] = None,
+    index=None,
+    source: Optional[str] = None,
+) -> Tuple[List[str], List[str], int]:
+    # index : IndexHistorique des pièces des fichiers précédents (doublons, trous de
+    # numérotation) ; source : nom du fichier sous lequel enregistrer ses pièces validées
+    with profilage.etape("run_checks", len(df)):
+        logs = prepare_achats(df, vectorized)
+
+        logs_pieces, achats_ko, indices_a_suppr = check_pieces(df, vectorized, regles, processus)
+        logs.extend(logs_pieces)
+
+        if indices_a_suppr:
+            df.drop(index=indices_a_suppr, inplace=True)
+
+        if index is not None:
+            from index_historique import controler_historique
 
-    return logs, achats_ko, erreurs_globales
+            with profilage.etape("historique", len(df)):
+                logs.extend(controler_historique(index, "achats", df, source, achats_ko))
 
+        logs.extend(summary_logs(len(indices_a_suppr), len(achats_ko)))
+    return logs, achats_ko, len(achats_ko)
@@ -0,0 +1,316 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from controle_parallele import partitionner
+from controle_streaming import iter_blocs_excel, run_checks_streaming
+from export_fichiers import ecrire_xlsx_blocs
+from index_historique import (
+    VARIABLE_INDEX, IndexHistorique, controler_resume, index_actif, resume_groupes, source_fichier,
+)
+from lecture_excel import lire_excel
+from regles import VARIABLE_REGLES
+
+# Contrôle en lot, sans Streamlit : chaque classeur est contrôlé dans un pool de processus,
+# et les gros classeurs sont découpés en partitions de pièces / factures complètes réparties
+# sur plusieurs processus. Pour chaque fichier on écrit le classeur corrigé et un rapport JSON.
+#
+#   python controle_batch.py exports/*.xlsx clients/ --sortie resultats --workers 8
+#   python controle_batch.py exports/ --regles client_x.json
+#   python controle_batch.py exports/ --index historique.sqlite
+#   python controle_batch.py exports/ --streaming
+#
+# Avec --streaming, chaque classeur est lu et contrôlé bloc par bloc (cf. controle_streaming) :
+# la mémoire d'un processus reste bornée quelle que soit la taille du fichier, les logs sont
+# écrits au fil de l'eau dans <fichier>_logs.txt et le rapport JSON n'en garde que le chemin.
+#
+# Avec --index, chaque fichier est comparé aux pièces / factures des fichiers déjà contrôlés
+# (doublons, trous de numérotation, cf. index_historique) puis y est enregistré. Les
+# processus ne renvoient qu'un résumé par pièce / facture : consultation et enregistrement
+# se font un fichier à la fois dans le processus principal, pour que deux fichiers d'un
+# même lot portant les mêmes pièces se voient l'un l'autre.
+
+SEUIL_DECOUPAGE = 200_000  # lignes
+TAILLE_PARTITION = 50_000  # lignes
+CLES = {"achats": "n° de piece", "ventes": "Numéro de facture"}
+
+
+def lister_fichiers(entrees: List[str]) -> List[str]:
+    fichiers: List[str] = []
+    for entree in entrees:
+        if os.path.isdir(entree):
+            candidats = glob.glob(os.path.join(entree, "**", "*.xlsx"), recursive=True)
+        else:
+            candidats = glob.glob(entree, recursive=True)
+        fichiers.extend(sorted(c for c in candidats if not os.path.basename(c).startswith("~$")))
+    return list(dict.fromkeys(fichiers))
+
+
+def detecter_journal(df: pd.DataFrame) -> str:
+    if set(achats.COLONNES_TEXTE + achats.COLONNES_MONTANTS) <= set(df.columns):
+        return "achats"
+    # prepare_ventes renomme les colonnes par position : en-têtes attendus, dans l'ordre
+    if [str(c).strip() for c in df.columns] == ventes.COLONNES_VENTES:
+        return "ventes"
+    raise ValueError(f"Journal non reconnu (colonnes : {list(df.columns)}) ; --journal pour le forcer")
+
+
+def _controler_partie(journal: str, partie: pd.DataFrame) -> Tuple[List[str], List[str], List[int], pd.DataFrame]:
+    partie = partie.copy()
+    if journal == "achats":
+        logs, ko, indices = achats.check_pieces(partie)
+        return logs, ko, indices, partie.drop(index=indices)
+    logs, ko = ventes.check_factures(partie)
+    return logs, ko, [], partie
+
+
+def _preparer(chemin: str, journal: Optional[str], header_row: int) -> Tuple[str, pd.DataFrame, List[str]]:
+    df = lire_excel(chemin, header_row)
+    journal = journal or detecter_journal(df)
+    if journal == "achats":
+        logs = achats.prepare_achats(df)
+    else:
+        df = ventes.prepare_ventes(df)
+        logs = ventes.convert_currencies(df)
+    return journal, df, logs
+
+
+def _assembler(
+    journal: str,
+    df: pd.DataFrame,
+    entete: List[str],
+    parties: List[Tuple[List[str], List[str], List[int], pd.DataFrame]],
+) -> Tuple[List[str], List[str], List[str], pd.DataFrame]:
+    # logs, pied (synthèse, écrite après les logs de l'historique), KO, tableau corrigé
+    logs = list(entete)
+    ko: List[str] = []
+    nb_supprimees = 0
+    for logs_partie, ko_partie, indices, _ in parties:
+        logs.extend(logs_partie)
+        ko.extend(ko_partie)
+        nb_supprimees += len(indices)
+
+    corrige = pd.concat([p[3] for p in parties]) if parties else df.iloc[:0]
+    corrige = corrige.loc[df.index[df.index.isin(corrige.index)]]
+
+    pied: List[str] = []
+    if journal == "achats":
+        pied.extend(achats.summary_logs(nb_supprimees, len(ko)))
+        if not ko and "Concierge" in corrige.columns:
+            corrige = corrige.drop(columns=["Concierge"])
+            pied.append("✅ Colonne Concierge supprimée avant export.")
+    else:
+        pied.extend(ventes.summary_logs(ko, "Concierge" in corrige.columns))
+        if not ko and "Concierge" in corrige.columns:
+            corrige = corrige.drop(columns=["Concierge"])
+    return logs, pied, ko, corrige
+
+
+def _base(chemin: str, sortie: str) -> str:
+    return os.path.join(sortie, os.path.splitext(os.path.basename(chemin))[0])
+
+
+def _ecrire(chemin: str, sortie: str, journal: str, logs: List[str], pied: List[str], ko: List[str],
+            corrige: pd.DataFrame, nb_lignes: int, duree: float) -> Dict:
+    # Écrit le classeur corrigé ; le rapport JSON est écrit par _publier, dans le processus
+    # principal, une fois l'historique consulté
+    os.makedirs(sortie, exist_ok=True)
+    base = _base(chemin, sortie)
+    ecrire_xlsx_blocs([corrige], f"{base}_corrige.xlsx")
+    return {
+        "fichier": chemin,
+        "journal": journal,
+        "lignes": nb_lignes,
+        "nb_ko": len(ko),
+        "ko": [str(k) for k in ko],
+        "duree_s": round(duree, 3),
+        "sortie": f"{base}_corrige.xlsx",
+        "logs": logs,
+        "pied": pied,
+        # Une ligne par pièce / facture (cf. index_historique), seulement avec --index
+        "resume": resume_groupes(journal, corrige) if os.environ.get(VARIABLE_INDEX) else None,
+    }
+
+
+def _publier(rapport: Dict, sortie: str, index: Optional[IndexHistorique]) -> Dict:
+    # Un fichier à la fois, dans le processus principal : chaque fichier est comparé à
+    # l'historique et aux fichiers du lot déjà publiés, puis y est enregistré
+    logs, pied, resume = rapport.pop("logs"), rapport.pop("pied"), rapport.pop("resume")
+    if index is not None and resume is not None:
+        # Même source que dans les pages : nom du fichier et empreinte du contenu
+        with open(rapport["fichier"], "rb") as f:
+            source = source_fichier(rapport["fichier"], f.read())
+        logs = logs + controler_resume(index, rapport["journal"], resume, source, rapport["ko"])
+    with open(f"{_base(rapport['fichier'], sortie)}_rapport.json", "w", encoding="utf-8") as f:
+        json.dump(dict(rapport, logs=logs + pied), f, ensure_ascii=False, indent=2)
+    return rapport
+
+
+def _traiter_fichier(chemin: str, sortie: str, journal: Optional[str], header_row: int) -> Dict:
+    debut = time.perf_counter()
+    journal, df, entete = _preparer(chemin, journal, header_row)
+    partie = _controler_partie(journal, df)
+    logs, pied, ko, corrige = _assembler(journal, df, entete, [partie])
+    return _ecrire(chemin, sortie, journal, logs, pied, ko, corrige, len(df), time.perf_counter() - debut)
+
+
+def _traiter_fichier_streaming(chemin: str, sortie: str, journal: Optional[str], header_row: int) -> Dict:
+    debut = time.perf_counter()
+    # Type de journal d'après l'en-tête et la première ligne, sans lire tout le classeur
+    journal = journal or detecter_journal(next(iter(iter_blocs_excel(chemin, header_row, 1)), pd.DataFrame()))
+    os.makedirs(sortie, exist_ok=True)
+    base = _base(chemin, sortie)
+    ko, nb_lignes = run_checks_streaming(chemin, f"{base}_corrige.xlsx", journal, f"{base}_logs.txt", header_row)
+    return {
+        "fichier": chemin,
+        "journal": journal,
+        "lignes": nb_lignes,
+        "nb_ko": len(ko),
+        "ko": [str(k) for k in ko],
+        "duree_s": round(time.perf_counter() - debut, 3),
+        "sortie": f"{base}_corrige.xlsx",
+        "fichier_logs": f"{base}_logs.txt",
+        "logs": [],
+        "pied": [],
+        "resume": None,
+    }
+
+
+def _estimer_lignes(chemin: str) -> int:
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(chemin, read_only=True)
+        try:
+            return wb.active.max_row or 0
+        finally:
+            wb.close()
+    except Exception:
+        return 0
+
+
+def run_batch(
+    fichiers: List[str],
+    sortie: str,
+    journal: Optional[str] = None,
+    workers: Optional[int] = None,
+    header_row: int = 1,
+    seuil_decoupage: int = SEUIL_DECOUPAGE,
+    taille_partition: int = TAILLE_PARTITION,
+    streaming: bool = False,
+) -> List[Dict]:
+    # streaming : chaque fichier contrôlé bloc par bloc dans un processus, sans découpage
+    rapports: List[Dict] = []
+    # Les gros fichiers sont d'abord lus et préparés (numérotation, devises) dans un
+    # processus, puis leurs partitions sont contrôlées en parallèle.
+    # Une règle de portée fichier doit voir tout le fichier : pas de découpage
+    decoupage = not (achats.regles_achats().portee_fichier() or ventes.regles_ventes().portee_fichier())
+    gros = {f for f in fichiers if decoupage and not streaming and _estimer_lignes(f) >= seuil_decoupage}
+    traiter = _traiter_fichier_streaming if streaming else _traiter_fichier
+
+    index = index_actif()
+    debuts = {f: time.perf_counter() for f in fichiers}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        en_cours = {}
+        for f in fichiers:
+            if f in gros:
+                en_cours[pool.submit(_preparer, f, journal, header_row)] = ("preparation", f, None)
+            else:
+                en_cours[pool.submit(traiter, f, sortie, journal, header_row)] = ("fichier", f, None)
+
+        preparations: Dict[str, Tuple[str, pd.DataFrame, List[str]]] = {}
+        parties: Dict[str, List] = {}
+
+        while en_cours:
+            termines, _ = wait(en_cours, return_when=FIRST_COMPLETED)
+            for future in termines:
+                etape, f, num = en_cours.pop(future)
+                try:
+                    resultat = future.result()
+                except Exception as e:
+                    rapports.append({"fichier": f, "erreur": str(e)})
+                    print(f"❌ {f} : {e}", file=sys.stderr)
+                    continue
+
+                if etape == "fichier":
+                    rapports.append(_publier(resultat, sortie, index))
+                elif etape == "preparation":
+                    journal_f, df, _ = preparations[f] = resultat
+                    morceaux = partitionner(df, CLES[journal_f], taille_partition)
+                    parties[f] = [None] * len(morceaux)
+                    for i, morceau in enumerate(morceaux):
+                        en_cours[pool.submit(_controler_partie, journal_f, morceau)] = ("partie", f, i)
+                    if not morceaux:
+                        en_cours[pool.submit(_controler_partie, journal_f, df)] = ("partie", f, 0)
+                        parties[f] = [None]
+                else:
+                    parties[f][num] = resultat
+                    if all(p is not None for p in parties[f]):
+                        journal_f, df, entete = preparations.pop(f)
+                        logs, pied, ko, corrige = _assembler(journal_f, df, entete, parties.pop(f))
+                        rapport = _ecrire(f, sortie, journal_f, logs, pied, ko, corrige, len(df),
+                                          time.perf_counter() - debuts[f])
+                        rapports.append(_publier(rapport, sortie, index))
+    return rapports
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Contrôle en lot des journaux d'achats et de ventes.")
+    parser.add_argument("entrees", nargs="+", help="Fichiers, dossiers ou motifs glob (*.xlsx)")
+    parser.add_argument("--sortie", default="resultats", help="Dossier des classeurs corrigés et rapports JSON")
+    parser.add_argument("--journal", choices=["achats", "ventes"], help="Forcer le type de journal (détecté sinon)")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus (défaut : nb de cœurs)")
+    parser.add_argument("--header-row", type=int, default=1, help="Ligne d'en-tête (0 = première ligne)")
+    parser.add_argument("--seuil-decoupage", type=int, default=SEUIL_DECOUPAGE)
+    parser.add_argument("--taille-partition", type=int, default=TAILLE_PARTITION)
+    parser.add_argument("--regles", help="Jeu de règles client (JSON, cf. regles.py)")
+    parser.add_argument("--index", help="Index SQLite des fichiers déjà contrôlés (cf. index_historique.py)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Lecture et contrôle bloc par bloc, mémoire bornée (cf. controle_streaming.py)")
+    args = parser.parse_args(argv)
+    if args.streaming and args.index:
+        # L'index a besoin du tableau complet (une ligne par pièce / facture contrôlée)
+        parser.error("--streaming et --index ne peuvent pas être combinés")
+
+    if args.regles:
+        # Transmis aux processus du pool par l'environnement ; validé ici une fois
+        os.environ[VARIABLE_REGLES] = os.path.abspath(args.regles)
+        achats.regles_achats()
+        ventes.regles_ventes()
+    if args.index:
+        os.environ[VARIABLE_INDEX] = os.path.abspath(args.index)
+
+    fichiers = lister_fichiers(args.entrees)
+    if not fichiers:
+        print("Aucun fichier .xlsx trouvé.", file=sys.stderr)
+        return 1
+
+    debut = time.perf_counter()
+    rapports = run_batch(
+        fichiers, args.sortie, args.journal, args.workers, args.header_row,
+        args.seuil_decoupage, args.taille_partition, args.streaming,
+    )
+    duree = time.perf_counter() - debut
+
+    ok = [r for r in rapports if "erreur" not in r]
+    lignes = sum(r["lignes"] for r in ok)
+    for r in sorted(ok, key=lambda r: r["fichier"]):
+        print(f"{'❌' if r['nb_ko'] else '✅'} {r['fichier']} ({r['journal']}) : {r['lignes']} lignes, {r['nb_ko']} KO")
+    print(
+        f"\n📋 {len(ok)}/{len(fichiers)} fichier(s), {lignes} lignes en {duree:.2f}s "
+        f"— {lignes / duree:,.0f} lignes/s, {len(ok) / duree:.2f} fichiers/s"
+    )
+    return 0 if len(ok) == len(fichiers) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import atexit
+import math
+import multiprocessing
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+import profilage
+from regles import JeuRegles
+
+# Contrôle d'un gros journal sur plusieurs cœurs : le tableau préparé (numérotation,
+# devises) est découpé en partitions de pièces / factures complètes, chaque partition est
+# contrôlée dans un processus, puis les résultats sont remis dans l'ordre du fichier. Le
+# résultat est celui du contrôle en un seul processus.
+#
+#   run_checks(df, processus=16)
+#   run_ventes_checks_console(df, processus=16)
+#
+# Les partitions voyagent en flux Arrow IPC (pas de pickle des colonnes objet, coûteux en
+# ventes), réduites en ventes aux colonnes lues par les règles ; seuls reviennent les
+# résultats par groupe et, en achats, les montants corrigés. Le jeu de règles est transmis
+# par sa configuration et reconstruit dans le processus à partir du catalogue du journal.
+# Avec une règle de portée fichier active, ou sous SEUIL_PARALLELE lignes, le contrôle
+# reste dans le processus courant.
+
+SEUIL_PARALLELE = 100_000  # lignes
+TAILLE_MIN_PARTITION = 20_000  # lignes
+PARTITIONS_PAR_PROCESSUS = 2  # équilibre la charge quand les pièces n'ont pas la même taille
+
+CLES = {"achats": "n° de piece", "ventes": "Numéro de facture"}
+
+
+def partitionner(df: pd.DataFrame, cle: str, taille: int) -> List[pd.DataFrame]:
+    # Les groupes sont répartis dans l'ordre de leur première apparition : en concaténant
+    # les résultats des partitions on retrouve l'ordre du contrôle en une fois. Les lignes
+    # sans clé, hors de tout groupe, vont dans la première partition.
+    codes, groupes = pd.factorize(df[cle], sort=False)
+    if not len(codes):
+        return []
+    lignes_par_groupe = np.bincount(codes[codes >= 0], minlength=len(groupes))
+    partition_du_groupe = (lignes_par_groupe.cumsum() - 1) // taille
+    partition = np.where(codes >= 0, partition_du_groupe[np.maximum(codes, 0)], 0)
+    return [df[partition == p] for p in pd.unique(partition)]
+
+
+# -- transfert des partitions --------------------------------------------------------------
+
+def _serialiser(df: pd.DataFrame) -> Tuple[str, bytes, Dict, List[str]]:
+    # Arrow rend les manquants des colonnes objet en None : on note les colonnes où ils
+    # étaient NaN pour les restituer à l'identique (messages « valeur : nan »). Une colonne
+    # mêlant NaN, None ou NaT, ou des types qu'Arrow refuse, passe par pickle.
+    import pyarrow as pa
+
+    colonnes_nan = []
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        manquants = df[col].to_numpy()[df[col].isna().to_numpy()]
+        if not len(manquants):
+            continue
+        if all(isinstance(v, float) for v in manquants):
+            colonnes_nan.append(col)
+        elif not all(v is None for v in manquants):
+            return "pickle", pickle.dumps(df, protocol=5), {}, []
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return "pickle", pickle.dumps(df, protocol=5), {}, []
+    sortie = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sortie, table.schema) as flux:
+        flux.write_table(table)
+    return "arrow", sortie.getvalue().to_pybytes(), dict(df.dtypes), colonnes_nan
+
+
+def _deserialiser(fmt: str, donnees: bytes, dtypes: Dict, colonnes_nan: List[str]) -> pd.DataFrame:
+    if fmt == "pickle":
+        return pickle.loads(donnees)
+    import pyarrow as pa
+
+    # Chaînes Arrow relues directement en string[pyarrow] si le tableau d'origine en avait
+    # (cf. schema_journal), sinon en objets Python
+    texte = pd.StringDtype("pyarrow")
+    types_mapper = {pa.string(): texte, pa.large_string(): texte}.get if texte in dtypes.values() else None
+    df = pa.ipc.open_stream(donnees).read_all().to_pandas(types_mapper=types_mapper)
+    for col, dtype in dtypes.items():
+        if df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+    for col in colonnes_nan:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+# -- côté processus ------------------------------------------------------------------------
+
+def _controler_partition(journal: str, partition: Tuple, config: Dict, nom: str):
+    df = _deserialiser(*partition)
+    if journal == "achats":
+        regles = achats.JEU_ACHATS.configurer(config, nom)
+        avant = df[achats.COLONNES_MONTANTS].copy()
+        resultats = achats.check_pieces_resultats(df, True, regles)
+        # Montants des lignes 401000 complétées par la correction automatique
+        corrections = {}
+        for col in achats.COLONNES_MONTANTS:
+            modifie = (df[col] != avant[col]) & ~(df[col].isna() & avant[col].isna())
+            if modifie.any():
+                corrections[col] = (df.index[modifie.to_numpy()], df.loc[modifie, col].to_numpy())
+        return resultats, corrections
+    regles = ventes.JEU_VENTES.configurer(config, nom)
+    return ventes.check_factures_resultats(df, True, regles), {}
+
+
+# -- côté appelant -------------------------------------------------------------------------
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_verrou = threading.Lock()
+
+
+def _pool(processus: int) -> ProcessPoolExecutor:
+    # Un pool par nombre de processus, gardé d'un contrôle à l'autre (démarrer les
+    # processus et importer pandas coûte plus qu'un contrôle de partition). forkserver
+    # plutôt que fork : les pages Streamlit tournent dans des threads.
+    with _verrou:
+        if processus not in _pools:
+            methode = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            contexte = multiprocessing.get_context(methode)
+            if methode == "forkserver":
+                contexte.set_forkserver_preload([__name__])
+            _pools[processus] = ProcessPoolExecutor(max_workers=processus, mp_context=contexte)
+        return _pools[processus]
+
+
+@atexit.register
+def _fermer_pools() -> None:
+    with _verrou:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+def taille_partition(nb_lignes: int, processus: int) -> int:
+    return max(TAILLE_MIN_PARTITION, math.ceil(nb_lignes / (processus * PARTITIONS_PAR_PROCESSUS)))
+
+
+def controler_en_parallele(journal: str, df: pd.DataFrame, regles: JeuRegles, processus: int) -> List:
+    # Même résultat que check_pieces_resultats / check_factures_resultats ; en achats, les
+    # corrections automatiques sont appliquées à df comme dans le contrôle séquentiel.
+    sequentiel = achats._check_achats_vectorise if journal == "achats" else ventes._check_factures_vectorise
+    if processus <= 1 or len(df) < SEUIL_PARALLELE or regles.portee_fichier():
+        return sequentiel(df, regles)
+
+    colonnes = ventes.COLONNES_REGLES_VENTES if journal == "ventes" else list(df.columns)
+    partitions = partitionner(df[colonnes], CLES[journal], taille_partition(len(df), processus))
+    if len(partitions) <= 1:
+        return sequentiel(df, regles)
+
+    pool = _pool(processus)
+    with profilage.etape("envoi_partitions", len(df)):
+        futures = [
+            pool.submit(_controler_partition, journal, _serialiser(p), regles.config(), regles.nom)
+            for p in partitions
+        ]
+    profilage.compter("partitions", len(partitions))
+
+    resultats: List = []
+    for future in futures:
+        resultats_partition, corrections = future.result()
+        resultats.extend(resultats_partition)
+        for col, (index, valeurs) in corrections.items():
+            df.loc[index, col] = valeurs
+    return resultats
@@ -0,0 +1,191 @@
+import os
+import tempfile
+from typing import IO, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from export_fichiers import ecrire_xlsx_blocs
+
+# Mode streaming : le classeur est lu ligne à ligne (openpyxl read-only), découpé en blocs
+# sur les frontières de pièce / facture, et chaque bloc est contrôlé puis écrit avant de
+# lire le suivant. La mémoire reste bornée par la taille d'un bloc.
+#
+# Différences avec le contrôle en une fois :
+# - une pièce / facture doit occuper des lignes contiguës (le groupby classique regroupe
+#   aussi des lignes éloignées) ;
+# - les lignes entièrement vides sont ignorées ;
+# - les règles de portée fichier (cf. regles) ne voient que le bloc courant ;
+# - en ventes, les logs de conversion sont écrits bloc par bloc, juste avant les logs des
+#   factures du bloc.
+
+TAILLE_BLOC = 50_000
+CLES = {"achats": "n° de piece", "ventes": "Numéro de facture"}
+
+
+def _valeur_cellule(v):
+    # Même conversion que pandas.read_excel : les flottants entiers redeviennent des entiers
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def iter_blocs_excel(
+    source: Union[str, IO[bytes]],
+    header_row: int = 1,
+    taille_bloc: int = TAILLE_BLOC,
+) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        lignes = wb.active.iter_rows(min_row=header_row + 1, values_only=True)
+        entete = list(next(lignes, ()))
+        while entete and entete[-1] is None:
+            entete.pop()
+        colonnes = [c if c is not None else f"Unnamed: {i}" for i, c in enumerate(entete)]
+
+        # L'index suit le numéro de ligne de données, comme le RangeIndex de read_excel
+        bloc, index, position = [], [], 0
+        for valeurs in lignes:
+            valeurs = valeurs[:len(colonnes)]
+            if any(v is not None for v in valeurs):
+                bloc.append([_valeur_cellule(v) for v in valeurs] + [None] * (len(colonnes) - len(valeurs)))
+                index.append(position)
+            position += 1
+            if len(bloc) >= taille_bloc:
+                yield pd.DataFrame(bloc, columns=colonnes, index=index)
+                bloc, index = [], []
+        if bloc:
+            yield pd.DataFrame(bloc, columns=colonnes, index=index)
+    finally:
+        wb.close()
+
+
+def _couper(df: pd.DataFrame, cle: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # Sépare le dernier groupe, peut-être incomplet, du reste du bloc
+    valeurs = df[cle].to_numpy()
+    changements = (valeurs[1:] != valeurs[:-1]).nonzero()[0]
+    if not len(changements):
+        return df.iloc[:0], df
+    coupe = changements[-1] + 1
+    return df.iloc[:coupe], df.iloc[coupe:]
+
+
+class _Sortie:
+    # Les blocs contrôlés sont stockés sur disque ; l'export final les relit un par un,
+    # une fois connue la décision de supprimer la colonne Concierge.
+    def __init__(self, chemin_logs: Optional[str]):
+        self.dossier = tempfile.TemporaryDirectory(prefix="controle_streaming_")
+        self.blocs: List[str] = []
+        self.logs = open(chemin_logs, "w", encoding="utf-8") if chemin_logs else None
+
+    def log(self, lignes: List[str]) -> None:
+        if self.logs and lignes:
+            self.logs.write("\n".join(lignes) + "\n")
+            self.logs.flush()
+
+    def bloc(self, df: pd.DataFrame) -> None:
+        chemin = os.path.join(self.dossier.name, f"bloc_{len(self.blocs):05d}.pkl")
+        df.to_pickle(chemin)
+        self.blocs.append(chemin)
+
+    def iter_blocs(self) -> Iterator[pd.DataFrame]:
+        for chemin in self.blocs:
+            yield pd.read_pickle(chemin)
+
+    def fermer(self) -> None:
+        if self.logs:
+            self.logs.close()
+        self.dossier.cleanup()
+
+
+def _ecrire_sortie(blocs: Iterator[pd.DataFrame], chemin: str, sans_concierge: bool) -> None:
+    premier = True
+    if chemin.lower().endswith(".csv"):
+        for df in blocs:
+            if sans_concierge:
+                df = df.drop(columns=["Concierge"], errors="ignore")
+            df.to_csv(chemin, mode="w" if premier else "a", header=premier, index=False)
+            premier = False
+        return
+
+    if sans_concierge:
+        blocs = (df.drop(columns=["Concierge"], errors="ignore") for df in blocs)
+    ecrire_xlsx_blocs(blocs, chemin)
+
+
+# Contrôle un classeur bloc par bloc, écrit le fichier corrigé (xlsx ou csv) et les logs.
+# Renvoie la liste des pièces / factures KO et le nombre de lignes lues.
+def run_checks_streaming(
+    source: Union[str, IO[bytes]],
+    sortie: str,
+    journal: str = "achats",
+    chemin_logs: Optional[str] = None,
+    header_row: int = 1,
+    taille_bloc: int = TAILLE_BLOC,
+    provider=None,
+    cache=None,
+) -> Tuple[List[str], int]:
+    if journal not in CLES:
+        raise ValueError(f"Journal inconnu : {journal} (attendu : achats ou ventes)")
+    cle = CLES[journal]
+
+    out = _Sortie(chemin_logs)
+    ko: List[str] = []
+    nb_lignes = nb_supprimees = 0
+    last_code = None
+    en_attente: Optional[pd.DataFrame] = None
+
+    def controler(df: pd.DataFrame) -> None:
+        nonlocal nb_supprimees
+        if df.empty:
+            return
+        df = df.copy()
+        if journal == "achats":
+            logs, ko_bloc, indices = achats.check_pieces(df)
+            df = df.drop(index=indices)
+            nb_supprimees += len(indices)
+        else:
+            logs = ventes.convert_currencies(df, provider, cache)
+            logs_factures, ko_bloc = ventes.check_factures(df)
+            logs.extend(logs_factures)
+        out.log(logs)
+        ko.extend(ko_bloc)
+        out.bloc(df)
+
+    try:
+        for i, bloc in enumerate(iter_blocs_excel(source, header_row, taille_bloc)):
+            nb_lignes += len(bloc)
+            if journal == "achats":
+                logs = achats.prepare_achats(bloc, last_code=last_code)
+                lignes_401 = bloc.loc[bloc["Compte Généraux"] == "401000", "n° de piece"]
+                if len(lignes_401):
+                    last_code = lignes_401.iloc[-1]
+                if i == 0:
+                    out.log(logs)
+            else:
+                bloc = ventes.prepare_ventes(bloc)
+
+            en_attente = bloc if en_attente is None else pd.concat([en_attente, bloc])
+            if len(en_attente) >= taille_bloc:
+                pret, en_attente = _couper(en_attente, cle)
+                controler(pret)
+
+        if en_attente is not None:
+            controler(en_attente)
+
+        sans_concierge = not ko
+        if journal == "achats":
+            out.log(achats.summary_logs(nb_supprimees, len(ko)))
+            if sans_concierge:
+                out.log(["✅ Colonne Concierge supprimée avant export."])
+        else:
+            out.log(ventes.summary_logs(ko, has_concierge=True))
+
+        _ecrire_sortie(out.iter_blocs(), sortie, sans_concierge)
+    finally:
+        out.fermer()
+
+    return ko, nb_lignes
@@ -1,46 +1,140 @@
 import streamlit as st
-import pandas as pd
-from io import BytesIO, StringIO
 import sys
-from controle_ventes_logic import run_ventes_checks_console
-
-
-def safe_read_excel(uploaded, header_row: int = 2) -> pd.DataFrame:
-    try:
-        return pd.read_excel(uploaded, header=header_row, engine="openpyxl")
-    except Exception as err:
-        st.warning(f"openpyxl a échoué ; utilisation de xlsx2csv → {err}")
-        from xlsx2csv import Xlsx2csv
-        uploaded.seek(0)
-        csv_buffer = StringIO()
-        Xlsx2csv(BytesIO(uploaded.read()), outputencoding="utf-8", startrow=header_row + 1).convert(csv_buffer)
-        csv_buffer.seek(0)
-        return pd.read_csv(csv_buffer, header=0)
-
-
-def dataframe_to_excel_bytes(df: pd.DataFrame) -> BytesIO:
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False)
-    buf.seek(0)
-    return buf
+from io import BytesIO
+from typing import TYPE_CHECKING, Callable, Optional
+from profilage import Profil, afficher_performance, etape
+from ressources_streamlit import cache_taux, index_fichiers, prechauffer, service_controles, suivre_travail
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from cache_controles import ResultatControle
+
+# Comme controle_achats : pas d'effet de bord à l'import, modules de contrôle importés une
+# fois un fichier choisi, lecture et contrôle suivis dans le service de contrôle.
+
+ETAPES = ["normalisation", "devises", "controles"]
+
+
+def _read_excel(uploaded, header_row: int = 2, avertir: Callable[[str], None] = st.warning) -> "pd.DataFrame":
+    # Même lecteur que les achats : header_row au sens de read_excel quel que soit le moteur
+    from lecture_excel import lire_excel
+
+    return lire_excel(uploaded, header_row, avertir=avertir)
+
+
+def _safe_read_excel(uploaded, header_row: int = 2, avertir: Callable[[str], None] = st.warning) -> "pd.DataFrame":
+    from cache_lecture import get_parse_cache
+    from lecture_excel import parametres_cache
+
+    return get_parse_cache().read(
+        uploaded,
+        lambda: _read_excel(uploaded, header_row, avertir),
+        lecteur="ventes",
+        header_row=header_row,
+        **parametres_cache(uploaded),
+    )
+
+
+def safe_read_excel(uploaded, header_row: int = 2, avertir: Callable[[str], None] = st.warning) -> "pd.DataFrame":
+    with etape("lecture") as mesure:
+        df = _safe_read_excel(uploaded, header_row, avertir)
+        if mesure:
+            mesure.lignes = len(df)
+    return df
+
+
+def _controler(uploaded) -> Optional["ResultatControle"]:
+    # Comme controle_achats._controler ; None tant que le travail n'est pas terminé
+    from cache_controles import fingerprint, get_check_cache
+    from controle_ventes_logic import regles_ventes
+
+    service = service_controles()
+    travail = service.travail(st.session_state.get("travail_ventes"))
+    if travail is None:
+        contenu = BytesIO(uploaded.getvalue())
+        df_source = st.session_state.get("df_source_ventes")
+        validateur = st.session_state.validateur_ventes
+
+        def controler(travail):
+            source = df_source if df_source is not None else safe_read_excel(contenu, 1, travail.avertir)
+            empreinte = fingerprint(source, "ventes", regles_ventes().signature())
+            cache = get_check_cache()
+            resultat = cache.get(empreinte)
+            if resultat is None:
+                # Après « Valider les corrections », seules les factures modifiées sont recontrôlées
+                resultat = cache.put(empreinte, validateur.validate(source.copy()))
+            return source, empreinte, resultat
+
+        etapes = ETAPES if df_source is not None else ["lecture"] + ETAPES
+        # Pics mémoire par étape si le panneau Performance est coché
+        travail = service.soumettre(
+            controler, "Contrôle des ventes", etapes, memoire=st.session_state.get("perf_ventes", False)
+        )
+        st.session_state.travail_ventes = travail.id
+
+    if not travail.termine:
+        suivre_travail(travail.id)
+        return None
+    for message in travail.avertissements:
+        st.warning(message)
+    service.oublier(st.session_state.pop("travail_ventes"))
+    if travail.erreur is not None:
+        # Travail oublié : le rerun suivant (ou un autre fichier) en soumet un nouveau
+        st.error(f"❌ Contrôle impossible : {travail.erreur}")
+        return None
+    st.session_state.profil_travail_ventes = travail.profil
+    st.session_state.df_source_ventes, st.session_state.empreinte_ventes, resultat = travail.resultat
+    return resultat
 
 def run_interface():
+    prechauffer()
+    # Panneau optionnel : le suivi mémoire (tracemalloc) ralentit les contrôles
+    perf = st.sidebar.checkbox("⏱️ Performance", key="perf_ventes")
+    with Profil(memoire=perf) as profil:
+        _interface()
+    if perf:
+        afficher_performance(profil, cle="perf_ventes")
+        if "profil_travail_ventes" in st.session_state:
+            afficher_performance(
+                st.session_state.profil_travail_ventes, cle="perf_ventes_travail", titre="⏱️ Dernier contrôle"
+            )
+
+def _interface():
     st.title("📈 Contrôle automatique des écritures de ventes")
 
     uploaded = st.file_uploader("Importe ton fichier Excel des ventes", type=["xlsx"])
 
     if uploaded:
-        if "df_source_ventes" not in st.session_state:
-            st.session_state.df_source_ventes = safe_read_excel(uploaded, header_row=1)
-
-        df = st.session_state.df_source_ventes.copy()
-
-        logs, factures_ko, nb_ko, df = run_ventes_checks_console(df)
-
-        # --------- Affichage logs ---------
-        st.subheader("📝 Logs")
-        st.code("\n".join(logs), language="text")
+        import pandas as pd
+        from cache_controles import get_check_cache
+        from export_fichiers import bouton_telechargement
+        from fusion_corrections import afficher_journal, appliquer_corrections, cumuler
+        from rapport_controle import afficher_constats
+        from validation_incrementale import IncrementalVentes
+
+        if "validateur_ventes" not in st.session_state:
+            st.session_state.validateur_ventes = IncrementalVentes(cache=cache_taux())
+
+        # Les reruns déclenchés par les widgets réutilisent le résultat mémorisé (et ne
+        # relancent donc pas la conversion de devises)
+        cache = get_check_cache()
+        resultat = cache.get(st.session_state.empreinte_ventes) if "empreinte_ventes" in st.session_state else None
+        if resultat is None:
+            resultat = _controler(uploaded)
+            if resultat is None:
+                return
+        rapport, factures_ko, nb_ko, df = resultat
+
+        # --------- Affichage constats ---------
+        st.subheader("📝 Constats")
+        afficher_constats(rapport, "constats_ventes")
+        afficher_journal(st.session_state.get("corrections_ventes"))
+        historique = st.sidebar.checkbox("🗂️ Comparer aux fichiers déjà contrôlés", key="index_ventes")
+        if historique:
+            from index_historique import afficher_historique, source_fichier
+
+            source = source_fichier(uploaded.name, uploaded.getvalue())
+            afficher_historique(index_fichiers(), "ventes", df, source, factures_ko, (st.session_state.empreinte_ventes, source))
 
         if nb_ko:
             st.warning(
@@ -70,26 +164,39 @@ def run_interface():
                 edited_factures.append(edited)
 
             if st.button("✅ Valider les corrections"):
-                for edited in edited_factures:
-                    for idx, row in edited.iterrows():
-                        df.loc[idx, row.index] = row
-
-                st.session_state.df_source_ventes = df
-                st.success("✅ Modifications enregistrées. Clique sur le bouton ci-dessous pour relancer le contrôle.")
-
-                if st.button("🔁 Relancer le contrôle"):
-                    st._is_running_with_streamlit = True
-                    sys.exit()
+                # Toutes les factures éditées en une mise à jour, par index de ligne
+                edites = pd.concat(edited_factures)
+                try:
+                    modifications = appliquer_corrections(
+                        df, edites, list(edites.columns), groupe="Numéro de facture"
+                    )
+                except ValueError as err:
+                    st.error(f"❌ {err}")
+                else:
+                    st.session_state.corrections_ventes = cumuler(
+                        st.session_state.get("corrections_ventes"), modifications
+                    )
+                    st.session_state.df_source_ventes = df
+                    cache.invalidate(st.session_state.pop("empreinte_ventes", None))
+                    st.success(
+                        f"✅ {len(modifications)} modification(s) enregistrée(s). "
+                        "Clique sur le bouton ci-dessous pour relancer le contrôle."
+                    )
+
+                    if st.button("🔁 Relancer le contrôle"):
+                        st._is_running_with_streamlit = True
+                        sys.exit()
 
         else:
             # --------- Sinon → export ---------
             st.success("🎉 Plus aucune vente KO. Tu peux exporter le fichier corrigé.")
-            buf = dataframe_to_excel_bytes(df)
-            st.download_button(
-                "📥 Télécharger le fichier corrigé",
-                buf,
-                "ventes_corrigées.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+            # Le fichier n'entre dans l'historique qu'exporté, corrections validées
+            if bouton_telechargement(df, "ventes_corrigées", cle="export_ventes") and historique:
+                from index_historique import enregistrer_historique
+
+                enregistrer_historique(index_fichiers(), "ventes", df, source)
+
+
+if __name__ == "__main__":
+    run_interface()
 
-run_interface()
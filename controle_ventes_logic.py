@@ -1,7 +1,12 @@
+import numpy as np
 import pandas as pd
 import re
-import requests
-from typing import List, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
+import profilage
+from regles import BLOQUANTE, FICHIER, GROUPE, LIGNE, Constat, Contexte, JeuRegles, Regle, jeu_client
+from schema_journal import SCHEMA_VENTES, par_valeurs_uniques, parser_montants
+from taux_change import RateCache, default_cache, get_rates
 
 def clean_nom_client(txt: str) -> str:
     return re.sub(r"[^\w\s]", "", str(txt))
@@ -13,64 +18,254 @@ symbol_to_currency = {
     "₱": "PHP", "zł": "PLN", "lei": "RON", "S$": "SGD", "฿": "THB", "₺": "TRY", "R": "ZAR"
 }
 
-def get_conversion_rate_frankfurter(date: str, from_currency: str, to_currency: str = "EUR") -> float:
-    url = f"https://api.frankfurter.app/{date}"
-    params = {"from": from_currency, "to": to_currency}
-    response = requests.get(url, params=params)
-    data = response.json()
+TAUX_SECOURS = 1.0  # appliqué, et signalé, quand aucun taux n'est trouvé
 
-    if "rates" not in data or to_currency not in data["rates"]:
-        print("❌ Erreur dans la réponse :", data)
-        return 1.0  # Valeur de secours
+def resolve_currency(symbole: str) -> Optional[str]:
+    if symbole in symbol_to_currency:
+        return symbol_to_currency[symbole]
+    if symbole in symbol_to_currency.values():
+        return symbole
+    return None
 
-    return data["rates"][to_currency]
+def _message_secours(devise: str, date: str, cible: str = "EUR") -> str:
+    return f"aucun taux {devise}→{cible} au {date}, taux de secours {TAUX_SECOURS} appliqué"
 
-def run_ventes_checks_console(df: pd.DataFrame) -> Tuple[List[str], List[str], int, pd.DataFrame]:
+def get_conversion_rate_frankfurter(
+    date: str,
+    from_currency: str,
+    to_currency: str = "EUR",
+    logs: Optional[List[str]] = None,
+    provider=None,
+    cache: Optional[RateCache] = None,
+) -> float:
+    # Même chemin que les factures (get_rates : cache, dernier taux publié) ; sans taux, le
+    # taux de secours est appliqué et signalé dans logs
+    taux, erreurs = get_rates(
+        [(date, from_currency)], provider, cache if cache is not None else default_cache(), to_currency
+    )
+    if (date, from_currency) not in taux:
+        if logs is not None:
+            cause = f" ({erreurs[from_currency]})" if from_currency in erreurs else ""
+            logs.append(f"⚠️ Conversion {from_currency} : {_message_secours(from_currency, date, to_currency)}{cause}")
+        return TAUX_SECOURS
+
+    return taux[(date, from_currency)]
+
+COLONNES_VENTES = [
+    "Code journal", "Date de facture", "Compte général", "Compte tiers",
+    "Concierge", "Nom client + service", "Numéro de facture",
+    "Débit", "Crédit", "Monnaie", "Analytique", "Code"
+]
+# À incrémenter à chaque changement de règle : invalide les résultats mémorisés
+REGLES_VERSION = "1"
+
+# (n° de facture, constats)
+ResultatVente = Tuple[str, List[Constat]]
+
+def prepare_ventes(df: pd.DataFrame) -> pd.DataFrame:
+    with profilage.etape("normalisation", len(df)):
+        return _prepare_ventes(df)
+
+def _strip_textes(serie: pd.Series) -> pd.Series:
+    # Seules les chaînes sont nettoyées ; nombres, dates et vides restent tels quels
+    if serie.dtype != object:
+        return serie
+    try:
+        nettoyees = serie.str.strip()
+    except AttributeError:  # colonne objet sans aucune chaîne
+        return serie
+    return nettoyees.where(nettoyees.notna(), serie)
+
+def _prepare_ventes(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = COLONNES_VENTES
+
+    df = df.apply(_strip_textes)
+    df["Nom client + service"] = par_valeurs_uniques(
+        df["Nom client + service"].astype(str), lambda noms: noms.map(clean_nom_client), object
+    )
+    df["Débit"] = parser_montants(df["Débit"])
+    df["Crédit"] = parser_montants(df["Crédit"])
+    for col, dtype in SCHEMA_VENTES.items():
+        df[col] = df[col].astype(dtype)
+    return df
+
+def convert_currencies_par_facture(
+    df: pd.DataFrame,
+    provider=None,
+    cache: Optional[RateCache] = None,
+) -> List[Tuple[str, str]]:
+    with profilage.etape("devises", len(df)):
+        return _convert_currencies_par_facture(df, provider, cache)
+
+def _convert_currencies_par_facture(df: pd.DataFrame, provider, cache: Optional[RateCache]) -> List[Tuple[str, str]]:
     logs = []
-    factures_ko = []
 
-    df.columns = [
-        "Code journal", "Date de facture", "Compte général", "Compte tiers",
-        "Concierge", "Nom client + service", "Numéro de facture",
-        "Débit", "Crédit", "Monnaie", "Analytique", "Code"
-    ]
+    # 🔁 Conversion des devises ≠ EUR
+    premieres = df.drop_duplicates("Numéro de facture")
+    a_convertir = premieres[premieres["Monnaie"] != "€"]
+    conversions = []
+    for num, monnaie, date in zip(a_convertir["Numéro de facture"], a_convertir["Monnaie"], a_convertir["Date de facture"]):
+        symbole = str(monnaie).strip()
+        code_devise = resolve_currency(symbole)
+        date_facture = pd.to_datetime(date).strftime("%Y-%m-%d") if code_devise else None
+        conversions.append((num, symbole, code_devise, date_facture))
+
+    demandes = {(d, code) for _, _, code, d in conversions if code}
+    taux, erreurs_taux = get_rates(
+        demandes,
+        provider=provider,
+        cache=cache if cache is not None else default_cache(),
+    ) if demandes else ({}, {})
+
+    taux_factures = {}
+    for num, symbole, code_devise, date_facture in conversions:
+        if not code_devise:
+            logs.append((num, f"❌ Facture {num} : symbole devise inconnu '{symbole}'"))
+        elif code_devise in erreurs_taux:
+            logs.append((num, f"❌ Erreur conversion facture {num} : {erreurs_taux[code_devise]}"))
+        else:
+            if (date_facture, code_devise) not in taux:
+                logs.append((num, f"⚠️ Facture {num} : {_message_secours(code_devise, date_facture)}"))
+            taux_factures[num] = taux.get((date_facture, code_devise), TAUX_SECOURS)
+            logs.append((num, f"💱 Conversion en EUR appliquée pour la facture {num} (taux : {taux_factures[num]})"))
+
+    if taux_factures:
+        taux_lignes = df["Numéro de facture"].map(taux_factures)
+        convertie = taux_lignes.notna()
+        df.loc[convertie, "Débit"] *= taux_lignes[convertie]
+        df.loc[convertie, "Crédit"] *= taux_lignes[convertie]
+        df.loc[convertie, "Monnaie"] = "€"
+
+    return logs
+
+def convert_currencies(df: pd.DataFrame, provider=None, cache: Optional[RateCache] = None) -> List[str]:
+    return [ligne for _, ligne in convert_currencies_par_facture(df, provider, cache)]
+
+def _texte_strip(serie: pd.Series) -> pd.Series:
+    return par_valeurs_uniques(serie, lambda v: v.astype(str).str.strip(), object)
+
+def _contexte_ventes(df: pd.DataFrame) -> Contexte:
+    # Colonnes dérivées lues par les règles, calculées une fois pour tout le journal
+    ctx = Contexte(df, "Numéro de facture")
+    ctx.compte = _texte_strip(df["Compte général"]).to_numpy()
+    ctx.tiers = _texte_strip(df["Compte tiers"]).to_numpy()
+    ctx.debit = df["Débit"].to_numpy(dtype=float)
+    ctx.credit = df["Crédit"].to_numpy(dtype=float)
+    ctx.pos_premiere = ctx.premiere()
+
+    ctx.is411 = ctx.compte == "411000"
+    ctx.nb_411 = ctx.compter(ctx.is411)
+    ctx.une_411 = ctx.nb_411 == 1
+    ctx.pos_411 = ctx.premiere(ctx.is411)
+    ctx.debit_411 = np.where(ctx.une_411, ctx.debit[ctx.pos_411], np.nan)
+    ctx.credit_411 = np.where(ctx.une_411, ctx.credit[ctx.pos_411], np.nan)
+    ctx.s_credit_G = ctx.somme(ctx.credit, (df["Code"] != "A").to_numpy(dtype=bool))
+    return ctx
+
+def _monnaie_ko(ctx: Contexte, p: Dict) -> np.ndarray:
+    premiere = ctx.df["Monnaie"].to_numpy(dtype=object)[ctx.pos_premiere]
+    return (ctx.nb_valeurs("Monnaie") > 1) | (premiere != p["monnaie"])
+
+def _une_411(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ctx.une_411
+
+def _ligne_411(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ctx.pos_411
+
+def _premiere_ligne(ctx: Contexte, p: Dict) -> np.ndarray:
+    return ctx.pos_premiere
+
+PARAMETRES_VENTES = {
+    "code_journal": "VE",
+    "monnaie": "€",
+    "codes_autorises": ["A", "G"],
+    "tiers_interdit": "411-NO MEMBER ACCOUNT",
+}
+
+# Ordre de déclaration = ordre des messages dans les logs d'une facture
+REGLES_VENTES = [
+    Regle("VE_JOURNAL", LIGNE, lambda c, p: (c.df["Code journal"] != p["code_journal"]).to_numpy(dtype=bool),
+          "Code journal ≠ {code_journal}", BLOQUANTE),
+    Regle("VE_DATES", GROUPE, lambda c, p: c.nb_valeurs("Date de facture") > 1,
+          "Dates différentes dans une même facture", BLOQUANTE),
+    Regle("VE_MONNAIE", GROUPE, _monnaie_ko,
+          lambda c, g, p: f"Facture non en euro (valeurs : {c.df['Monnaie'].iloc[c.lignes(g)].unique().tolist()})",
+          BLOQUANTE),
+    Regle("VE_PREMIERE_LIGNE", GROUPE, lambda c, p: c.compte[c.pos_premiere] != "411000",
+          lambda c, g, p: f"1ère ligne ≠ 411000 (valeur : {c.compte[c.pos_premiere[g]]})", BLOQUANTE,
+          cible=_premiere_ligne),
+    Regle("VE_CODE", LIGNE, lambda c, p: ~c.df["Code"].isin(p["codes_autorises"]).to_numpy(dtype=bool),
+          lambda c, g, p: f"Code ≠ {' ou '.join(p['codes_autorises'])}", BLOQUANTE),
+    Regle("VE_ANALYTIQUE", LIGNE, lambda c, p: ((c.df["Code"] != "A") & c.df["Analytique"].notna()).to_numpy(dtype=bool),
+          "Analytique ne doit être rempli que si Code = A", BLOQUANTE),
+    Regle("VE_TIERS_INTERDIT", LIGNE, lambda c, p: c.is411 & (c.tiers == p["tiers_interdit"]),
+          "Ligne 411000 avec compte tiers '{tiers_interdit}'", BLOQUANTE),
+    Regle("VE_NB_411", GROUPE, lambda c, p: c.nb_411 != 1, "Nombre ≠ 1 de lignes 411000", BLOQUANTE),
+    # Les règles suivantes supposent une seule ligne 411000
+    Regle("VE_DEBIT_411", GROUPE, lambda c, p: c.debit_411 <= 0, "Débit ligne 411000 ≤ 0", BLOQUANTE, si=_une_411,
+          cible=_ligne_411),
+    Regle("VE_CREDIT_411", GROUPE, lambda c, p: c.credit_411 != 0, "Crédit ligne 411000 ≠ 0", BLOQUANTE, si=_une_411,
+          cible=_ligne_411),
+    Regle("VE_DEBIT_AUTRES", LIGNE, lambda c, p: ~c.is411 & ~(c.debit == 0),
+          "Débit ≠ 0 sur lignes ≠ 411000", BLOQUANTE, si=_une_411),
+    Regle("VE_CREDIT_AUTRES", LIGNE, lambda c, p: ~c.is411 & ~(c.credit > 0),
+          "Crédit ≤ 0 sur lignes ≠ 411000", BLOQUANTE, si=_une_411),
+    Regle("VE_SOMME", GROUPE, lambda c, p: np.round(c.s_credit_G - c.debit_411, 2) != 0,
+          "Somme crédits ≠ Débit 411000", BLOQUANTE, si=_une_411, cible=_ligne_411),
+    # Désactivée par défaut : un même n° de facture en deux endroits du fichier
+    Regle("VE_FACTURE_DISPERSEE", FICHIER,
+          lambda c, p: c.derniere() - c.premiere() + 1 != c.compter(c.valides),
+          "Lignes de la facture non contiguës dans le fichier", BLOQUANTE, active=False),
+]
+
+JEU_VENTES = JeuRegles("ventes", REGLES_VENTES, PARAMETRES_VENTES, REGLES_VERSION)
+# Colonnes lues par _contexte_ventes et REGLES_VENTES (seules transmises en contrôle parallèle)
+COLONNES_REGLES_VENTES = [
+    "Code journal", "Date de facture", "Compte général", "Compte tiers", "Numéro de facture",
+    "Débit", "Crédit", "Monnaie", "Analytique", "Code",
+]
+
+def regles_ventes(chemin: Optional[str] = None) -> JeuRegles:
+    # Jeu standard, ajusté par le jeu client (CONTROLE_REGLES) s'il y en a un
+    return jeu_client(JEU_VENTES, chemin)
+
+def check_factures_resultats(
+    df: pd.DataFrame,
+    vectorized: bool = True,
+    regles: Optional[JeuRegles] = None,
+    processus: Optional[int] = None,
+) -> List[ResultatVente]:
+    # vectorized=False : boucle historique facture par facture, règles standard uniquement.
+    # processus : contrôle des gros journaux réparti sur plusieurs cœurs (controle_parallele)
+    with profilage.etape("controles", len(df)):
+        if vectorized and processus:
+            from controle_parallele import controler_en_parallele
+
+            resultats = controler_en_parallele("ventes", df, regles or regles_ventes(), processus)
+        elif vectorized:
+            resultats = _check_factures_vectorise(df, regles or regles_ventes())
+        else:
+            resultats = _check_factures_boucle(df)
+    profilage.compter("factures_controlees", len(resultats))
+    return resultats
 
-    df = df.applymap(lambda x: str(x).strip() if isinstance(x, str) else x)
-    df["Nom client + service"] = df["Nom client + service"].apply(clean_nom_client)
-    df["Débit"] = df["Débit"].astype(str).str.replace(",", ".").str.replace(r"[^\d.]", "", regex=True).astype(float)
-    df["Crédit"] = df["Crédit"].astype(str).str.replace(",", ".").str.replace(r"[^\d.]", "", regex=True).astype(float)
+def _check_factures_vectorise(df: pd.DataFrame, regles: JeuRegles) -> List[ResultatVente]:
+    ctx = _contexte_ventes(df)
+    evaluation = regles.evaluer(ctx)
+    return [(num, evaluation.groupes[g]) for g, num in enumerate(ctx.groupes)]
+
+def _check_factures_boucle(df: pd.DataFrame) -> List[ResultatVente]:
+    resultats = []
+    profil = profilage.profil_actif()
 
     df["ordre_excel"] = range(len(df))
-    grouped = df.groupby("Numéro de facture", sort=False)
     facture_order = df.drop_duplicates("Numéro de facture")[["Numéro de facture", "ordre_excel"]].sort_values("ordre_excel")
-    ordered_groups = [grouped.get_group(facture) for facture in facture_order["Numéro de facture"]]
-
-    # 🔁 Conversion des devises ≠ EUR
-    for group in ordered_groups:
-        monnaie = group["Monnaie"].iloc[0]
-        if monnaie != "€":
-            symbole = monnaie.strip()
-            code_devise = next((code for code, info in symbol_to_currency.items() if info == symbole or info == code), None)
-
-            if not code_devise:
-                logs.append(f"❌ Facture {group['Numéro de facture'].iloc[0]} : symbole devise inconnu '{symbole}'")
-                continue
-
-            date_facture = pd.to_datetime(group["Date de facture"].iloc[0]).strftime("%Y-%m-%d")
-            try:
-                taux = get_conversion_rate_frankfurter(date_facture, code_devise)
-                df.loc[group.index, "Débit"] *= taux
-                df.loc[group.index, "Crédit"] *= taux
-                df.loc[group.index, "Monnaie"] = "€"
-                logs.append(f"💱 Conversion en EUR appliquée pour la facture {group['Numéro de facture'].iloc[0]} (taux : {taux})")
-            except Exception as e:
-                logs.append(f"❌ Erreur conversion facture {group['Numéro de facture'].iloc[0]} : {str(e)}")
-
-    # Recalcul des groupes après conversion
     grouped = df.groupby("Numéro de facture", sort=False)
-    ordered_groups = [grouped.get_group(facture) for facture in facture_order["Numéro de facture"]]
+    # Les lignes sans numéro de facture ne forment pas de groupe (get_group(nan) échouerait)
+    ordered_groups = [grouped.get_group(facture) for facture in facture_order["Numéro de facture"].dropna()]
 
     for group in ordered_groups:
+        debut = time.perf_counter()
         num_facture = group["Numéro de facture"].iloc[0]
         erreurs = []
 
@@ -124,22 +319,78 @@ def run_ventes_checks_console(df: pd.DataFrame) -> Tuple[List[str], List[str], i
             if round(lignes_G["Crédit"].sum() - l411["Débit"], 2) != 0:
                 erreurs.append("Somme crédits ≠ Débit 411000")
 
-        statut = "❌" if erreurs else "✅"
-        logs.append(f"{statut} Facture {num_facture} : {'KO' if erreurs else 'OK'}")
-        for e in erreurs:
-            logs.append(f"   🔻 {e}")
-
-        if erreurs:
-            factures_ko.append(num_facture)
+        # Les messages qui citent des valeurs n'ont pas de code de règle
+        resultats.append((num_facture, [JEU_VENTES.constat(e, BLOQUANTE) for e in erreurs]))
+        if profil:
+            profil.groupe("controles", num_facture, time.perf_counter() - debut, len(group))
 
     df.drop(columns=["ordre_excel"], inplace=True)
-    if not factures_ko and "Concierge" in df.columns:
-        df.drop(columns=["Concierge"], inplace=True)
+    return resultats
+
+def facture_ko(erreurs: List[Constat]) -> bool:
+    # KO dès qu'un constat est bloquant (toutes les règles standard le sont)
+    return any(c.severite == BLOQUANTE for c in erreurs)
+
+def logs_facture(num_facture: str, erreurs: List[Constat]) -> List[str]:
+    ko = facture_ko(erreurs)
+    logs = [f"{'❌' if ko else '✅'} Facture {num_facture} : {'KO' if ko else 'OK'}"]
+    for c in erreurs:
+        logs.append(f"   {'🔻' if c.severite == BLOQUANTE else '🟢'} {c.message}")
+    return logs
+
+def check_factures(
+    df: pd.DataFrame,
+    vectorized: bool = True,
+    regles: Optional[JeuRegles] = None,
+    processus: Optional[int] = None,
+) -> Tuple[List[str], List[str]]:
+    logs = []
+    factures_ko = []
+
+    resultats = check_factures_resultats(df, vectorized, regles, processus)
+    with profilage.etape("logs"):
+        for num_facture, erreurs in resultats:
+            logs.extend(logs_facture(num_facture, erreurs))
+            if facture_ko(erreurs):
+                factures_ko.append(num_facture)
+
+    return logs, factures_ko
+
+def summary_logs(factures_ko: List[str], has_concierge: bool) -> List[str]:
+    logs = []
+    if not factures_ko and has_concierge:
         logs.append("✅ Colonne Concierge supprimée avant export.")
 
     if factures_ko:
         logs.append(f"\n📋 Contrôle terminé : {len(factures_ko)} facture(s) KO.")
     else:
         logs.append("\n📋 Contrôle terminé : toutes les écritures sont conformes ✅")
+    return logs
+
+def run_ventes_checks_console(
+    df: pd.DataFrame,
+    provider=None,
+    cache: Optional[RateCache] = None,
+    vectorized: bool = True,
+    regles: Optional[JeuRegles] = None,
+    processus: Optional[int] = None,
+    index=None,
+    source: Optional[str] = None,
+) -> Tuple[List[str], List[str], int, pd.DataFrame]:
+    # index / source : factures des fichiers précédents, cf. run_checks des achats
+    with profilage.etape("run_ventes_checks_console", len(df)):
+        df = prepare_ventes(df)
+        logs = convert_currencies(df, provider, cache)
+
+        logs_factures, factures_ko = check_factures(df, vectorized, regles, processus)
+        logs.extend(logs_factures)
+        if index is not None:
+            from index_historique import controler_historique
+
+            with profilage.etape("historique", len(df)):
+                logs.extend(controler_historique(index, "ventes", df, source, factures_ko))
+        logs.extend(summary_logs(factures_ko, "Concierge" in df.columns))
+        if not factures_ko and "Concierge" in df.columns:
+            df.drop(columns=["Concierge"], inplace=True)
 
     return logs, factures_ko, len(factures_ko), df
@@ -0,0 +1,173 @@
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import IO, Dict, Iterable, Optional, Tuple, Union
+
+import pandas as pd
+
+import profilage
+from cache_controles import fingerprint
+
+# Export des tableaux corrigés, partagé par les pages Streamlit, le mode streaming et le
+# contrôle en lot :
+# - xlsx écrit ligne à ligne en mode constant_memory de xlsxwriter (pandas écrit colonne
+#   par colonne, incompatible avec ce mode), dans un fichier temporaire qui ne reste en
+#   mémoire que sous SEUIL_MEMOIRE ;
+# - CSV et Parquet, bien plus rapides à produire pour les outils d'import ;
+# - octets générés gardés en cache par empreinte du tableau : les reruns Streamlit qui
+#   repassent par le bouton de téléchargement ne reconstruisent pas le fichier.
+#
+# st.download_button prend des octets : le fichier temporaire est relu en entier une fois
+# écrit. Seuls les exports sous TAILLE_MAX_ENTREE sont gardés en cache ; un plus gros
+# export est reconstruit à chaque rerun plutôt que de rester en mémoire entre les reruns.
+
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "xlsx": ("Excel (.xlsx)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV (.csv)", "text/csv"),
+    "parquet": ("Parquet (.parquet)", "application/vnd.apache.parquet"),
+}
+SEUIL_MEMOIRE = 64 * 1024 ** 2
+TAILLE_BLOC = 50_000
+TAILLE_CACHE_DEFAUT = 256 * 1024 ** 2
+TAILLE_MAX_ENTREE = SEUIL_MEMOIRE
+
+# Mise en forme de l'en-tête de DataFrame.to_excel
+FORMAT_ENTETE = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+
+def _lignes(df: pd.DataFrame) -> Iterable[tuple]:
+    # Valeurs Python natives, cellules vides à None (xlsxwriter refuse NaN / NaT)
+    colonnes = [df[c].astype(object).where(df[c].notna(), None).tolist() for c in df.columns]
+    return zip(*colonnes)
+
+
+def ecrire_xlsx_blocs(blocs: Iterable[pd.DataFrame], destination: Union[str, IO[bytes]]) -> int:
+    import xlsxwriter
+
+    wb = xlsxwriter.Workbook(destination, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    })
+    ws = wb.add_worksheet("Sheet1")
+    fmt_entete = wb.add_format(FORMAT_ENTETE)
+    ligne = 0
+    try:
+        for df in blocs:
+            if ligne == 0:
+                ws.write_row(0, 0, [str(c) for c in df.columns], fmt_entete)
+                ligne = 1
+            for debut in range(0, len(df), TAILLE_BLOC):
+                for valeurs in _lignes(df.iloc[debut:debut + TAILLE_BLOC]):
+                    ws.write_row(ligne, 0, valeurs)
+                    ligne += 1
+    finally:
+        wb.close()
+    return max(ligne - 1, 0)
+
+
+def ecrire(df: pd.DataFrame, fmt: str, destination: Union[str, IO[bytes]]) -> None:
+    if fmt == "xlsx":
+        ecrire_xlsx_blocs([df], destination)
+    elif fmt == "csv":
+        df.to_csv(destination, index=False, encoding="utf-8")
+    elif fmt == "parquet":
+        from cache_lecture import normaliser_pour_parquet
+
+        normaliser_pour_parquet(df).to_parquet(destination, index=False)
+    else:
+        raise ValueError(f"Format d'export inconnu : {fmt} (attendu : {', '.join(FORMATS)})")
+
+
+class ExportCache:
+    def __init__(self, taille_max: int = TAILLE_CACHE_DEFAUT, taille_max_entree: int = TAILLE_MAX_ENTREE):
+        self.taille_max = taille_max
+        self.taille_max_entree = min(taille_max, taille_max_entree)
+        self.hits = 0
+        self.misses = 0
+        self._entrees: "OrderedDict[str, bytes]" = OrderedDict()
+        self._octets = 0
+        self._verrou = threading.Lock()
+
+    def get(self, cle: str) -> Optional[bytes]:
+        with self._verrou:
+            data = self._entrees.get(cle)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return data
+
+    def put(self, cle: str, data: bytes) -> bytes:
+        with self._verrou:
+            if cle in self._entrees:
+                self._octets -= len(self._entrees.pop(cle))
+            if len(data) <= self.taille_max_entree:
+                self._entrees[cle] = data
+                self._octets += len(data)
+            while self._octets > self.taille_max:
+                _, ancien = self._entrees.popitem(last=False)
+                self._octets -= len(ancien)
+        return data
+
+    def clear(self) -> None:
+        with self._verrou:
+            self._entrees.clear()
+            self._octets = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entrees": len(self._entrees), "octets": self._octets}
+
+
+_cache: Optional[ExportCache] = None
+_verrou_cache = threading.Lock()
+
+
+def get_export_cache() -> ExportCache:
+    global _cache
+    with _verrou_cache:
+        if _cache is None:
+            _cache = ExportCache()
+        return _cache
+
+
+def exporter(df: pd.DataFrame, fmt: str = "xlsx", cache: Optional[ExportCache] = None) -> bytes:
+    cache = cache if cache is not None else get_export_cache()
+    cle = fingerprint(df, "export", fmt)
+    data = cache.get(cle)
+    if data is not None:
+        profilage.compter("exports_en_cache")
+        return data
+
+    with profilage.etape(f"export_{fmt}", len(df)):
+        with tempfile.SpooledTemporaryFile(max_size=SEUIL_MEMOIRE) as tmp:
+            ecrire(df, fmt, tmp)
+            tmp.seek(0)
+            data = tmp.read()
+    return cache.put(cle, data)
+
+
+def dataframe_to_excel_bytes(df: pd.DataFrame) -> BytesIO:
+    return BytesIO(exporter(df, "xlsx"))
+
+
+def bouton_telechargement(df: pd.DataFrame, nom: str, cle: str) -> bool:
+    # Sélecteur de format + bouton de téléchargement pour les pages Streamlit ; vrai au rerun
+    # qui suit un téléchargement
+    import streamlit as st
+
+    fmt = st.radio(
+        "Format d'export",
+        list(FORMATS),
+        format_func=lambda f: FORMATS[f][0],
+        horizontal=True,
+        key=f"{cle}_format",
+    )
+    return st.download_button(
+        "📥 Télécharger le fichier corrigé",
+        exporter(df, fmt),
+        f"{nom}.{fmt}",
+        mime=FORMATS[fmt][1],
+        key=f"{cle}_telechargement",
+    )
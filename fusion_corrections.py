@@ -0,0 +1,132 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Report des corrections saisies dans les data_editor sur le tableau source, en une mise à
+# jour indexée par colonne (plutôt qu'un filtre du tableau entier par ligne éditée) :
+# - par clé (achats : n° de pièce), éventuellement restreinte aux lignes d'un masque
+#   (lignes 401000) ; une clé éditée deux fois garde sa dernière saisie ;
+# - par index de ligne (ventes : le data_editor garde l'index du tableau).
+#
+# Les valeurs sont converties au type de la colonne cible avant écriture : une saisie non
+# numérique dans une colonne de montants est refusée (ValueError) plutôt que de changer le
+# type de la colonne. Seules les cellules réellement modifiées sont écrites, et chacune est
+# consignée dans le journal des modifications (index, groupe, colonne, avant, après). Une
+# cellule vide et une valeur manquante sont considérées égales : les éditeurs affichent les
+# manquants en "" (Concierge).
+
+COLONNES_JOURNAL = ["index", "groupe", "colonne", "avant", "apres"]
+
+
+def journal_vide() -> pd.DataFrame:
+    return pd.DataFrame(columns=COLONNES_JOURNAL)
+
+
+def cumuler(journal: Optional[pd.DataFrame], modifications: pd.DataFrame) -> pd.DataFrame:
+    # Journal de session : modifications des validations successives, dans l'ordre
+    if journal is None or journal.empty:
+        return modifications
+    if modifications.empty:
+        return journal
+    return pd.concat([journal, modifications], ignore_index=True)
+
+
+def afficher_journal(journal: Optional[pd.DataFrame]) -> None:
+    import streamlit as st
+
+    if journal is not None and not journal.empty:
+        with st.expander(f"🧾 Modifications appliquées ({len(journal)})"):
+            st.dataframe(journal.astype({"avant": str, "apres": str}), hide_index=True)
+
+
+def _manquants(valeurs: np.ndarray) -> np.ndarray:
+    manquants = pd.isna(valeurs)
+    return manquants | (np.where(manquants, None, valeurs) == "")
+
+
+def _convertir(saisies: pd.Series, cible: pd.Series) -> pd.Series:
+    colonne = cible.name
+    if pd.api.types.is_numeric_dtype(cible.dtype) and not pd.api.types.is_bool_dtype(cible.dtype):
+        texte = saisies.astype(object).where(saisies.notna(), None)
+        vides = texte.astype(str).str.strip().eq("") & texte.notna()
+        converties = pd.to_numeric(texte.where(~vides, None), errors="coerce")
+        invalides = converties.isna() & texte.notna() & ~vides
+        if invalides.any():
+            exemples = ", ".join(repr(v) for v in texte[invalides].unique()[:5])
+            raise ValueError(f"Colonne {colonne} : valeurs non numériques ({exemples})")
+        return converties
+    if isinstance(cible.dtype, pd.StringDtype):
+        return saisies.astype(object).where(saisies.isna(), saisies.astype(str))
+    return saisies.astype(object)
+
+
+def _differentes(avant: pd.Series, apres: pd.Series) -> np.ndarray:
+    a = avant.to_numpy(dtype=object)
+    b = apres.to_numpy(dtype=object)
+    vide_a, vide_b = _manquants(a), _manquants(b)
+    differentes = vide_a != vide_b
+    comparables = ~vide_a & ~vide_b
+    differentes[comparables] = a[comparables] != b[comparables]
+    return differentes
+
+
+def _ecrire(df: pd.DataFrame, index: pd.Index, colonne: str, valeurs: pd.Series) -> None:
+    serie = df[colonne]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        nouvelles = pd.Index(valeurs.dropna().unique()).difference(serie.cat.categories)
+        if len(nouvelles):
+            df[colonne] = serie.cat.add_categories(nouvelles)
+    elif pd.api.types.is_integer_dtype(serie.dtype):
+        entieres = valeurs.notna().all() and (valeurs == np.round(valeurs)).all()
+        if entieres:
+            valeurs = valeurs.astype(serie.dtype)
+        else:
+            df[colonne] = serie.astype(float)
+    df.loc[index, colonne] = valeurs.to_numpy()
+
+
+def appliquer_corrections(
+    df: pd.DataFrame,
+    edite: pd.DataFrame,
+    colonnes: Sequence[str],
+    cle: Optional[str] = None,
+    masque: Optional[np.ndarray] = None,
+    groupe: Optional[str] = None,
+) -> pd.DataFrame:
+    # Modifie df en place ; renvoie le journal des cellules modifiées. groupe : colonne
+    # recopiée dans le journal (par défaut la clé)
+    groupe = groupe or cle
+    if cle is None:
+        inconnues = edite.index.difference(df.index)
+        if len(inconnues):
+            raise ValueError(f"Lignes éditées absentes du tableau : {', '.join(map(str, inconnues[:5]))}")
+        cibles = edite.index
+        saisies = edite[list(colonnes)]
+    else:
+        edite = edite.drop_duplicates(cle, keep="last")
+        candidats = df.index if masque is None else df.index[np.asarray(masque, dtype=bool)]
+        positions = pd.Index(edite[cle].astype(object)).get_indexer(df.loc[candidats, cle].astype(object))
+        cibles = candidats[positions >= 0]
+        saisies = edite[list(colonnes)].iloc[positions[positions >= 0]].set_axis(cibles)
+
+    modifications: List[pd.DataFrame] = []
+    for colonne in colonnes:
+        apres = _convertir(saisies[colonne], df[colonne])
+        avant = df.loc[cibles, colonne]
+        changees = _differentes(avant, apres)
+        if not changees.any():
+            continue
+        index = cibles[changees]
+        modifications.append(pd.DataFrame({
+            "index": index,
+            "groupe": df.loc[index, groupe].to_numpy(dtype=object) if groupe else None,
+            "colonne": colonne,
+            "avant": avant[changees].to_numpy(dtype=object),
+            "apres": apres[changees].to_numpy(dtype=object),
+        }))
+        _ecrire(df, index, colonne, apres[changees])
+
+    if not modifications:
+        return journal_vide()
+    return pd.concat(modifications, ignore_index=True)
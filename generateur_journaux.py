@@ -0,0 +1,187 @@
+from io import BytesIO
+from typing import Dict, IO, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from controle_ventes_logic import COLONNES_VENTES
+
+# Journaux synthétiques AC / VE au format des exports clients, pour mesurer les contrôles
+# à volume réaliste sans données réelles. Tout est tiré avec une graine : deux appels avec
+# les mêmes paramètres donnent le même journal.
+#
+# - lignes_par_piece : taille moyenne d'une pièce / facture (loi de Poisson, 2 lignes minimum)
+# - taux_erreurs : part des pièces / factures volontairement fausses (tiers, compte, somme…)
+# - taux_lignes_vides : part des lignes de charge à 0 / 0
+# - taux_pieces_vides : part des lignes de charge sans n° de pièce (à renuméroter)
+# - devises : répartition des symboles de devise des factures de vente
+
+COLONNES_ACHATS = [
+    "Code journal", "Date Facture", "Compte Généraux", "Compte Tiers", "Libelle",
+    "Concierge", "n° de piece", "Analytique", "Code", "Débit(€)", "Crédit (€)",
+]
+
+DEVISES_DEFAUT = {"€": 0.85, "$": 0.07, "£": 0.05, "CHF": 0.03}
+
+
+def _tailles(rng: np.random.Generator, nb_lignes: int, lignes_par_piece: float, minimum: int = 2) -> np.ndarray:
+    # Tailles de groupes dont la somme vaut exactement nb_lignes
+    nb = max(1, int(np.ceil(nb_lignes / max(lignes_par_piece, minimum))) + 1)
+    tailles = np.maximum(minimum, rng.poisson(max(lignes_par_piece - minimum, 0), nb) + minimum)
+    while tailles.sum() < nb_lignes:
+        tailles = np.concatenate([tailles, tailles])
+    fin = np.searchsorted(tailles.cumsum(), nb_lignes)
+    tailles = tailles[:fin + 1].copy()
+    tailles[-1] -= tailles.sum() - nb_lignes
+    if tailles[-1] < minimum and len(tailles) > 1:
+        tailles[-2] += tailles[-1]
+        tailles = tailles[:-1]
+    return tailles
+
+
+def _rangs(tailles: np.ndarray) -> np.ndarray:
+    debuts = np.repeat(tailles.cumsum() - tailles, tailles)
+    return np.arange(tailles.sum()) - debuts
+
+
+def _texte(prefixe: str, valeurs: np.ndarray) -> pd.Series:
+    return prefixe + pd.Series(valeurs).astype(str)
+
+
+def journal_achats(
+    nb_lignes: int = 100_000,
+    lignes_par_piece: float = 4,
+    taux_erreurs: float = 0.05,
+    taux_lignes_vides: float = 0.02,
+    taux_pieces_vides: float = 0.3,
+    taux_avoirs: float = 0.1,
+    seed: int = 0,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    tailles = _tailles(rng, nb_lignes, lignes_par_piece)
+    nb_pieces = len(tailles)
+    piece = np.repeat(np.arange(nb_pieces), tailles)
+    rang = _rangs(tailles)
+    n = len(piece)
+
+    est_401 = rang == 0
+    derniere = rang == tailles[piece] - 1
+    comptes = rng.choice(np.array(["604110", "604000", "604900"]), n)
+    comptes = np.where(derniere & (tailles[piece] >= 3), "445660", comptes)
+    comptes = np.where(est_401, "401000", comptes)
+
+    montants = np.round(rng.uniform(5, 2000, n), 2)
+    montants[~est_401 & (rng.random(n) < taux_lignes_vides)] = 0.0
+    montants[est_401] = 0.0
+    totaux = np.round(np.bincount(piece, weights=montants, minlength=nb_pieces), 2)
+    montants[est_401] = totaux[piece[est_401]]
+
+    mois = rng.integers(1, 13, nb_pieces)
+    jours = rng.integers(1, 29, nb_pieces)
+    numeros = (pd.Series(mois).map("{:02d}".format) + "-" + pd.Series(np.arange(1, nb_pieces + 1)).astype(str)).to_numpy()
+    dates = (pd.Series(jours).map("{:02d}".format) + "/" + pd.Series(mois).map("{:02d}".format) + "/2025").to_numpy()
+    fournisseurs = rng.integers(1, max(2, nb_pieces // 20), nb_pieces)
+
+    # Erreurs : 0 tiers hors 401, 1 ligne 401 à 0 / 0 (autocorrigée), 2 compte interdit,
+    # 3 total faux, 4 date hors 2025
+    en_erreur = rng.random(nb_pieces) < taux_erreurs
+    type_erreur = np.where(en_erreur, rng.integers(0, 5, nb_pieces), -1)
+    erreur = type_erreur[piece]
+
+    tiers = np.where(est_401, _texte("401F", fournisseurs[piece]).to_numpy(), "")
+    tiers = np.where(est_401 & (erreur == 0), _texte("FRS", fournisseurs[piece]).to_numpy(), tiers)
+    montants[est_401 & (erreur == 1)] = 0.0
+    comptes = np.where(~est_401 & derniere & (erreur == 2), "999999", comptes)
+    montants[est_401 & (erreur == 3)] += 1.0
+    dates = np.where(type_erreur == 4, "31/12/2024", dates)
+
+    avoir = (rng.random(nb_pieces) < taux_avoirs)[piece]
+    credit_normal = np.where(est_401, montants, 0.0)
+    debit_normal = np.where(est_401, 0.0, montants)
+
+    n_piece = numeros[piece]
+    n_piece = np.where(~est_401 & (rng.random(n) < taux_pieces_vides), "", n_piece)
+
+    df = pd.DataFrame({
+        "Code journal": "AC",
+        "Date Facture": dates[piece],
+        "Compte Généraux": comptes,
+        "Compte Tiers": tiers,
+        "Libelle": _texte("FOURNISSEUR ", fournisseurs[piece]).to_numpy(),
+        "Concierge": _texte("CONCIERGE ", piece % 50).to_numpy(),
+        "n° de piece": n_piece,
+        "Analytique": "",
+        "Code": "G",
+        "Débit(€)": np.where(avoir, credit_normal, debit_normal),
+        "Crédit (€)": np.where(avoir, debit_normal, credit_normal),
+    })
+    return df[COLONNES_ACHATS]
+
+
+def journal_ventes(
+    nb_lignes: int = 100_000,
+    lignes_par_piece: float = 3,
+    taux_erreurs: float = 0.05,
+    taux_lignes_vides: float = 0.02,
+    devises: Optional[Dict[str, float]] = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    devises = devises or DEVISES_DEFAUT
+    tailles = _tailles(rng, nb_lignes, lignes_par_piece)
+    nb_factures = len(tailles)
+    facture = np.repeat(np.arange(nb_factures), tailles)
+    rang = _rangs(tailles)
+    n = len(facture)
+
+    est_411 = rang == 0
+    montants = np.round(rng.uniform(10, 1500, n), 2)
+    montants[~est_411 & (rng.random(n) < taux_lignes_vides)] = 0.0
+    montants[est_411] = 0.0
+    totaux = np.round(np.bincount(facture, weights=montants, minlength=nb_factures), 2)
+    montants[est_411] = totaux[facture[est_411]]
+
+    symboles = np.array(list(devises))
+    poids = np.array(list(devises.values()), dtype=float)
+    monnaie = rng.choice(symboles, nb_factures, p=poids / poids.sum())
+    dates = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, nb_factures), unit="D")
+    clients = rng.integers(1, max(2, nb_factures // 10), nb_factures)
+
+    # Erreurs : 0 compte tiers « 411-NO MEMBER ACCOUNT », 1 première ligne ≠ 411000,
+    # 2 total faux, 3 code ≠ A / G
+    en_erreur = rng.random(nb_factures) < taux_erreurs
+    erreur = np.where(en_erreur, rng.integers(0, 4, nb_factures), -1)[facture]
+
+    tiers = np.where(est_411, _texte("411-C", clients[facture]).to_numpy(), None)
+    tiers = np.where(est_411 & (erreur == 0), "411-NO MEMBER ACCOUNT", tiers)
+    comptes = np.where(est_411, 411000, rng.choice(np.array([706000, 706100, 708500]), n))
+    comptes = np.where(est_411 & (erreur == 1), 706000, comptes)
+    montants[est_411 & (erreur == 2)] += 1.0
+    codes = np.where((rang == 1) & (erreur == 3), "X", "G")
+
+    df = pd.DataFrame({
+        "Code journal": "VE",
+        "Date de facture": dates[facture],
+        "Compte général": comptes,
+        "Compte tiers": tiers,
+        "Concierge": _texte("Concierge ", facture % 50).to_numpy(),
+        "Nom client + service": ("Client " + pd.Series(clients[facture]).astype(str) + ", séjour").to_numpy(),
+        "Numéro de facture": pd.Series(facture + 1).map("FV{:07d}".format).to_numpy(),
+        "Débit": np.where(est_411, montants, 0.0),
+        "Crédit": np.where(est_411, 0.0, montants),
+        "Monnaie": monnaie[facture],
+        "Analytique": np.nan,
+        "Code": codes,
+    })
+    return df[COLONNES_VENTES]
+
+
+def ecrire_xlsx(df: pd.DataFrame, destination: Union[str, IO[bytes], None] = None, titre: str = "Export") -> Union[str, IO[bytes]]:
+    # Comme les exports clients : une ligne de titre, puis l'en-tête (header_row=1)
+    destination = destination if destination is not None else BytesIO()
+    with pd.ExcelWriter(destination, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, startrow=1)
+        writer.sheets["Sheet1"].write(0, 0, titre)
+    if hasattr(destination, "seek"):
+        destination.seek(0)
+    return destination
@@ -0,0 +1,242 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from regles import Contexte
+from schema_journal import centimes, par_valeurs_uniques
+
+# Index des pièces / factures déjà validées, d'un fichier et d'une période à l'autre : un
+# n° déjà comptabilisé dans un autre fichier, ou un trou dans la numérotation, se voit sans
+# relire les exports passés. L'index est une base SQLite (comme le cache des taux) : une
+# ligne par groupe validé avec sa date, son compte tiers et son montant en centimes, et le
+# n° découpé en préfixe + rang (« 10-42 » → « 10- », 42 ; « F00021 » → « F », 21) pour
+# chercher les trous par plage.
+#
+#   run_checks(df, index=IndexHistorique(), source=source_fichier("achats_2025_10.xlsx", contenu))
+#   python controle_batch.py exports/ --index historique.sqlite
+#
+# Une source est le nom du fichier suivi de l'empreinte de son contenu (source_fichier) :
+# deux exports homonymes de clients différents ne se remplacent pas, et un même fichier a
+# la même source depuis les pages et depuis le contrôle en lot.
+#
+# Dans les pages Streamlit, l'option « Comparer aux fichiers déjà contrôlés » utilise
+# l'index CONTROLE_INDEX (ou CHEMIN_INDEX_DEFAUT), commun aux sessions et au contrôle en lot :
+# la page consulte l'index à chaque contrôle mais n'y enregistre le fichier qu'à son export,
+# une fois les corrections validées.
+#
+# Un fichier recontrôlé (même source) remplace ses propres entrées et ne se signale pas
+# lui-même ; seuls ses groupes non KO sont enregistrés. Sans source, ou avec
+# enregistrer=False, l'index est seulement consulté. Doublons et trous sont des
+# avertissements : ils ne rendent pas un groupe KO.
+
+VARIABLE_INDEX = "CONTROLE_INDEX"
+CHEMIN_INDEX_DEFAUT = os.environ.get(
+    VARIABLE_INDEX, os.path.join(os.path.expanduser("~"), ".cache", "myagency", "index_historique.sqlite")
+)
+MAX_TROUS_LOGS = 20
+
+# (colonne clé, colonne compte, compte de contrepartie, colonne tiers, colonne date,
+#  montant positif, montant négatif)
+COLONNES = {
+    "achats": ("n° de piece", "Compte Généraux", "401000", "Compte Tiers", "Date Facture", "Crédit (€)", "Débit(€)"),
+    "ventes": ("Numéro de facture", "Compte général", "411000", "Compte tiers", "Date de facture", "Débit", "Crédit"),
+}
+LIBELLES = {"achats": "Pièce", "ventes": "Facture"}
+
+
+def source_fichier(nom: str, contenu: bytes) -> str:
+    return f"{os.path.basename(nom)} #{hashlib.sha256(contenu).hexdigest()[:16]}"
+
+
+def _decouper(numeros: pd.Series) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    # Préfixe, rang et nombre de chiffres du rang ; rang manquant si le n° ne finit pas par un nombre
+    parties = numeros.astype(str).str.extract(r"^(.*?)(\d+)$")
+    return parties[0], pd.to_numeric(parties[1]), parties[1].str.len()
+
+
+def resume_groupes(journal: str, df: pd.DataFrame) -> pd.DataFrame:
+    # Une ligne par groupe, prise sur sa ligne 401000 / 411000 (sa première ligne à défaut)
+    cle, compte, contrepartie, tiers, date, positif, negatif = COLONNES[journal]
+    ctx = Contexte(df, cle)
+    est_contrepartie = par_valeurs_uniques(
+        df[compte], lambda v: v.astype(str).str.strip() == contrepartie, bool
+    ).to_numpy()
+    pos = ctx.premiere(est_contrepartie)
+    trouvee = pos >= 0
+    pos = np.where(trouvee, pos, ctx.premiere())
+
+    montants = centimes(df[positif].fillna(0)) - centimes(df[negatif].fillna(0))
+    valeurs_tiers = df[tiers].to_numpy(dtype=object)[pos]
+    valeurs_date = df[date].to_numpy(dtype=object)[pos]
+    return pd.DataFrame({
+        "numero": pd.Index(ctx.groupes).astype(str),
+        "date": [None if pd.isna(d) else str(d) for d in valeurs_date],
+        "tiers": np.where(trouvee & ~pd.isna(valeurs_tiers), valeurs_tiers, "").astype(str),
+        "montant": np.where(trouvee, montants[pos], 0),
+    })
+
+
+class IndexHistorique:
+    def __init__(self, chemin: str = CHEMIN_INDEX_DEFAUT):
+        self.chemin = chemin
+        os.makedirs(os.path.dirname(os.path.abspath(chemin)), exist_ok=True)
+        with closing(self._connexion()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS groupes ("
+                " journal TEXT NOT NULL, numero TEXT NOT NULL, source TEXT NOT NULL,"
+                " prefixe TEXT, rang INTEGER, largeur INTEGER, date TEXT, tiers TEXT,"
+                " montant INTEGER NOT NULL, enregistre TEXT NOT NULL,"
+                " PRIMARY KEY (journal, numero, source))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS groupes_rang ON groupes (journal, prefixe, rang)")
+            conn.execute("CREATE INDEX IF NOT EXISTS groupes_source ON groupes (journal, source)")
+
+    def _connexion(self) -> sqlite3.Connection:
+        # Une connexion par appel : l'index est partagé entre threads et processus. Journal
+        # WAL : les lectures des autres processus ne bloquent pas un enregistrement
+        conn = sqlite3.connect(self.chemin, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def enregistrer(self, journal: str, resume: pd.DataFrame, source: str) -> int:
+        prefixes, rangs, largeurs = _decouper(resume["numero"])
+        enregistre = datetime.now().isoformat(timespec="seconds")
+        # Colonnes converties en listes Python d'un bloc (sqlite3 ne connaît pas np.int64)
+        lignes = list(zip(
+            [journal] * len(resume), resume["numero"].tolist(), [source] * len(resume),
+            prefixes.astype(object).where(prefixes.notna(), None).tolist(),
+            rangs.astype("Int64").astype(object).where(rangs.notna(), None).tolist(),
+            largeurs.astype("Int64").astype(object).where(largeurs.notna(), None).tolist(),
+            resume["date"].tolist(), resume["tiers"].tolist(),
+            resume["montant"].astype(np.int64).tolist(), [enregistre] * len(resume),
+        ))
+        with closing(self._connexion()) as conn, conn:
+            conn.execute("DELETE FROM groupes WHERE journal = ? AND source = ?", (journal, source))
+            conn.executemany("INSERT OR REPLACE INTO groupes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", lignes)
+        return len(lignes)
+
+    def doublons(self, journal: str, numeros: Iterable[str], source: Optional[str] = None) -> pd.DataFrame:
+        # Groupes de numeros déjà enregistrés par une autre source (recherche groupée par jointure)
+        with closing(self._connexion()) as conn:
+            conn.execute("CREATE TEMP TABLE demandes (numero TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO demandes VALUES (?)", ((str(n),) for n in numeros))
+            lignes = conn.execute(
+                "SELECT g.numero, g.source, g.date, g.tiers, g.montant FROM groupes g"
+                " JOIN demandes d ON g.numero = d.numero"
+                " WHERE g.journal = ? AND g.source != ? ORDER BY g.numero, g.enregistre",
+                (journal, source or ""),
+            ).fetchall()
+        return pd.DataFrame(lignes, columns=["numero", "source", "date", "tiers", "montant"])
+
+    def trous(self, journal: str, numeros: Sequence[str], source: Optional[str] = None) -> List[Tuple[str, str]]:
+        # Plages de rangs manquants (premier, dernier n° manquant) autour des numeros : entre
+        # le dernier rang déjà enregistré sous le préfixe et le plus grand rang des numeros
+        prefixes, rangs, largeurs = _decouper(pd.Series(list(numeros), dtype=object))
+        numerotes = pd.DataFrame({"prefixe": prefixes, "rang": rangs, "largeur": largeurs}).dropna()
+        trous: List[Tuple[str, str]] = []
+        with closing(self._connexion()) as conn:
+            for prefixe, groupe in numerotes.groupby("prefixe", sort=True):
+                debut, fin = int(groupe["rang"].min()), int(groupe["rang"].max())
+                precedent = conn.execute(
+                    "SELECT MAX(rang) FROM groupes WHERE journal = ? AND prefixe = ? AND rang < ? AND source != ?",
+                    (journal, prefixe, debut, source or ""),
+                ).fetchone()[0]
+                connus = [r for (r,) in conn.execute(
+                    "SELECT rang FROM groupes WHERE journal = ? AND prefixe = ? AND rang BETWEEN ? AND ? AND source != ?",
+                    (journal, prefixe, debut, fin, source or ""),
+                )]
+                presents = np.unique(np.concatenate([
+                    groupe["rang"].to_numpy(dtype=np.int64),
+                    np.asarray(connus, dtype=np.int64),
+                    np.asarray([] if precedent is None else [precedent], dtype=np.int64),
+                ]))
+                largeur = int(groupe.loc[groupe["rang"].idxmin(), "largeur"])
+                ecarts = np.flatnonzero(np.diff(presents) > 1)
+                for i in ecarts:
+                    premier, dernier = presents[i] + 1, presents[i + 1] - 1
+                    trous.append((f"{prefixe}{premier:0{largeur}d}", f"{prefixe}{dernier:0{largeur}d}"))
+        return trous
+
+
+def index_actif() -> Optional[IndexHistorique]:
+    # Index désigné par CONTROLE_INDEX (contrôle en lot : transmis aux processus du pool)
+    chemin = os.environ.get(VARIABLE_INDEX)
+    return IndexHistorique(chemin) if chemin else None
+
+
+def controler_historique(
+    index: IndexHistorique,
+    journal: str,
+    df: pd.DataFrame,
+    source: Optional[str] = None,
+    ko: Iterable[str] = (),
+    enregistrer: bool = True,
+) -> List[str]:
+    return controler_resume(index, journal, resume_groupes(journal, df), source, ko, enregistrer)
+
+
+def controler_resume(
+    index: IndexHistorique,
+    journal: str,
+    resume: pd.DataFrame,
+    source: Optional[str] = None,
+    ko: Iterable[str] = (),
+    enregistrer: bool = True,
+) -> List[str]:
+    # Logs des doublons et trous de numérotation, puis enregistrement des groupes non KO
+    # (resume : cf. resume_groupes, calculé là où est le tableau)
+    libelle = LIBELLES[journal]
+    logs: List[str] = []
+
+    for d in index.doublons(journal, resume["numero"], source).itertuples(index=False):
+        logs.append(
+            f"⚠️ {libelle} {d.numero} déjà comptabilisée dans {d.source} "
+            f"(date {d.date}, tiers {d.tiers or '—'}, montant {d.montant / 100:.2f})"
+        )
+    trous = index.trous(journal, resume["numero"], source)
+    for premier, dernier in trous[:MAX_TROUS_LOGS]:
+        logs.append(f"⚠️ Numérotation : {premier} manquant" if premier == dernier
+                    else f"⚠️ Numérotation : {premier} à {dernier} manquants")
+    if len(trous) > MAX_TROUS_LOGS:
+        logs.append(f"⚠️ Numérotation : {len(trous) - MAX_TROUS_LOGS} autre(s) trou(s)")
+
+    if source and enregistrer:
+        enregistrer_resume(index, journal, resume, source, ko)
+    return logs
+
+
+def enregistrer_resume(index: IndexHistorique, journal: str, resume: pd.DataFrame, source: str,
+                       ko: Iterable[str] = ()) -> int:
+    ko = {str(k) for k in ko}
+    return index.enregistrer(journal, resume[~resume["numero"].isin(ko)], source)
+
+
+def afficher_historique(index: IndexHistorique, journal: str, df: pd.DataFrame, source: str, ko: Iterable[str], cle) -> None:
+    # Pages Streamlit : doublons et trous par rapport aux fichiers déjà contrôlés, recalculés
+    # seulement quand cle (empreinte du contrôle, source) change ; rien n'est enregistré ici
+    import streamlit as st
+
+    etat = f"historique_{journal}"
+    if st.session_state.get(etat, (None, []))[0] != cle:
+        st.session_state[etat] = (cle, controler_historique(index, journal, df, source, ko, enregistrer=False))
+    logs = st.session_state[etat][1]
+    with st.expander(f"🗂️ Historique ({len(logs)} alerte(s))", expanded=bool(logs)):
+        if logs:
+            st.code("\n".join(logs), language="text")
+        else:
+            st.caption("Aucun doublon ni trou de numérotation par rapport aux fichiers déjà contrôlés.")
+
+
+def enregistrer_historique(index: IndexHistorique, journal: str, df: pd.DataFrame, source: str) -> None:
+    # Pages Streamlit : appelé à l'export, quand plus aucun groupe n'est KO
+    import streamlit as st
+
+    nb = enregistrer_resume(index, journal, resume_groupes(journal, df), source)
+    st.success(f"🗂️ {nb} {LIBELLES[journal].lower()}(s) ajoutée(s) à l'historique.")
@@ -0,0 +1,257 @@
+import importlib.util
+import os
+import re
+import zipfile
+from io import BytesIO, StringIO
+from typing import IO, Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# Lecture des classeurs xlsx par moteurs interchangeables, tous avec la même convention que
+# pandas.read_excel : header_row est l'indice (à partir de 0) de la ligne d'en-tête, les
+# lignes vides au milieu du tableau restent des lignes de NaN, les lignes vides finales
+# sont ignorées, les cellules « NA », « nan »… sont des manquants.
+#
+# - calamine : lecteur Rust (pandas engine="calamine", paquet python-calamine), le plus
+#   rapide, utilisé dès qu'il est installé ;
+# - openpyxl : lecture read-only ligne à ligne, sans la couche TextParser de read_excel ;
+#   seules les colonnes demandées sont converties ;
+# - xlsx2csv : conversion en flux vers un CSV relu par read_csv ; plus rapide qu'openpyxl
+#   sur les gros classeurs sans dates (les dates y sont reformatées cellule par cellule).
+#
+# Le moteur est choisi d'après le classeur (taille de la feuille décompressée, présence de
+# formats de date dans styles.xml) sans le lire ; CONTROLE_MOTEUR_EXCEL en impose un. Si
+# le moteur choisi échoue, les suivants sont essayés (avertir reçoit le message).
+#
+#   df = lire_excel(uploaded, header_row=1, colonnes=["n° de piece", "Débit(€)"], types={"n° de piece": str})
+
+VARIABLE_MOTEUR = "CONTROLE_MOTEUR_EXCEL"
+CALAMINE = "calamine"
+OPENPYXL = "openpyxl"
+XLSX2CSV = "xlsx2csv"
+SEUIL_XLSX2CSV = 4 * 1024 ** 2  # octets de XML de la feuille, décompressés
+# À incrémenter à chaque changement du résultat d'un moteur : invalide les lectures en cache
+LECTEUR_VERSION = "1"
+
+# Formats de date intégrés d'Excel (numFmtId) ; les formats personnalisés sont reconnus à
+# leurs lettres j/m/a/h (« dd/mm/yyyy », « yyyy-mm-dd hh:mm »)
+_FORMATS_DATE = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47}
+_FORMAT_DATE_PERSO = re.compile(r"[dmyhs]", re.IGNORECASE)
+_ISO = "%Y-%m-%dT%H:%M:%S"
+_MOTIF_ISO = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$"
+_MANQUANTS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+Source = Union[str, bytes, IO[bytes]]
+
+
+def _contenu(source: Source) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    source.seek(0)
+    data = source.read()
+    source.seek(0)
+    return data
+
+
+def moteurs_disponibles() -> List[str]:
+    moteurs = [OPENPYXL, XLSX2CSV]
+    if importlib.util.find_spec("python_calamine") is not None:
+        moteurs.insert(0, CALAMINE)
+    return moteurs
+
+
+def _premiere_feuille(archive: zipfile.ZipFile) -> str:
+    noms = sorted(n for n in archive.namelist() if re.match(r"xl/worksheets/sheet\d+\.xml$", n))
+    return "xl/worksheets/sheet1.xml" if "xl/worksheets/sheet1.xml" in noms else noms[0]
+
+
+def _a_des_dates(archive: zipfile.ZipFile) -> bool:
+    # Un style de cellule au format date suffit : styles.xml est petit, la feuille n'est pas lue
+    try:
+        styles = archive.read("xl/styles.xml").decode("utf-8", "replace")
+    except KeyError:
+        return False
+    perso = {
+        int(i) for i, code in re.findall(r'<numFmt [^>]*numFmtId="(\d+)"[^>]*formatCode="([^"]*)"', styles)
+        if _FORMAT_DATE_PERSO.search(re.sub(r'"[^"]*"|\[[^\]]*\]', "", code))
+    }
+    xfs = re.search(r"<cellXfs[^>]*>(.*?)</cellXfs>", styles, re.S)
+    ids = {int(i) for i in re.findall(r'numFmtId="(\d+)"', xfs.group(1))} if xfs else set()
+    return bool(ids & (_FORMATS_DATE | perso))
+
+
+def choisir_moteur(contenu: bytes) -> List[str]:
+    # Moteurs par ordre de préférence pour ce classeur (le premier est utilisé)
+    impose = os.environ.get(VARIABLE_MOTEUR, "").strip().lower()
+    disponibles = moteurs_disponibles()
+    if impose in disponibles:
+        return [impose] + [m for m in disponibles if m != impose]
+    if CALAMINE in disponibles:
+        return disponibles
+    try:
+        with zipfile.ZipFile(BytesIO(contenu)) as archive:
+            taille = archive.getinfo(_premiere_feuille(archive)).file_size
+            dates = _a_des_dates(archive)
+    except (zipfile.BadZipFile, KeyError, IndexError):
+        # Pas un xlsx lisible en zip : openpyxl donnera le message d'erreur
+        return [OPENPYXL]
+    if taille >= SEUIL_XLSX2CSV and not dates:
+        return [XLSX2CSV, OPENPYXL]
+    return [OPENPYXL, XLSX2CSV]
+
+
+def parametres_cache(source: Source) -> Dict[str, str]:
+    # Paramètres à ajouter à la clé du cache de lecture (cf. cache_lecture) : un DataFrame lu
+    # par un autre moteur ou une autre version du lecteur n'est pas resservi
+    return {"version": LECTEUR_VERSION, "moteur": choisir_moteur(_contenu(source))[0]}
+
+
+def _noms_colonnes(entete: Sequence) -> List:
+    # Comme read_excel : « Unnamed: i » pour un en-tête vide, « A.1 » pour un doublon
+    noms, vus = [], {}
+    for i, nom in enumerate(entete):
+        nom = f"Unnamed: {i}" if nom is None or nom == "" else nom
+        if nom in vus:
+            vus[nom] += 1
+            nom = f"{nom}.{vus[nom]}"
+        vus.setdefault(nom, 0)
+        noms.append(nom)
+    return noms
+
+
+def _inferer(serie: pd.Series) -> pd.Series:
+    # Conversions de read_excel sur une colonne d'objets : flottants entiers → int, textes
+    # manquants (« NA »…) → NaN, colonne entièrement numérique → nombres
+    if serie.dtype == float:
+        valeurs = serie.to_numpy()
+        if not np.isnan(valeurs).any() and (valeurs == np.round(valeurs)).all():
+            return serie.astype(np.int64)
+        return serie
+    if serie.dtype != object:
+        return serie
+    valeurs = serie.to_numpy(dtype=object).copy()
+    textes = np.frompyfunc(lambda v: isinstance(v, str), 1, 1)(valeurs).astype(bool)
+    if textes.any():
+        valeurs[textes] = np.where(pd.Index(valeurs[textes]).isin(_MANQUANTS), np.nan, valeurs[textes])
+    flottants = np.frompyfunc(lambda v: isinstance(v, float) and v.is_integer(), 1, 1)(valeurs).astype(bool)
+    if flottants.any():
+        valeurs[flottants] = [int(v) for v in valeurs[flottants]]
+    serie = pd.Series(valeurs, index=serie.index, name=serie.name)
+    try:
+        return pd.to_numeric(serie)
+    except (ValueError, TypeError):
+        return serie.infer_objects()
+
+
+def _appliquer_types(df: pd.DataFrame, types: Optional[Dict[str, object]]) -> pd.DataFrame:
+    for colonne, dtype in (types or {}).items():
+        if colonne in df.columns:
+            if dtype is str:
+                df[colonne] = df[colonne].astype(object).where(df[colonne].isna(), df[colonne].astype(str))
+            else:
+                df[colonne] = df[colonne].astype(dtype)
+    return df
+
+
+def _rogner(df: pd.DataFrame) -> pd.DataFrame:
+    # Lignes entièrement vides en fin de feuille ignorées, comme read_excel
+    remplies = np.flatnonzero(df.notna().any(axis=1).to_numpy())
+    return df.iloc[:remplies[-1] + 1] if len(remplies) else df.iloc[:0]
+
+
+def _lire_openpyxl(contenu: bytes, header_row: int, colonnes: Optional[Sequence[str]], types) -> pd.DataFrame:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(BytesIO(contenu), read_only=True, data_only=True)
+    try:
+        lignes = wb.active.iter_rows(min_row=header_row + 1, values_only=True)
+        entete = list(next(lignes, ()))
+        while entete and entete[-1] is None:
+            entete.pop()
+        noms = _noms_colonnes(entete)
+        positions = [i for i, n in enumerate(noms) if colonnes is None or n in colonnes]
+        largeur = len(noms)
+        if len(positions) == largeur:
+            donnees = [v[:largeur] if len(v) >= largeur else v + (None,) * (largeur - len(v)) for v in lignes]
+        else:
+            donnees = [tuple(v[i] if i < len(v) else None for i in positions) for v in lignes]
+    finally:
+        wb.close()
+    df = pd.DataFrame(donnees, columns=[noms[i] for i in positions])
+    df = _rogner(df)
+    for colonne in df.columns:
+        df[colonne] = _inferer(df[colonne])
+    return _appliquer_types(df, types)
+
+
+def _lire_xlsx2csv(contenu: bytes, header_row: int, colonnes: Optional[Sequence[str]], types) -> pd.DataFrame:
+    from xlsx2csv import Xlsx2csv
+
+    tampon = StringIO()
+    Xlsx2csv(BytesIO(contenu), outputencoding="utf-8", dateformat=_ISO).convert(tampon)
+    tampon.seek(0)
+    df = pd.read_csv(
+        tampon,
+        skiprows=header_row,
+        header=0,
+        skip_blank_lines=False,
+        usecols=(lambda c: c in colonnes) if colonnes is not None else None,
+        dtype={c: t for c, t in (types or {}).items() if t is not str} or None,
+        low_memory=False,
+    )
+    df = _rogner(df)
+    # Dates écrites en ISO par xlsx2csv : reconverties si toute la colonne en est
+    for colonne in df.columns[df.dtypes == object]:
+        valeurs = df[colonne].dropna()
+        if len(valeurs) and valeurs.map(type).eq(str).all() and valeurs.str.match(_MOTIF_ISO).all():
+            df[colonne] = pd.to_datetime(df[colonne], format=_ISO)
+    return _appliquer_types(df, {c: t for c, t in (types or {}).items() if t is str})
+
+
+def _lire_calamine(contenu: bytes, header_row: int, colonnes: Optional[Sequence[str]], types) -> pd.DataFrame:
+    df = pd.read_excel(
+        BytesIO(contenu),
+        header=header_row,
+        engine=CALAMINE,
+        usecols=(lambda c: c in colonnes) if colonnes is not None else None,
+    )
+    return _appliquer_types(df, types)
+
+
+MOTEURS: Dict[str, Callable[..., pd.DataFrame]] = {
+    CALAMINE: _lire_calamine,
+    OPENPYXL: _lire_openpyxl,
+    XLSX2CSV: _lire_xlsx2csv,
+}
+
+
+def lire_excel(
+    source: Source,
+    header_row: int = 1,
+    colonnes: Optional[Sequence[str]] = None,
+    types: Optional[Dict[str, object]] = None,
+    moteur: Optional[str] = None,
+    avertir: Optional[Callable[[str], None]] = None,
+) -> pd.DataFrame:
+    # colonnes : seules colonnes lues (les absentes sont ignorées) ; types : dtype imposé
+    # par colonne (str : valeurs non manquantes en texte)
+    contenu = _contenu(source)
+    ordre = [moteur] if moteur else choisir_moteur(contenu)
+    colonnes = set(colonnes) if colonnes is not None else None
+    for i, nom in enumerate(ordre):
+        try:
+            return MOTEURS[nom](contenu, header_row, colonnes, types)
+        except Exception as err:
+            if i == len(ordre) - 1:
+                raise
+            if avertir:
+                avertir(f"{nom} a échoué ; utilisation de {ordre[i + 1]} → {err}")
@@ -0,0 +1,260 @@
+import heapq
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+# Instrumentation des contrôles : durée, lignes traitées et pic mémoire de chaque étape,
+# groupes (pièces / factures) les plus lents et compteurs (requêtes HTTP, cache des taux).
+#
+#   with Profil(memoire=True) as profil:
+#       run_checks(df)
+#   profil.to_dict() / profil.to_json(chemin) / profil.to_trace(chemin)
+#
+# Le code instrumenté appelle etape(), groupe() et compter() : sans profil actif dans le
+# contexte courant ces appels ne font rien. Le profil est porté par une ContextVar, chaque
+# session Streamlit (un thread par rerun) a donc le sien ; les pools de threads doivent
+# propager le contexte (contextvars.copy_context) pour que leurs appels soient comptés.
+
+NB_GROUPES_LENTS = 10
+
+_profil_actif: ContextVar[Optional["Profil"]] = ContextVar("profil_actif", default=None)
+
+# tracemalloc est global au processus : lancé par le premier profil mémoire actif (s'il ne
+# tournait pas déjà), arrêté par le dernier ; plusieurs travaux peuvent être profilés à la fois
+_verrou_memoire = threading.Lock()
+_profils_memoire = 0
+_tracemalloc_lance = False
+
+
+class Etape:
+    def __init__(self, nom: str, parent: Optional[str], debut: float, lignes: Optional[int]):
+        self.nom = nom
+        self.parent = parent
+        self.debut = debut
+        self.duree = 0.0
+        self.lignes = lignes
+        self.pic_octets: Optional[int] = None
+        self.thread = threading.get_ident()
+
+    def to_dict(self) -> Dict:
+        return {
+            "etape": self.nom,
+            "parent": self.parent,
+            "duree_s": round(self.duree, 6),
+            "lignes": self.lignes,
+            "pic_mo": None if self.pic_octets is None else round(self.pic_octets / 1024 ** 2, 3),
+        }
+
+
+class Profil:
+    def __init__(self, memoire: bool = False, nb_groupes_lents: int = NB_GROUPES_LENTS):
+        self.memoire = memoire
+        self.nb_groupes_lents = nb_groupes_lents
+        self.etapes: List[Etape] = []
+        self.compteurs: Dict[str, int] = {}
+        self._groupes_lents: List = []  # tas (durée, n°, étape, groupe, lignes)
+        self._pile: List[Etape] = []
+        self._pics: List[int] = []
+        self._origine = time.perf_counter()
+        self._verrou = threading.Lock()
+        self._jeton = None
+
+    # -- activation -------------------------------------------------------------------
+
+    def __enter__(self) -> "Profil":
+        global _profils_memoire, _tracemalloc_lance
+        if self.memoire:
+            with _verrou_memoire:
+                if _profils_memoire == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracemalloc_lance = True
+                _profils_memoire += 1
+        self._jeton = _profil_actif.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _profils_memoire, _tracemalloc_lance
+        _profil_actif.reset(self._jeton)
+        if self.memoire:
+            with _verrou_memoire:
+                _profils_memoire -= 1
+                if _profils_memoire == 0 and _tracemalloc_lance:
+                    tracemalloc.stop()
+                    _tracemalloc_lance = False
+
+    # -- mesures ----------------------------------------------------------------------
+
+    def _suivre_pic(self) -> None:
+        # tracemalloc n'a qu'un pic global : on le reporte sur toutes les étapes ouvertes
+        # avant de le remettre à zéro, pour que les étapes imbriquées aient chacune le leur.
+        # Pas de remise à zéro si un autre profil mémoire est actif (ses étapes perdraient
+        # leur pic) : les pics incluent alors l'activité des autres travaux.
+        if self.memoire and tracemalloc.is_tracing():
+            with _verrou_memoire:
+                pic = tracemalloc.get_traced_memory()[1]
+                if _profils_memoire == 1:
+                    tracemalloc.reset_peak()
+            self._pics = [max(p, pic) for p in self._pics]
+
+    @contextmanager
+    def etape(self, nom: str, lignes: Optional[int] = None) -> Iterator[Etape]:
+        # Les étapes lancées depuis un autre thread que celui du profil ne sont pas
+        # imbriquées ni suivies en mémoire : seule leur durée est gardée.
+        principal = not self._pile or self._pile[-1].thread == threading.get_ident()
+        parent = self._pile[-1].nom if self._pile and principal else None
+        mesure = Etape(nom, parent, time.perf_counter() - self._origine, lignes)
+        if principal:
+            self._suivre_pic()
+            base = tracemalloc.get_traced_memory()[0] if self.memoire and tracemalloc.is_tracing() else None
+            self._pile.append(mesure)
+            self._pics.append(0)
+        try:
+            yield mesure
+        finally:
+            mesure.duree = time.perf_counter() - self._origine - mesure.debut
+            if principal:
+                self._suivre_pic()
+                pic = self._pics.pop()
+                self._pile.pop()
+                if base is not None:
+                    mesure.pic_octets = max(pic - base, 0)
+            with self._verrou:
+                self.etapes.append(mesure)
+
+    def groupe(self, etape: str, cle, duree: float, lignes: int) -> None:
+        with self._verrou:
+            entree = (duree, len(self._groupes_lents), etape, str(cle), lignes)
+            if len(self._groupes_lents) < self.nb_groupes_lents:
+                heapq.heappush(self._groupes_lents, entree)
+            elif duree > self._groupes_lents[0][0]:
+                heapq.heapreplace(self._groupes_lents, entree)
+
+    def compter(self, nom: str, n: int = 1) -> None:
+        with self._verrou:
+            self.compteurs[nom] = self.compteurs.get(nom, 0) + n
+
+    def etape_en_cours(self) -> Optional[str]:
+        # Étape ouverte la plus imbriquée (suivi d'avancement depuis un autre thread)
+        pile = list(self._pile)
+        return pile[-1].nom if pile else None
+
+    # -- exports ----------------------------------------------------------------------
+
+    def groupes_lents(self) -> List[Dict]:
+        return [
+            {"etape": etape, "groupe": cle, "duree_s": round(duree, 6), "lignes": lignes}
+            for duree, _, etape, cle, lignes in sorted(self._groupes_lents, reverse=True)
+        ]
+
+    def to_dict(self) -> Dict:
+        etapes = sorted(self.etapes, key=lambda e: e.debut)
+        return {
+            "etapes": [e.to_dict() for e in etapes],
+            "groupes_lents": self.groupes_lents(),
+            "compteurs": dict(self.compteurs),
+        }
+
+    def to_json(self, chemin: Optional[str] = None) -> str:
+        texte = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        if chemin:
+            with open(chemin, "w", encoding="utf-8") as f:
+                f.write(texte)
+        return texte
+
+    def to_trace(self, chemin: Optional[str] = None) -> str:
+        # Format « Trace Event » de Chrome : s'ouvre dans chrome://tracing ou Perfetto
+        evenements = [
+            {
+                "name": e.nom,
+                "ph": "X",
+                "ts": round(e.debut * 1e6, 1),
+                "dur": round(e.duree * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": e.thread,
+                "args": {k: v for k, v in e.to_dict().items() if k in ("lignes", "pic_mo") and v is not None},
+            }
+            for e in sorted(self.etapes, key=lambda e: e.debut)
+        ]
+        evenements += [
+            {"name": nom, "ph": "C", "ts": 0, "pid": os.getpid(), "args": {nom: n}}
+            for nom, n in self.compteurs.items()
+        ]
+        texte = json.dumps({"traceEvents": evenements, "displayTimeUnit": "ms"}, ensure_ascii=False)
+        if chemin:
+            with open(chemin, "w", encoding="utf-8") as f:
+                f.write(texte)
+        return texte
+
+    def logs(self) -> List[str]:
+        lignes = ["⏱️ Performance :"]
+        for e in sorted(self.etapes, key=lambda e: e.debut):
+            details = [f"{e.duree:.3f}s"]
+            if e.lignes is not None:
+                details.append(f"{e.lignes} lignes")
+            if e.pic_octets is not None:
+                details.append(f"{e.pic_octets / 1024 ** 2:.1f} Mo")
+            retrait = "      " if e.parent else "   "
+            lignes.append(f"{retrait}{e.nom} : {', '.join(details)}")
+        for g in self.groupes_lents():
+            lignes.append(f"   🐢 {g['etape']} {g['groupe']} : {g['duree_s']:.4f}s ({g['lignes']} lignes)")
+        for nom, n in sorted(self.compteurs.items()):
+            lignes.append(f"   🔢 {nom} : {n}")
+        return lignes
+
+
+def profil_actif() -> Optional[Profil]:
+    return _profil_actif.get()
+
+
+@contextmanager
+def etape(nom: str, lignes: Optional[int] = None) -> Iterator[Optional[Etape]]:
+    profil = _profil_actif.get()
+    if profil is None:
+        yield None
+        return
+    with profil.etape(nom, lignes) as mesure:
+        yield mesure
+
+
+def groupe(etape: str, cle, duree: float, lignes: int) -> None:
+    profil = _profil_actif.get()
+    if profil is not None:
+        profil.groupe(etape, cle, duree, lignes)
+
+
+def compter(nom: str, n: int = 1) -> None:
+    profil = _profil_actif.get()
+    if profil is not None:
+        profil.compter(nom, n)
+
+
+def afficher_performance(profil: Profil, cle: str = "perf", titre: str = "⏱️ Performance") -> None:
+    # Panneau « Performance » des pages Streamlit
+    import pandas as pd
+    import streamlit as st
+
+    with st.expander(titre, expanded=True):
+        donnees = profil.to_dict()
+        if not donnees["etapes"]:
+            st.caption("Aucune étape mesurée sur ce rerun (résultat déjà en cache).")
+            return
+        st.dataframe(pd.DataFrame(donnees["etapes"]), hide_index=True)
+        if donnees["groupes_lents"]:
+            st.markdown("**Groupes les plus lents**")
+            st.dataframe(pd.DataFrame(donnees["groupes_lents"]), hide_index=True)
+        if donnees["compteurs"]:
+            st.markdown("**Compteurs**")
+            st.json(donnees["compteurs"])
+        col_json, col_trace = st.columns(2)
+        col_json.download_button(
+            "📥 Profil JSON", profil.to_json(), "profil.json", mime="application/json", key=f"{cle}_json"
+        )
+        col_trace.download_button(
+            "📥 Trace (chrome://tracing)", profil.to_trace(), "profil_trace.json",
+            mime="application/json", key=f"{cle}_trace",
+        )
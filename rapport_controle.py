@@ -0,0 +1,172 @@
+import math
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from regles import AVERTISSEMENT, BLOQUANTE
+
+# Résultat d'un contrôle sous forme de constats structurés : une ligne par constat (pièce ou
+# facture, code de règle, sévérité, message, index des lignes en cause, correction
+# appliquée). Les pages Streamlit affichent ces constats filtrés et paginés ; le log texte
+# historique (emoji par ligne) n'est produit que si on le demande, puis gardé.
+#
+# Aux sévérités des règles (cf. regles) s'ajoutent celles des opérations faites pendant le
+# contrôle : correction automatique, suppression de ligne vide, information (avoir, devise).
+
+CORRECTION = "correction"
+SUPPRESSION = "suppression"
+INFO = "info"
+SEVERITES = [BLOQUANTE, AVERTISSEMENT, CORRECTION, SUPPRESSION, INFO]
+
+COLONNES = ["groupe", "regle", "severite", "message", "lignes", "correction"]
+TAILLE_PAGE = 100
+
+# Ligne de constat : (groupe, règle, sévérité, message, lignes, correction)
+LigneConstat = Tuple[str, str, str, str, tuple, Optional[str]]
+
+
+def _constats_piece(resultat: achats.ResultatAchat) -> List[LigneConstat]:
+    # Même ordre que logs_piece
+    npiece, err, corr, is_avoir, lignes_vides = resultat
+    lignes: List[LigneConstat] = []
+    for c in corr:
+        lignes.append((npiece, "CORRECTION_401", CORRECTION, c, (), c.split(" : ", 1)[-1]))
+    if is_avoir:
+        lignes.append((npiece, "AVOIR", INFO, f"Achat {npiece} détecté comme AVOIR", (), None))
+    for c in err:
+        lignes.append((npiece, c.code, c.severite, c.message, c.lignes, None))
+    for idx, compte in lignes_vides:
+        lignes.append((npiece, "LIGNE_VIDE", SUPPRESSION, f"Ligne vide (Compte {compte})", (idx,), "ligne supprimée"))
+    return lignes
+
+
+def _constat_conversion(num: str, ligne: str) -> LigneConstat:
+    # Lignes de convert_currencies_par_facture : « 💱 … » conversion appliquée, sinon alerte
+    message = ligne.split(" ", 1)[-1]
+    if ligne.startswith("💱"):
+        return (num, "DEVISE", CORRECTION, message, (), "conversion en EUR")
+    return (num, "DEVISE", AVERTISSEMENT, message, (), None)
+
+
+class Rapport:
+    def __init__(
+        self,
+        journal: str,
+        resultats: Sequence,
+        entete: Sequence[str] = (),
+        pied: Sequence[str] = (),
+        conversions: Sequence[Tuple[str, str]] = (),
+    ):
+        # resultats : ResultatAchat ou ResultatVente dans l'ordre du fichier ; conversions :
+        # (n° de facture, ligne de log) des devises, rendues avant les factures
+        self.journal = journal
+        self.resultats = list(resultats)
+        self.entete = list(entete)
+        self.pied = list(pied)
+        self.conversions = list(conversions)
+        if journal == "achats":
+            self.ko = [r[0] for r in self.resultats if achats.piece_ko(r)]
+        else:
+            self.ko = [num for num, erreurs in self.resultats if ventes.facture_ko(erreurs)]
+        self._logs: Optional[List[str]] = None
+        self._constats: Optional[pd.DataFrame] = None
+
+    def logs(self) -> List[str]:
+        if self._logs is None:
+            logs = list(self.entete)
+            if self.journal == "achats":
+                for resultat in self.resultats:
+                    logs.extend(achats.logs_piece(resultat)[0])
+            else:
+                logs.extend(ligne for _, ligne in self.conversions)
+                for num, erreurs in self.resultats:
+                    logs.extend(ventes.logs_facture(num, erreurs))
+            self._logs = logs + self.pied
+        return self._logs
+
+    def constats(self) -> pd.DataFrame:
+        if self._constats is None:
+            lignes: List[LigneConstat] = []
+            if self.journal == "achats":
+                for resultat in self.resultats:
+                    lignes.extend(_constats_piece(resultat))
+            else:
+                lignes.extend(_constat_conversion(num, ligne) for num, ligne in self.conversions)
+                for num, erreurs in self.resultats:
+                    lignes.extend((num, c.code, c.severite, c.message, c.lignes, None) for c in erreurs)
+            constats = pd.DataFrame(lignes, columns=COLONNES)
+            constats["regle"] = constats["regle"].astype("category")
+            constats["severite"] = pd.Categorical(constats["severite"], categories=SEVERITES)
+            self._constats = constats
+        return self._constats
+
+    def taille(self) -> int:
+        # Estimation pour la limite du cache des contrôles (cf. cache_controles)
+        taille = 64 * len(self.resultats) + sum(len(l) for _, l in self.conversions)
+        for resultat in self.resultats:
+            taille += sum(len(c.message) + 8 * len(c.lignes) for c in resultat[1])
+        if self._logs is not None:
+            taille += sum(len(l) for l in self._logs)
+        if self._constats is not None:
+            taille += int(self._constats.memory_usage(deep=True).sum())
+        return taille
+
+
+def filtrer(
+    constats: pd.DataFrame,
+    severites: Sequence[str] = (),
+    regles: Sequence[str] = (),
+    recherche: str = "",
+    groupes: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    masque = np.ones(len(constats), dtype=bool)
+    if severites:
+        masque &= constats["severite"].isin(severites).to_numpy()
+    if regles:
+        masque &= constats["regle"].isin(regles).to_numpy()
+    if recherche:
+        masque &= constats["groupe"].astype(str).str.contains(recherche, case=False, regex=False).to_numpy()
+    if groupes is not None:
+        masque &= constats["groupe"].isin(groupes).to_numpy()
+    return constats[masque]
+
+
+def afficher_constats(rapport: Rapport, cle: str, pied: Sequence[str] = ()) -> None:
+    # Constats filtrables et paginés ; le log texte n'est construit qu'à l'ouverture
+    import streamlit as st
+
+    constats = rapport.constats()
+    groupe = "Pièces" if rapport.journal == "achats" else "Factures"
+    col_nb, col_ko, col_constats = st.columns(3)
+    col_nb.metric(f"{groupe} contrôlées", len(rapport.resultats))
+    col_ko.metric(f"{groupe} KO", len(rapport.ko))
+    col_constats.metric("Constats", len(constats))
+
+    col_sev, col_regle = st.columns(2)
+    severites = col_sev.multiselect(
+        "Sévérité", [s for s in SEVERITES if (constats["severite"] == s).any()], key=f"{cle}_severites"
+    )
+    regles = col_regle.multiselect("Règle", sorted(constats["regle"].cat.categories), key=f"{cle}_regles")
+    col_recherche, col_ko_seuls = st.columns(2)
+    recherche = col_recherche.text_input(f"N° de {groupe.lower()[:-1]}", key=f"{cle}_recherche")
+    ko_seuls = col_ko_seuls.checkbox(f"{groupe} KO uniquement", key=f"{cle}_ko")
+
+    vue = filtrer(constats, severites, regles, recherche.strip(), rapport.ko if ko_seuls else None)
+    nb_pages = max(1, math.ceil(len(vue) / TAILLE_PAGE))
+    page = st.number_input("Page", 1, nb_pages, 1, key=f"{cle}_page") if nb_pages > 1 else 1
+    extrait = vue.iloc[(page - 1) * TAILLE_PAGE:page * TAILLE_PAGE]
+    st.dataframe(
+        extrait.assign(lignes=extrait["lignes"].map(lambda l: ", ".join(map(str, l)))),
+        hide_index=True,
+    )
+    st.caption(f"{len(vue)} constat(s) — page {page}/{nb_pages}")
+
+    if st.toggle("📝 Logs texte", key=f"{cle}_logs"):
+        texte = "\n".join(rapport.logs() + list(pied))
+        st.code(texte, language="text")
+        st.download_button(
+            "📥 Télécharger les logs", texte, f"logs_{rapport.journal}.txt", mime="text/plain", key=f"{cle}_logs_txt"
+        )
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from schema_journal import par_valeurs_uniques
+
+# Règles de contrôle déclaratives. Chaque règle est déclarée une fois : sa portée, son
+# prédicat (vrai = anomalie) et son message. Les constats sont toujours rendus par groupe
+# (pièce / facture) ; la portée dit ce que le prédicat regarde :
+# - ligne : un masque par ligne, le groupe est en erreur si une de ses lignes l'est ;
+# - groupe : un masque par groupe, calculé sur les seules lignes du groupe ;
+# - fichier : un masque par groupe qui dépend du reste du fichier (doublons, ordre des
+#   lignes…) ; un tel groupe ne peut pas être recontrôlé seul (validation incrémentale).
+#
+# Un jeu de règles évalue toutes les règles actives sur un même Contexte, où le tableau
+# n'est découpé en groupes qu'une fois et où les colonnes dérivées (lignes 401000 / 411000,
+# sommes…) sont calculées par le journal avant l'évaluation : un seul passage colonnaire
+# par journal, quel que soit le nombre de règles.
+#
+# Les jeux propres à un client se décrivent en JSON, sans toucher au code :
+#
+#   {
+#     "nom": "Client X",
+#     "achats": {"desactiver": ["AC_DATE"], "parametres": {"annee": 2026,
+#                "comptes_autorises": ["604110", "604000", "606300", "445660"]},
+#                "severites": {"AC_COMPTES": "bloquante"}},
+#     "ventes": {"desactiver": ["VE_PREMIERE_LIGNE"]}
+#   }
+#
+# Une pièce / facture est KO dès qu'elle a un constat de sévérité bloquante.
+#
+# Le fichier est pris dans la variable d'environnement CONTROLE_REGLES ; sans elle, les
+# règles standard s'appliquent.
+
+LIGNE = "ligne"
+GROUPE = "groupe"
+FICHIER = "fichier"
+PORTEES = (LIGNE, GROUPE, FICHIER)
+
+BLOQUANTE = "bloquante"
+AVERTISSEMENT = "avertissement"
+
+VARIABLE_REGLES = "CONTROLE_REGLES"
+
+# Prédicat : (contexte, paramètres) → masque par ligne ou par groupe selon la portée
+Predicat = Callable[["Contexte", Dict], np.ndarray]
+# Message : gabarit formaté avec les paramètres, ou fonction (contexte, groupe, paramètres)
+Message = Union[str, Callable[["Contexte", int, Dict], str]]
+
+
+class Constat(NamedTuple):
+    code: str
+    severite: str
+    message: str
+    lignes: tuple = ()  # index des lignes en cause, vide si tout le groupe l'est
+
+
+class Contexte:
+    # Tableau découpé en groupes selon la colonne cle (ordre de première apparition, comme
+    # groupby(sort=False)) ; les lignes sans clé n'appartiennent à aucun groupe.
+    def __init__(self, df: pd.DataFrame, cle: str):
+        self.df = df
+        self.codes, self.groupes = pd.factorize(df[cle], sort=False)
+        self.nb = len(self.groupes)
+        self.valides = self.codes >= 0
+        self._ordre: Optional[np.ndarray] = None
+        self._bornes: Optional[np.ndarray] = None
+
+    def derniere(self, masque=None) -> np.ndarray:
+        # Position de la dernière ligne (du masque) de chaque groupe, -1 s'il n'y en a pas
+        masque = self.valides if masque is None else np.asarray(masque, dtype=bool) & self.valides
+        positions = np.flatnonzero(masque)
+        derniere = np.full(self.nb, -1)
+        derniere[self.codes[positions]] = positions
+        return derniere
+
+    def par_groupe(self, masque) -> np.ndarray:
+        # Vrai pour les groupes dont au moins une ligne vérifie le masque
+        return self.compter(masque) > 0
+
+    def compter(self, masque) -> np.ndarray:
+        masque = np.asarray(masque, dtype=bool) & self.valides
+        return np.bincount(self.codes[masque], minlength=self.nb)
+
+    def somme(self, valeurs, masque=None) -> np.ndarray:
+        # Identique bit à bit à Series.sum() sur les lignes du groupe (valeurs manquantes à
+        # 0) : bincount additionne dans l'ordre des lignes, comme numpy sous 8 valeurs ; au-delà
+        # numpy somme par paires, les groupes de 8 lignes ou plus sont donc sommés par numpy.
+        valeurs = np.nan_to_num(np.asarray(valeurs, dtype=float))
+        masque = self.valides if masque is None else np.asarray(masque, dtype=bool) & self.valides
+        codes, valeurs = self.codes[masque], valeurs[masque]
+        sommes = np.bincount(codes, weights=valeurs, minlength=self.nb)
+        grands = np.bincount(codes, minlength=self.nb)[codes] >= 8
+        if grands.any():
+            ordre = np.argsort(codes[grands], kind="stable")
+            codes_g, valeurs_g = codes[grands][ordre], valeurs[grands][ordre]
+            debuts = np.flatnonzero(np.r_[True, codes_g[1:] != codes_g[:-1]])
+            for code, bloc in zip(codes_g[debuts], np.split(valeurs_g, debuts[1:])):
+                sommes[code] = bloc.sum()
+        return sommes
+
+    def premiere(self, masque=None) -> np.ndarray:
+        # Position de la première ligne (du masque) de chaque groupe, -1 s'il n'y en a pas
+        masque = self.valides if masque is None else np.asarray(masque, dtype=bool) & self.valides
+        positions = np.flatnonzero(masque)
+        premiere = np.full(self.nb, -1)
+        premiere[self.codes[positions][::-1]] = positions[::-1]
+        return premiere
+
+    def nb_valeurs(self, colonne: str) -> np.ndarray:
+        # nunique() par groupe, valeurs manquantes exclues
+        valeurs, uniques = pd.factorize(self.df[colonne])
+        garder = self.valides & (valeurs >= 0)
+        base = max(len(uniques), 1)
+        couples = np.unique(self.codes[garder].astype(np.int64) * base + valeurs[garder])
+        return np.bincount(couples // base, minlength=self.nb)
+
+    def par_valeur(self, colonne: str, f: Callable[[pd.Index], pd.Index]) -> np.ndarray:
+        # f appliquée une fois par valeur distincte de la colonne (cf. schema_journal)
+        return par_valeurs_uniques(self.df[colonne], f, bool).to_numpy()
+
+    def lignes(self, g: int) -> np.ndarray:
+        # Positions des lignes du groupe g, pour les messages qui citent ses valeurs
+        if self._ordre is None:
+            self._ordre = np.argsort(np.where(self.valides, self.codes, self.nb), kind="stable")
+            self._bornes = np.searchsorted(self.codes[self._ordre], np.arange(self.nb + 1), side="left")
+        return self._ordre[self._bornes[g]:self._bornes[g + 1]]
+
+
+class Regle:
+    def __init__(
+        self,
+        code: str,
+        portee: str,
+        predicat: Predicat,
+        message: Message,
+        severite: str = AVERTISSEMENT,
+        si: Optional[Callable[["Contexte", Dict], np.ndarray]] = None,
+        cible: Optional[Callable[["Contexte", Dict], np.ndarray]] = None,
+        active: bool = True,
+    ):
+        if portee not in PORTEES:
+            raise ValueError(f"Portée inconnue pour {code} : {portee} (attendu : {', '.join(PORTEES)})")
+        self.code = code
+        self.portee = portee
+        self.predicat = predicat
+        self.message = message
+        self.severite = severite
+        self.si = si  # condition par groupe : la règle ne s'applique qu'aux groupes où elle est vraie
+        self.cible = cible  # règle de groupe : position de la ligne en cause (-1 : aucune)
+        self.active = active
+
+    def evaluer(self, ctx: Contexte, parametres: Dict) -> Tuple[np.ndarray, List[tuple]]:
+        # Groupes en erreur et, pour chacun, l'index des lignes en cause
+        resultat = self.predicat(ctx, parametres)
+        masque = ctx.par_groupe(resultat) if self.portee == LIGNE else np.asarray(resultat, dtype=bool)
+        if self.si is not None:
+            masque = masque & np.asarray(self.si(ctx, parametres), dtype=bool)
+        groupes = np.flatnonzero(masque)
+
+        if self.portee == LIGNE:
+            positions = np.flatnonzero(np.asarray(resultat, dtype=bool) & ctx.valides & masque[np.maximum(ctx.codes, 0)])
+            positions = positions[np.argsort(ctx.codes[positions], kind="stable")]
+            coupures = np.cumsum(np.bincount(ctx.codes[positions], minlength=ctx.nb)[groupes])[:-1]
+            labels = ctx.df.index[positions]
+            return groupes, [tuple(l) for l in np.split(np.asarray(labels, dtype=object), coupures)]
+        if self.cible is not None:
+            positions = np.asarray(self.cible(ctx, parametres))[groupes]
+            return groupes, [(ctx.df.index[p],) if p >= 0 else () for p in positions]
+        return groupes, [()] * len(groupes)
+
+    def texte(self, ctx: Contexte, g: int, parametres: Dict) -> str:
+        if callable(self.message):
+            return self.message(ctx, g, parametres)
+        return self.message.format(**parametres)
+
+
+class Evaluation:
+    def __init__(self, nb: int):
+        self.groupes: List[List[Constat]] = [[] for _ in range(nb)]
+
+
+class JeuRegles:
+    def __init__(self, journal: str, regles: List[Regle], parametres: Dict, version: str = "1", nom: str = "standard"):
+        codes = [r.code for r in regles]
+        doublons = {c for c in codes if codes.count(c) > 1}
+        if doublons:
+            raise ValueError(f"Codes de règle en double : {', '.join(sorted(doublons))}")
+        self.journal = journal
+        self.regles = regles
+        self.parametres = dict(parametres)
+        self.version = version
+        self.nom = nom
+        self.actives = {r.code for r in regles if r.active}
+        self.severites = {r.code: r.severite for r in regles}
+
+    def configurer(self, config: Optional[Dict], nom: Optional[str] = None) -> "JeuRegles":
+        # Copie du jeu avec les règles activées / désactivées et les paramètres surchargés
+        jeu = JeuRegles(self.journal, self.regles, self.parametres, self.version, nom or self.nom)
+        jeu.actives = set(self.actives)
+        jeu.severites = dict(self.severites)
+        if not config:
+            return jeu
+        inconnues = set(config) - {"activer", "desactiver", "parametres", "severites"}
+        if inconnues:
+            raise ValueError(f"Clés inconnues dans le jeu de règles {self.journal} : {', '.join(sorted(inconnues))}")
+        connues = {r.code for r in self.regles}
+        for cle in ("activer", "desactiver", "severites"):
+            inconnues = set(config.get(cle, [])) - connues
+            if inconnues:
+                raise ValueError(f"Règles {self.journal} inconnues : {', '.join(sorted(inconnues))}")
+        inconnus = set(config.get("parametres", {})) - set(self.parametres)
+        if inconnus:
+            raise ValueError(f"Paramètres {self.journal} inconnus : {', '.join(sorted(inconnus))}")
+        jeu.actives |= set(config.get("activer", []))
+        jeu.actives -= set(config.get("desactiver", []))
+        jeu.parametres.update(config.get("parametres", {}))
+        severites = config.get("severites", {})
+        invalides = {s for s in severites.values() if s not in (BLOQUANTE, AVERTISSEMENT)}
+        if invalides:
+            raise ValueError(f"Sévérités inconnues : {', '.join(sorted(invalides))} (attendu : {BLOQUANTE}, {AVERTISSEMENT})")
+        jeu.severites.update(severites)
+        return jeu
+
+    def config(self) -> Dict:
+        # Inverse de configurer() : reconstruit ce jeu à partir du catalogue du journal
+        # (transmission à un autre processus, les prédicats ne se sérialisent pas)
+        codes = {r.code for r in self.regles}
+        return {
+            "activer": sorted(self.actives),
+            "desactiver": sorted(codes - self.actives),
+            "parametres": dict(self.parametres),
+            "severites": dict(self.severites),
+        }
+
+    def portee_fichier(self) -> bool:
+        return any(r.portee == FICHIER and r.code in self.actives for r in self.regles)
+
+    def signature(self) -> str:
+        # Entre dans l'empreinte des résultats mémorisés : changer de jeu invalide le cache
+        contenu = json.dumps(
+            [self.journal, self.version, sorted(self.actives), self.parametres, self.severites],
+            sort_keys=True, default=str, ensure_ascii=False,
+        )
+        return hashlib.sha256(contenu.encode()).hexdigest()[:16]
+
+    def evaluer(self, ctx: Contexte) -> Evaluation:
+        # Constats de chaque groupe dans l'ordre de déclaration des règles
+        evaluation = Evaluation(ctx.nb)
+        if ctx.nb == 0:
+            return evaluation
+        for regle in self.regles:
+            if regle.code not in self.actives:
+                continue
+            severite = self.severites[regle.code]
+            groupes, lignes = regle.evaluer(ctx, self.parametres)
+            for g, index in zip(groupes, lignes):
+                evaluation.groupes[g].append(Constat(regle.code, severite, regle.texte(ctx, g, self.parametres), index))
+        return evaluation
+
+    def constat(self, message: str, severite: str = AVERTISSEMENT) -> Constat:
+        # Constat d'un message produit hors du moteur (boucles historiques) ; les messages
+        # calculés (valeurs citées) n'ont pas de code
+        for regle in self.regles:
+            if not callable(regle.message) and regle.message.format(**self.parametres) == message:
+                return Constat(regle.code, self.severites[regle.code], message)
+        return Constat("", severite, message)
+
+
+_configs: Dict = {}
+_jeux: Dict = {}
+_verrou = threading.Lock()
+
+
+def _cle_config(chemin: Optional[str]) -> Optional[tuple]:
+    chemin = chemin or os.environ.get(VARIABLE_REGLES)
+    if not chemin:
+        return None
+    return os.path.abspath(chemin), os.path.getmtime(chemin)
+
+
+def charger_config(chemin: Optional[str] = None) -> Dict:
+    # Jeu de règles client (JSON), relu seulement quand le fichier change
+    cle = _cle_config(chemin)
+    if cle is None:
+        return {}
+    chemin = cle[0]
+    with _verrou:
+        if cle not in _configs:
+            with open(chemin, encoding="utf-8") as f:
+                _configs[cle] = json.load(f)
+        return _configs[cle]
+
+
+def jeu_client(standard: JeuRegles, chemin: Optional[str] = None) -> JeuRegles:
+    # Jeu configuré gardé tant que le fichier client ne change pas (un jeu n'est jamais
+    # modifié après configurer)
+    cle = (standard.journal, id(standard), _cle_config(chemin))
+    with _verrou:
+        jeu = _jeux.get(cle)
+    if jeu is None:
+        config = charger_config(chemin)
+        jeu = standard.configurer(config.get(standard.journal), config.get("nom"))
+        with _verrou:
+            _jeux[cle] = jeu
+    return jeu
@@ -0,0 +1,96 @@
+import importlib
+import threading
+from typing import TYPE_CHECKING, Optional
+
+import streamlit as st
+
+if TYPE_CHECKING:
+    from index_historique import IndexHistorique
+    from service_controles import ServiceControles
+    from taux_change import RateCache
+
+# Ressources partagées par toutes les sessions d'un serveur Streamlit, créées une seule fois
+# par processus (st.cache_resource) et non à chaque rerun ou à chaque session :
+# - préchargement des modules de contrôle : les pages n'importent pandas, pyarrow et la
+#   logique de contrôle qu'une fois un fichier choisi ; ces imports (≈ 1 s à froid) se font
+#   en tâche de fond pendant que l'utilisateur choisit son fichier ;
+# - cache SQLite des taux de change, ouvert une fois au lieu d'une fois par conversion ;
+# - service de contrôle (cf. service_controles) : file et workers communs à toutes les
+#   sessions ; les pages y soumettent lecture et contrôle puis suivent le travail ;
+# - index des fichiers déjà contrôlés (cf. index_historique).
+#
+# La session HTTP de taux_change est déjà unique par processus et n'importe requests
+# qu'au premier appel ; les jeux de règles compilés sont mémorisés par regles.jeu_client.
+
+MODULES_CONTROLE = [
+    "pandas",
+    "pyarrow",
+    "controle_achats_logic",
+    "controle_ventes_logic",
+    "cache_lecture",
+    "cache_controles",
+    "export_fichiers",
+    "fusion_corrections",
+    "lecture_excel",
+    "rapport_controle",
+    "service_controles",
+    "validation_incrementale",
+]
+
+
+def _importer() -> None:
+    for nom in MODULES_CONTROLE:
+        try:
+            importlib.import_module(nom)
+        except ImportError:
+            # L'import sera retenté (et l'erreur affichée) par la page qui en a besoin
+            pass
+
+
+@st.cache_resource(show_spinner=False)
+def prechauffer() -> threading.Thread:
+    fil = threading.Thread(target=_importer, name="prechauffage", daemon=True)
+    fil.start()
+    return fil
+
+
+@st.cache_resource(show_spinner=False)
+def cache_taux() -> Optional["RateCache"]:
+    from taux_change import default_cache
+
+    return default_cache()
+
+
+@st.cache_resource(show_spinner=False)
+def service_controles() -> "ServiceControles":
+    from service_controles import ServiceControles
+
+    return ServiceControles()
+
+
+@st.cache_resource(show_spinner=False)
+def index_fichiers() -> "IndexHistorique":
+    from index_historique import IndexHistorique
+
+    return IndexHistorique()
+
+
+INTERVALLE_SUIVI = 0.5  # s
+
+
+@st.fragment(run_every=INTERVALLE_SUIVI)
+def suivre_travail(id_travail: int) -> None:
+    # Seul ce fragment est réexécuté pendant le travail ; la page entière l'est à la fin
+    service = service_controles()
+    travail = service.travail(id_travail)
+    if travail is None or travail.termine:
+        st.rerun()
+    position = service.position(travail)
+    if position:
+        st.info(f"⏳ {travail.libelle} : en file d'attente (position {position})")
+        return
+    etape = travail.etape()
+    st.progress(
+        travail.avancement(),
+        text=f"⏳ {travail.libelle} : {etape or 'en cours'} ({travail.duree():.0f} s)",
+    )
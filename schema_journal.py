@@ -0,0 +1,96 @@
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+# Représentation compacte des journaux : les colonnes texte sont normalisées en une passe
+# sur leurs valeurs distinctes (un journal d'un million de lignes n'a que quelques milliers
+# de comptes, dates ou libellés différents), puis stockées en catégories ou en chaînes
+# Arrow plutôt qu'en objets Python. Les montants restent en euros dans le tableau (c'est lui
+# qu'on affiche, corrige et exporte). Les contrôles d'équilibre gardent les sommes en euros
+# et l'arrondi au centime de la boucle historique (cf. Contexte.somme) pour donner les mêmes
+# constats et corrections ; centimes() sert aux montants de l'index historique.
+#
+# Les colonnes modifiables dans les data_editor ne sont pas catégorielles : une catégorie
+# refuse toute valeur qu'elle ne connaît pas encore.
+
+CATEGORIE = "category"
+TEXTE = "string[pyarrow]"
+
+SCHEMA_ACHATS: Dict[str, str] = {
+    "Code journal": CATEGORIE,
+    "Date Facture": CATEGORIE,
+    "Compte Généraux": CATEGORIE,
+    "Analytique": CATEGORIE,
+    "Code": CATEGORIE,
+    "Compte Tiers": TEXTE,
+    "Libelle": TEXTE,
+    "Concierge": TEXTE,
+    "n° de piece": TEXTE,
+}
+SCHEMA_VENTES: Dict[str, str] = {
+    "Code journal": CATEGORIE,
+}
+
+
+def _construire(codes: np.ndarray, valeurs: pd.Index, dtype: str) -> pd.api.extensions.ExtensionArray:
+    if dtype == CATEGORIE:
+        return pd.Categorical.from_codes(codes, categories=valeurs)
+    import pyarrow as pa
+
+    return pd.arrays.ArrowStringArray(pa.array(valeurs.to_numpy(dtype=object), pa.string()).take(pa.array(codes)))
+
+
+def par_valeurs_uniques(serie: pd.Series, f: Callable[[pd.Index], pd.Index], dtype=None) -> pd.Series:
+    # Applique f une seule fois par valeur distincte puis redéploie le résultat ligne à ligne.
+    # f reçoit et renvoie un Index de même longueur ; deux valeurs distinctes peuvent donner
+    # le même résultat (« 401000 » et « 401000 ») : on refactorise donc la sortie.
+    codes, uniques = pd.factorize(serie, use_na_sentinel=False)
+    resultat = pd.Index(f(pd.Index(uniques, dtype=object)))
+    codes_sortie, valeurs = pd.factorize(resultat, use_na_sentinel=False)
+    codes = codes_sortie[codes]
+    if dtype in (CATEGORIE, TEXTE):
+        return pd.Series(_construire(codes, pd.Index(valeurs), dtype), index=serie.index, name=serie.name)
+    return pd.Series(np.asarray(valeurs, dtype=dtype)[codes], index=serie.index, name=serie.name)
+
+
+def normaliser_texte(serie: pd.Series, dtype: str = TEXTE) -> pd.Series:
+    # str → strip → upper, « nan » / « None » → "" : la normalisation historique des achats
+    def normaliser(valeurs: pd.Index) -> pd.Index:
+        valeurs = valeurs.astype(str).str.strip().str.upper()
+        return valeurs.where(~valeurs.isin(["NAN", "NONE"]), "")
+
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Tableau déjà normalisé (revalidation) : seules les catégories sont retraitées,
+        # les valeurs manquantes (str → « nan ») deviennent ""
+        categories = normaliser(pd.Index(serie.cat.categories, dtype=object).append(pd.Index([""])))
+        codes = serie.cat.codes.to_numpy()
+        codes = np.where(codes >= 0, codes, len(categories) - 1)
+        codes_sortie, valeurs = pd.factorize(categories)
+        return pd.Series(_construire(codes_sortie[codes], pd.Index(valeurs), dtype), index=serie.index, name=serie.name)
+    if isinstance(serie.dtype, pd.StringDtype):
+        # pd.NA deviendrait « <NA> » ; None donne « None », normalisé en "" comme NaN
+        serie = serie.astype(object).where(serie.notna(), None)
+    return par_valeurs_uniques(serie.astype(str), normaliser, dtype)
+
+
+def parser_montants(serie: pd.Series) -> pd.Series:
+    # « 1 234,50 € » → 1234.5 ; mêmes règles que la conversion historique (virgule décimale,
+    # tout caractère autre que chiffre ou point ignoré), une fois par valeur distincte
+    def parser(valeurs: pd.Index) -> pd.Index:
+        return pd.Index(
+            valeurs.astype(str)
+            .str.replace(",", ".", regex=False)
+            .str.replace(r"[^\d.]", "", regex=True)
+            .astype(float)
+        )
+
+    return par_valeurs_uniques(serie.astype(str), parser, float)
+
+
+def centimes(montants) -> np.ndarray:
+    return np.rint(np.asarray(montants, dtype=float) * 100).astype(np.int64)
+
+
+def memoire(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
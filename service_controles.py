@@ -0,0 +1,151 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from profilage import Profil
+
+# Service local de contrôle : les pages Streamlit soumettent un travail (lecture du
+# classeur, contrôle) et relisent son état à chaque rerun au lieu de l'exécuter dans le
+# thread du script. Plusieurs comptables qui importent en même temps de gros journaux ne
+# figent plus l'interface : leurs travaux passent par une file commune (premier soumis,
+# premier servi) traitée par un nombre borné de workers.
+#
+#   service = ServiceControles(workers=2)
+#   travail = service.soumettre(lambda t: run_checks(df), "achats", etapes=ETAPES_ACHATS)
+#   service.travail(travail.id).avancement()   # à chaque rerun
+#
+# Les workers sont des threads du serveur Streamlit (service partagé par toutes les
+# sessions, cf. ressources_streamlit) : les validateurs incrémentaux et les caches de
+# lecture, de contrôles et de taux restent en mémoire et servent d'une soumission à
+# l'autre ; les gros journaux se répartissent en plus sur des processus
+# (cf. controle_parallele). Chaque travail s'exécute sous son propre Profil : l'étape en
+# cours (cf. profilage.etape) sert d'avancement. Les travaux terminés sont gardés
+# DUREE_CONSERVATION secondes.
+
+VARIABLE_WORKERS = "CONTROLE_WORKERS"
+NB_WORKERS = int(os.environ.get(VARIABLE_WORKERS, 2))
+DUREE_CONSERVATION = 3600  # s
+
+EN_ATTENTE = "en attente"
+EN_COURS = "en cours"
+TERMINE = "terminé"
+ECHEC = "échec"
+
+
+class Travail:
+    def __init__(self, id_travail: int, libelle: str, etapes: Sequence[str], memoire: bool = False):
+        self.id = id_travail
+        self.libelle = libelle
+        self.etapes = list(etapes)
+        self.etat = EN_ATTENTE
+        self.soumis = time.time()
+        self.debut: Optional[float] = None
+        self.fin: Optional[float] = None
+        self.resultat: Any = None
+        self.erreur: Optional[Exception] = None
+        self.avertissements: List[str] = []
+        self.profil = Profil(memoire=memoire)
+
+    @property
+    def termine(self) -> bool:
+        return self.etat in (TERMINE, ECHEC)
+
+    def avertir(self, message: str) -> None:
+        # Messages à afficher par la page une fois le travail terminé (st.warning n'a pas
+        # de page où s'afficher depuis un worker)
+        self.avertissements.append(message)
+
+    def etape(self) -> Optional[str]:
+        return self.profil.etape_en_cours()
+
+    def avancement(self) -> float:
+        # Part des étapes attendues déjà terminées (0 sans étapes attendues)
+        if self.etat == TERMINE:
+            return 1.0
+        if not self.etapes:
+            return 0.0
+        finies = {e.nom for e in list(self.profil.etapes)}
+        return sum(nom in finies for nom in self.etapes) / len(self.etapes)
+
+    def duree(self) -> float:
+        if self.debut is None:
+            return 0.0
+        return (self.fin or time.time()) - self.debut
+
+
+class ServiceControles:
+    def __init__(self, workers: int = NB_WORKERS, conservation: float = DUREE_CONSERVATION):
+        self.workers = max(1, workers)
+        self.conservation = conservation
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="controle")
+        self._travaux: Dict[int, Travail] = {}
+        self._file: List[int] = []
+        self._ids = itertools.count(1)
+        self._verrou = threading.Lock()
+
+    def soumettre(
+        self,
+        fonction: Callable[[Travail], Any],
+        libelle: str = "",
+        etapes: Sequence[str] = (),
+        memoire: bool = False,
+    ) -> Travail:
+        # fonction reçoit le Travail (pour avertir) ; son résultat devient travail.resultat.
+        # memoire : pics mémoire par étape dans travail.profil (cf. profilage)
+        self._purger()
+        with self._verrou:
+            travail = Travail(next(self._ids), libelle, etapes, memoire)
+            self._travaux[travail.id] = travail
+            self._file.append(travail.id)
+        self._pool.submit(self._executer, travail, fonction)
+        return travail
+
+    def _executer(self, travail: Travail, fonction: Callable[[Travail], Any]) -> None:
+        with self._verrou:
+            self._file.remove(travail.id)
+            travail.etat = EN_COURS
+            travail.debut = time.time()
+        try:
+            with travail.profil:
+                resultat = fonction(travail)
+        except Exception as err:
+            travail.erreur = err
+            etat = ECHEC
+        else:
+            travail.resultat = resultat
+            etat = TERMINE
+        with self._verrou:
+            travail.fin = time.time()
+            travail.etat = etat
+
+    def travail(self, id_travail: Optional[int]) -> Optional[Travail]:
+        with self._verrou:
+            return self._travaux.get(id_travail)
+
+    def position(self, travail: Travail) -> int:
+        # Rang dans la file d'attente (1 = prochain servi), 0 s'il a démarré
+        with self._verrou:
+            return self._file.index(travail.id) + 1 if travail.id in self._file else 0
+
+    def oublier(self, id_travail: Optional[int]) -> None:
+        with self._verrou:
+            travail = self._travaux.get(id_travail)
+            if travail is not None and travail.termine:
+                del self._travaux[id_travail]
+
+    def _purger(self) -> None:
+        limite = time.time() - self.conservation
+        with self._verrou:
+            for id_travail in [i for i, t in self._travaux.items() if t.termine and t.fin < limite]:
+                del self._travaux[id_travail]
+
+    def stats(self) -> Dict[str, int]:
+        with self._verrou:
+            etats = [t.etat for t in self._travaux.values()]
+        return {etat: etats.count(etat) for etat in (EN_ATTENTE, EN_COURS, TERMINE, ECHEC)}
+
+    def arreter(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
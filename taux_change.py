@@ -0,0 +1,218 @@
+import contextvars
+import os
+import sqlite3
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import profilage
+
+CLE_TAUX = Tuple[str, str]  # (date AAAA-MM-JJ, devise)
+
+FRANKFURTER_URL = os.environ.get("FRANKFURTER_URL", "https://api.frankfurter.app")
+CHEMIN_CACHE_DEFAUT = os.environ.get(
+    "TAUX_CHANGE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "myagency", "taux_change.sqlite")
+)
+# Marge avant la première date demandée : la série de Frankfurter ne contient que les jours
+# ouvrés, il faut donc le dernier taux publié avant un week-end ou un jour férié.
+MARGE_JOURS = 7
+MAX_CONCURRENCE = 8
+TIMEOUT = 10.0
+TENTATIVES = 4
+ATTENTE = 0.5  # s, première attente entre deux tentatives, doublée ensuite
+
+_session = None
+_verrou_session = threading.Lock()
+
+
+class ErreurTemporaire(Exception):
+    pass
+
+
+def get_session():
+    # Session partagée : les connexions HTTPS sont réutilisées entre requêtes et threads
+    global _session
+    with _verrou_session:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENCE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _est_temporaire(err: BaseException) -> bool:
+    import requests
+
+    return isinstance(err, (ErreurTemporaire, requests.ConnectionError, requests.Timeout))
+
+
+def get_json(url: str, params: Dict[str, str], timeout: float = TIMEOUT) -> dict:
+    from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+    @retry(
+        retry=retry_if_exception(_est_temporaire),
+        stop=stop_after_attempt(TENTATIVES),
+        wait=wait_exponential(multiplier=ATTENTE, max=8),
+        reraise=True,
+    )
+    def _appel() -> dict:
+        profilage.compter("http_requetes")
+        response = get_session().get(url, params=params, timeout=timeout)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ErreurTemporaire(f"HTTP {response.status_code} sur {url}")
+        return response.json()
+
+    return _appel()
+
+
+class FrankfurterProvider:
+    def __init__(self, base_url: str = FRANKFURTER_URL, timeout: float = TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def fetch_series(self, devise: str, debut: str, fin: str, cible: str = "EUR") -> Dict[str, float]:
+        data = get_json(f"{self.base_url}/{debut}..{fin}", {"from": devise, "to": cible}, self.timeout)
+        return {
+            jour: valeurs[cible]
+            for jour, valeurs in data.get("rates", {}).items()
+            if cible in valeurs
+        }
+
+
+# Fournisseur hors ligne : un taux fixe par devise, quelle que soit la date
+class StubProvider:
+    def __init__(self, taux: Optional[Dict[str, float]] = None):
+        self.taux = taux or {"USD": 0.9, "GBP": 1.17, "CHF": 1.05, "CAD": 0.68, "AUD": 0.61, "JPY": 0.0062}
+        self.appels: List[Tuple[str, str, str]] = []
+
+    def fetch_series(self, devise: str, debut: str, fin: str, cible: str = "EUR") -> Dict[str, float]:
+        self.appels.append((devise, debut, fin))
+        if devise not in self.taux:
+            return {}
+        return {debut: self.taux[devise], fin: self.taux[devise]}
+
+
+class RateCache:
+    def __init__(self, chemin: str = CHEMIN_CACHE_DEFAUT):
+        self.chemin = chemin
+        os.makedirs(os.path.dirname(os.path.abspath(chemin)), exist_ok=True)
+        with closing(self._connexion()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS taux ("
+                " jour TEXT NOT NULL, devise TEXT NOT NULL, cible TEXT NOT NULL, taux REAL NOT NULL,"
+                " PRIMARY KEY (jour, devise, cible))"
+            )
+
+    def _connexion(self) -> sqlite3.Connection:
+        # Une connexion par appel : le cache est partagé entre les threads de Streamlit
+        return sqlite3.connect(self.chemin, timeout=30)
+
+    def get_many(self, cles: Iterable[CLE_TAUX], cible: str = "EUR") -> Dict[CLE_TAUX, float]:
+        cles = list(cles)
+        trouves: Dict[CLE_TAUX, float] = {}
+        with closing(self._connexion()) as conn:
+            for i in range(0, len(cles), 400):
+                lot = cles[i:i + 400]
+                filtre = " OR ".join(["(jour = ? AND devise = ?)"] * len(lot))
+                params = [v for cle in lot for v in cle]
+                for jour, devise, taux in conn.execute(
+                    f"SELECT jour, devise, taux FROM taux WHERE cible = ? AND ({filtre})", [cible] + params
+                ):
+                    trouves[(jour, devise)] = taux
+        return trouves
+
+    def put_many(self, taux: Dict[CLE_TAUX, float], cible: str = "EUR") -> None:
+        if not taux:
+            return
+        with closing(self._connexion()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO taux (jour, devise, cible, taux) VALUES (?, ?, ?, ?)",
+                [(jour, devise, cible, t) for (jour, devise), t in taux.items()],
+            )
+
+
+def _mode_stub() -> bool:
+    return os.environ.get("TAUX_CHANGE_PROVIDER", "").lower() == "stub"
+
+
+def default_provider():
+    return StubProvider() if _mode_stub() else FrankfurterProvider()
+
+
+def default_cache() -> Optional[RateCache]:
+    # Les taux fictifs du stub ne doivent pas polluer le cache des vrais taux
+    return None if _mode_stub() else RateCache()
+
+
+def _taux_a_date(serie: Dict[str, float], jours_tries: List[str], jour: str) -> Optional[float]:
+    pos = bisect_right(jours_tries, jour)
+    return serie[jours_tries[pos - 1]] if pos else None
+
+
+# Taux de chaque (date, devise), dédoublonnés puis servis par le cache ; les manquants sont
+# récupérés en une requête de série par devise couvrant toute la plage de dates.
+# Renvoie les taux trouvés et les erreurs par devise ; une clé absente n'a pas de taux.
+def get_rates(
+    demandes: Iterable[CLE_TAUX],
+    provider=None,
+    cache: Optional[RateCache] = None,
+    cible: str = "EUR",
+    max_workers: int = MAX_CONCURRENCE,
+) -> Tuple[Dict[CLE_TAUX, float], Dict[str, str]]:
+    provider = provider or default_provider()
+    demandes = sorted(set(demandes))
+    taux = cache.get_many(demandes, cible) if cache else {}
+    erreurs: Dict[str, str] = {}
+    profilage.compter("taux_demandes", len(demandes))
+    profilage.compter("taux_cache_trouves", len(taux))
+
+    manquants: Dict[str, List[str]] = {}
+    for jour, devise in demandes:
+        if (jour, devise) not in taux:
+            manquants.setdefault(devise, []).append(jour)
+
+    # Une requête de série par devise, lancées en parallèle
+    debuts = {
+        devise: (date.fromisoformat(jours[0]) - timedelta(days=MARGE_JOURS)).isoformat()
+        for devise, jours in manquants.items()
+    }
+    series: Dict[str, Dict[str, float]] = {}
+    profilage.compter("series_demandees", len(manquants))
+    if manquants:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(manquants))) as pool:
+            futures = {
+                devise: pool.submit(
+                    contextvars.copy_context().run, provider.fetch_series, devise, debuts[devise], jours[-1], cible
+                )
+                for devise, jours in manquants.items()
+            }
+        for devise, future in futures.items():
+            try:
+                series[devise] = future.result()
+            except Exception as e:
+                erreurs[devise] = str(e)
+
+    nouveaux: Dict[CLE_TAUX, float] = {}
+    for devise, serie in series.items():
+        jours = manquants[devise]
+        jours_tries = sorted(serie)
+        for jour, t in serie.items():
+            nouveaux[(jour, devise)] = t
+        for jour in jours:
+            t = _taux_a_date(serie, jours_tries, jour)
+            if t is not None:
+                taux[(jour, devise)] = t
+                # Un taux postérieur à la série n'est qu'une extrapolation : on ne le garde pas
+                if jours_tries and jour <= jours_tries[-1]:
+                    nouveaux[(jour, devise)] = t
+
+    if cache:
+        cache.put_many(nouveaux, cible)
+    return taux, erreurs
@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+import controle_achats_logic as achats
+from cache_controles import CheckCache, fingerprint
+from controle_achats_logic import regles_achats
+from fusion_corrections import appliquer_corrections
+from generateur_journaux import journal_achats
+from regles import VARIABLE_REGLES
+from validation_incrementale import IncrementalAchats
+
+# Parcours de la page des achats : empreinte du tableau source et du jeu de règles, contrôle
+# mémorisé, puis corrections qui changent l'empreinte et invalident l'ancienne entrée
+
+
+def _controler(cache, source, regles=None):
+    empreinte = fingerprint(source, "achats", (regles or regles_achats()).signature())
+    resultat = cache.get(empreinte)
+    if resultat is None:
+        df = source.copy()
+        rapport, ko, nb_ko = IncrementalAchats().run(df)
+        resultat = cache.put(empreinte, (rapport, ko, nb_ko, df))
+    return empreinte, resultat
+
+
+@pytest.fixture
+def source(monkeypatch):
+    monkeypatch.delenv(VARIABLE_REGLES, raising=False)
+    return journal_achats(600, taux_erreurs=0.2, seed=0)
+
+
+def test_hit_sur_tableau_inchange(source):
+    cache = CheckCache()
+    empreinte, premier = _controler(cache, source)
+    _, second = _controler(cache, source.copy())
+
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert second[0] is premier[0]
+    assert second[1:3] == premier[1:3]
+    assert second[3].equals(premier[3])
+    # Le tableau rendu est une copie : le modifier ne touche pas l'entrée mémorisée
+    second[3]["Débit(€)"] = 0.0
+    assert cache.get(empreinte)[3].equals(premier[3])
+
+
+def test_corrections_invalident_l_entree(source):
+    cache = CheckCache()
+    empreinte, (rapport, ko, _, df) = _controler(cache, source)
+    assert ko
+
+    masque = (df["Compte Généraux"] == "401000").to_numpy(dtype=bool)
+    edite = df[masque & df["n° de piece"].isin(ko).to_numpy()][["n° de piece", "Compte Tiers"]].copy()
+    edite["Compte Tiers"] = "401CORRIGE"
+    assert len(appliquer_corrections(df, edite, ["Compte Tiers"], cle="n° de piece", masque=masque))
+    cache.invalidate(empreinte)
+
+    assert cache.stats()["entrees"] == 0
+    assert cache.get(empreinte) is None
+    nouvelle, (_, ko_corriges, nb_ko, _) = _controler(cache, df)
+    assert nouvelle != empreinte
+    assert nb_ko == 0 and ko_corriges == []
+    assert cache.stats()["hits"] == 0
+
+
+def test_empreinte_suit_le_jeu_client(source, tmp_path, monkeypatch):
+    standard = fingerprint(source, "achats", regles_achats().signature())
+
+    chemin = tmp_path / "client.json"
+    chemin.write_text(json.dumps({"nom": "Client X", "achats": {"desactiver": ["AC_DATE"]}}), encoding="utf-8")
+    monkeypatch.setenv(VARIABLE_REGLES, str(chemin))
+    client = fingerprint(source, "achats", regles_achats().signature())
+    assert client != standard
+
+    # Fichier client modifié : nouveau jeu relu, nouvelle empreinte
+    chemin.write_text(json.dumps({"achats": {"severites": {"AC_COMPTES": "bloquante"}}}), encoding="utf-8")
+    mtime = os.path.getmtime(chemin) + 10
+    os.utime(chemin, (mtime, mtime))
+    modifie = fingerprint(source, "achats", regles_achats().signature())
+    assert modifie not in (standard, client)
+
+    cache = CheckCache()
+    _, (_, ko_client, _, _) = _controler(cache, source)
+    monkeypatch.delenv(VARIABLE_REGLES)
+    _, (_, ko_standard, _, _) = _controler(cache, source)
+    assert cache.stats()["misses"] == 2
+    assert set(ko_standard) < set(ko_client)
+    assert ko_client == achats.run_checks(source.copy(), regles=regles_achats(str(chemin)))[1]
+
+
+def test_limite_de_taille_lru(source):
+    entree = (["log"] * 10, ["01-1"], 1, source)
+    cache = CheckCache()
+    cache.put("a", entree)
+    une = cache.stats()["octets"]
+    cache = CheckCache(taille_max=2 * une)
+    cache.put("a", entree)
+    cache.put("b", entree)
+    cache.get("a")
+    cache.put("c", entree)
+    # « b » est le moins récemment utilisé
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["octets"] <= 2 * une
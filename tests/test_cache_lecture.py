@@ -0,0 +1,42 @@
+from io import BytesIO
+
+import lecture_excel
+from cache_lecture import ParseCache
+from generateur_journaux import ecrire_xlsx, journal_achats
+from lecture_excel import OPENPYXL, VARIABLE_MOTEUR, XLSX2CSV, parametres_cache
+
+
+def _cle(contenu):
+    return ParseCache.cle(contenu, lecteur="achats", header_row=1, **parametres_cache(contenu))
+
+
+def test_cle_depend_du_moteur(monkeypatch):
+    contenu = ecrire_xlsx(journal_achats(50)).getvalue()
+    monkeypatch.setenv(VARIABLE_MOTEUR, OPENPYXL)
+    cle_openpyxl = _cle(contenu)
+    assert _cle(contenu) == cle_openpyxl
+    monkeypatch.setenv(VARIABLE_MOTEUR, XLSX2CSV)
+    assert _cle(contenu) != cle_openpyxl
+
+
+def test_cle_depend_de_la_version(monkeypatch):
+    contenu = ecrire_xlsx(journal_achats(50)).getvalue()
+    avant = _cle(contenu)
+    monkeypatch.setattr(lecture_excel, "LECTEUR_VERSION", "test")
+    assert _cle(contenu) != avant
+
+
+def test_lecture_servie_par_le_cache(tmp_path):
+    contenu = ecrire_xlsx(journal_achats(50)).getvalue()
+    cache = ParseCache(str(tmp_path))
+    lectures = []
+
+    def lire():
+        lectures.append(1)
+        return lecture_excel.lire_excel(contenu, 1)
+
+    params = dict(lecteur="achats", header_row=1, **parametres_cache(contenu))
+    premier = cache.read(BytesIO(contenu), lire, **params)
+    second = cache.read(BytesIO(contenu), lire, **params)
+    assert len(lectures) == 1
+    assert len(second) == len(premier) == 50
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import controle_achats_logic as achats
+from generateur_journaux import COLONNES_ACHATS
+
+
+def _piece(lignes):
+    # lignes : (compte, tiers, débit, crédit) d'une même pièce 01-1
+    return pd.DataFrame([
+        {
+            "Code journal": "AC", "Date Facture": "15/01/2025", "Compte Généraux": compte, "Compte Tiers": tiers,
+            "Libelle": "FOURNISSEUR 1", "Concierge": "CONCIERGE 1", "n° de piece": "01-1", "Analytique": "",
+            "Code": "G", "Débit(€)": debit, "Crédit (€)": credit,
+        }
+        for compte, tiers, debit, credit in lignes
+    ])[COLONNES_ACHATS]
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_somme_sous_centime_arrondie_par_piece(vectorized):
+    # 10.004 + 10.004 = 20.008 ≈ 20.01 : l'écart est arrondi sur la somme, pas ligne par ligne
+    df = _piece([
+        ("401000", "401F1", 0.0, 20.01),
+        ("604110", "", 10.004, 0.0),
+        ("604000", "", 10.004, 0.0),
+    ])
+    logs, ko, _ = achats.run_checks(df, vectorized)
+    assert not any("Somme Débit" in ligne for ligne in logs)
+    assert ko == []
+
+
+def test_somme_sous_centime_identique_aux_deux_moteurs():
+    df = _piece([
+        ("401000", "401F1", 20.01, 0.0),
+        ("604110", "", 0.0, 10.004),
+        ("604000", "", 0.0, 10.004),
+        ("604900", "", 0.0, 0.004),
+    ])
+    assert achats.run_checks(df.copy(), True) == achats.run_checks(df.copy(), False)
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+
+from controle_batch import detecter_journal
+from generateur_journaux import journal_achats, journal_ventes
+
+
+def test_journaux_generes_reconnus():
+    assert detecter_journal(journal_achats(20)) == "achats"
+    assert detecter_journal(journal_ventes(20)) == "ventes"
+
+
+def test_douze_colonnes_quelconques_refusees():
+    df = pd.DataFrame([range(12)], columns=[f"Colonne {i}" for i in range(12)])
+    with pytest.raises(ValueError, match="Journal non reconnu"):
+        detecter_journal(df)
+
+
+def test_colonnes_ventes_dans_le_desordre_refusees():
+    df = journal_ventes(20)
+    with pytest.raises(ValueError, match="Journal non reconnu"):
+        detecter_journal(df[list(reversed(df.columns))])
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+import controle_achats_logic as achats
+import controle_parallele
+import controle_ventes_logic as ventes
+from generateur_journaux import journal_achats, journal_ventes
+from profilage import Profil
+from taux_change import StubProvider
+
+# Seuils abaissés pour qu'un petit journal soit découpé en plusieurs partitions contrôlées
+# dans des processus : logs, groupes KO et tableau corrigé identiques au contrôle séquentiel
+
+
+@pytest.fixture
+def seuils_bas(monkeypatch):
+    monkeypatch.setattr(controle_parallele, "SEUIL_PARALLELE", 0)
+    monkeypatch.setattr(controle_parallele, "TAILLE_MIN_PARTITION", 250)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_achats_parallele_identique_au_sequentiel(seuils_bas, seed):
+    source = journal_achats(3000, taux_erreurs=0.2, seed=seed)
+    df_seq, df_par = source.copy(), source.copy()
+
+    logs_seq, ko_seq, _ = achats.run_checks(df_seq)
+    with Profil() as profil:
+        logs_par, ko_par, _ = achats.run_checks(df_par, processus=2)
+
+    assert profil.compteurs.get("partitions", 0) > 1
+    assert ko_par == ko_seq
+    assert logs_par == logs_seq
+    pd.testing.assert_frame_equal(df_par.astype(object), df_seq.astype(object), check_exact=True)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_ventes_parallele_identique_au_sequentiel(seuils_bas, seed):
+    source = journal_ventes(3000, taux_erreurs=0.2, seed=seed)
+
+    logs_seq, ko_seq, _, df_seq = ventes.run_ventes_checks_console(source.copy(), StubProvider())
+    with Profil() as profil:
+        logs_par, ko_par, _, df_par = ventes.run_ventes_checks_console(source.copy(), StubProvider(), processus=2)
+
+    assert profil.compteurs.get("partitions", 0) > 1
+    assert ko_par == ko_seq
+    assert logs_par == logs_seq
+    pd.testing.assert_frame_equal(df_par.astype(object), df_seq.astype(object), check_exact=True)
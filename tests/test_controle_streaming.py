@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import controle_achats_logic as achats
+import controle_batch
+import controle_ventes_logic as ventes
+from controle_streaming import run_checks_streaming
+from generateur_journaux import ecrire_xlsx, journal_achats, journal_ventes
+from lecture_excel import lire_excel
+from taux_change import StubProvider
+
+# Le contrôle bloc par bloc doit rendre ce que rend le contrôle du classeur entier.
+# Des blocs de 300 lignes coupent des pièces / factures en deux d'un bloc à l'autre.
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_achats_streaming_identique_a_run_checks(tmp_path, seed):
+    source = ecrire_xlsx(journal_achats(2000, taux_erreurs=0.2, seed=seed), str(tmp_path / "achats.xlsx"))
+    ko, nb_lignes = run_checks_streaming(
+        source, str(tmp_path / "corrige.xlsx"), "achats", str(tmp_path / "logs.txt"), taille_bloc=300,
+    )
+
+    df = lire_excel(source, 1)
+    logs, ko_attendus, _ = achats.run_checks(df)
+    assert ko == ko_attendus
+    assert ko
+    assert nb_lignes == 2000
+    assert (tmp_path / "logs.txt").read_text(encoding="utf-8") == "\n".join(logs) + "\n"
+    assert len(lire_excel(str(tmp_path / "corrige.xlsx"), 0)) == len(df)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_ventes_streaming_identique_a_run_checks(tmp_path, seed):
+    source = ecrire_xlsx(journal_ventes(2000, taux_erreurs=0.2, seed=seed), str(tmp_path / "ventes.xlsx"))
+    ko, nb_lignes = run_checks_streaming(
+        source, str(tmp_path / "corrige.xlsx"), "ventes", str(tmp_path / "logs.txt"),
+        taille_bloc=300, provider=StubProvider(),
+    )
+
+    logs, ko_attendus, _, df = ventes.run_ventes_checks_console(lire_excel(source, 1), StubProvider())
+    assert ko == ko_attendus
+    assert ko
+    assert nb_lignes == 2000
+    # Les conversions de devises sont journalisées bloc par bloc : mêmes lignes, ordre différent
+    lignes = (tmp_path / "logs.txt").read_text(encoding="utf-8").splitlines()
+    assert sorted(lignes) == sorted("\n".join(logs).splitlines())
+    assert len(lire_excel(str(tmp_path / "corrige.xlsx"), 0)) == len(df)
+
+
+def test_batch_streaming(tmp_path):
+    ecrire_xlsx(journal_achats(1000, taux_erreurs=0.2, seed=2), str(tmp_path / "a.xlsx"))
+    sortie = tmp_path / "sortie"
+    controle_batch.main([str(tmp_path / "a.xlsx"), "--sortie", str(sortie), "--streaming", "--workers", "1"])
+
+    rapport = json.loads((sortie / "a_rapport.json").read_text(encoding="utf-8"))
+    _, ko_attendus, _ = achats.run_checks(lire_excel(str(tmp_path / "a.xlsx"), 1))
+    assert rapport["journal"] == "achats"
+    assert rapport["lignes"] == 1000
+    assert rapport["ko"] == ko_attendus
+    assert (sortie / "a_corrige.xlsx").exists()
+    assert rapport["fichier_logs"] == str(sortie / "a_logs.txt")
+
+
+def test_batch_streaming_refuse_index(tmp_path):
+    with pytest.raises(SystemExit):
+        controle_batch.main([str(tmp_path), "--streaming", "--index", str(tmp_path / "index.sqlite")])
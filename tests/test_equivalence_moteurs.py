@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from generateur_journaux import journal_achats, journal_ventes
+from taux_change import StubProvider
+
+# Le moteur colonnaire (vectorized=True) doit donner exactement les logs, les pièces KO et le
+# journal corrigé de la boucle historique (vectorized=False), y compris sur les cas limites
+
+
+def _sous_centimes(df, colonnes, rng, part=0.1):
+    # Montants non nuls décalés de quelques millièmes : les équilibres se jouent à l'arrondi
+    df = df.copy()
+    for colonne in colonnes:
+        valeurs = df[colonne].to_numpy(dtype=float).copy()
+        decales = (valeurs != 0) & (rng.random(len(df)) < part)
+        valeurs[decales] += rng.choice([-0.006, -0.004, -0.001, 0.001, 0.004, 0.005], decales.sum())
+        df[colonne] = np.round(valeurs, 3)
+    return df
+
+
+def _401_vides(df, rng, part=0.3):
+    # Lignes 401000 à 0 / 0 : complétées par la somme des lignes de charge (correction écrite
+    # dans le journal, doit être la même au dernier bit)
+    df = df.copy()
+    vides = (df["Compte Généraux"] == "401000").to_numpy() & (rng.random(len(df)) < part)
+    df.loc[vides, ["Débit(€)", "Crédit (€)"]] = 0.0
+    return df
+
+
+def _numeros_manquants(df, colonne, rng, part=0.05):
+    df = df.copy()
+    df[colonne] = df[colonne].astype(object).where(rng.random(len(df)) >= part, np.nan)
+    return df
+
+
+def _comparer_achats(df):
+    vecto, boucle = df.copy(), df.copy()
+    assert achats.run_checks(vecto, True) == achats.run_checks(boucle, False)
+    pd.testing.assert_frame_equal(vecto.astype(object), boucle.astype(object), check_exact=True)
+
+
+def _comparer_ventes(df):
+    resultats = [
+        ventes.run_ventes_checks_console(df.copy(), StubProvider(), vectorized=mode) for mode in (True, False)
+    ]
+    (logs_v, ko_v, nb_v, df_v), (logs_b, ko_b, nb_b, df_b) = resultats
+    assert logs_v == logs_b
+    assert (ko_v, nb_v) == (ko_b, nb_b)
+    pd.testing.assert_frame_equal(df_v.astype(object), df_b.astype(object), check_exact=True)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_achats_journal_genere(seed):
+    _comparer_achats(journal_achats(800, taux_erreurs=0.2, seed=seed))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_achats_sous_centimes(seed):
+    rng = np.random.default_rng(seed)
+    _comparer_achats(_sous_centimes(journal_achats(800, seed=seed), ["Débit(€)", "Crédit (€)"], rng))
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("lignes_par_piece", [4, 12])
+def test_achats_sous_centimes_denses_et_401_vides(seed, lignes_par_piece):
+    # Tous les montants hors du centime et un tiers des 401000 à compléter ; les pièces de
+    # 8 lignes ou plus sont sommées par paires par numpy (cf. Contexte.somme)
+    rng = np.random.default_rng(seed)
+    df = journal_achats(600, lignes_par_piece=lignes_par_piece, taux_erreurs=0.3, seed=seed)
+    df = _401_vides(_sous_centimes(df, ["Débit(€)", "Crédit (€)"], rng, part=1.0), rng)
+    _comparer_achats(df)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_achats_corrections_401_au_dernier_bit(seed):
+    # Montants au centime : les sommes par pièce ne sont pas exactes en float, la correction
+    # écrite dans la 401000 doit être la somme de la boucle à l'identique (13366.759999999998)
+    rng = np.random.default_rng(seed)
+    df = _401_vides(journal_achats(600, lignes_par_piece=12, seed=seed), rng, part=0.5)
+    _comparer_achats(df)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_achats_numeros_manquants(seed):
+    rng = np.random.default_rng(seed)
+    _comparer_achats(_numeros_manquants(journal_achats(800, taux_pieces_vides=0.5, seed=seed), "n° de piece", rng))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_ventes_journal_genere(seed):
+    _comparer_ventes(journal_ventes(800, taux_erreurs=0.2, seed=seed))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_ventes_devises_et_sous_centimes(seed):
+    rng = np.random.default_rng(seed)
+    devises = {"€": 0.4, "$": 0.2, "£": 0.1, "CHF": 0.1, "¥": 0.1, "XYZ": 0.1}
+    df = journal_ventes(800, devises=devises, seed=seed)
+    _comparer_ventes(_sous_centimes(df, ["Débit", "Crédit"], rng))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_ventes_numeros_manquants(seed):
+    rng = np.random.default_rng(seed)
+    _comparer_ventes(_numeros_manquants(journal_ventes(800, seed=seed), "Numéro de facture", rng))
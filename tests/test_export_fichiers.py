@@ -0,0 +1,87 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+import export_fichiers
+from export_fichiers import ExportCache, exporter
+from generateur_journaux import journal_achats, journal_ventes
+
+# Un tableau exporté puis relu rend les mêmes valeurs. Les cellules vides ne distinguent
+# pas "" d'une valeur manquante, en xlsx comme en CSV : les deux sont comparés comme manquants.
+
+JOURNAUX = {"achats": journal_achats, "ventes": journal_ventes}
+
+
+def _valeurs(df):
+    valeurs = df.astype(object)
+    return valeurs.where(valeurs.notna() & (valeurs != ""), None)
+
+
+def _relire(data, fmt, source):
+    if fmt == "xlsx":
+        return pd.read_excel(BytesIO(data), dtype=object)
+    if fmt == "parquet":
+        return pd.read_parquet(BytesIO(data))
+    # CSV : tout en texte, puis types du tableau exporté
+    df = pd.read_csv(BytesIO(data), dtype=str, keep_default_na=False, na_values=[""])
+    for col, dtype in source.dtypes.items():
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            df[col] = pd.to_datetime(df[col])
+        elif dtype != object:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+@pytest.mark.parametrize("fmt", ["xlsx", "csv", "parquet"])
+@pytest.mark.parametrize("journal", ["achats", "ventes"])
+def test_aller_retour(journal, fmt):
+    source = JOURNAUX[journal](500, taux_erreurs=0.2, seed=0)
+    relu = _relire(exporter(source, fmt, ExportCache()), fmt, source)
+
+    assert list(relu.columns) == list(source.columns)
+    pd.testing.assert_frame_equal(_valeurs(relu), _valeurs(source), check_exact=True)
+
+
+def test_xlsx_au_dela_du_seuil_memoire(monkeypatch):
+    # Fichier temporaire passé sur disque pendant l'écriture : mêmes octets relus
+    source = journal_achats(500, seed=1)
+    en_memoire = exporter(source, "xlsx", ExportCache())
+    monkeypatch.setattr(export_fichiers, "SEUIL_MEMOIRE", 1024)
+    sur_disque = exporter(source, "xlsx", ExportCache())
+
+    pd.testing.assert_frame_equal(
+        pd.read_excel(BytesIO(sur_disque), dtype=object), pd.read_excel(BytesIO(en_memoire), dtype=object)
+    )
+
+
+def test_cache_par_empreinte_et_format():
+    cache = ExportCache()
+    source = journal_ventes(200, seed=0)
+
+    xlsx = exporter(source, "xlsx", cache)
+    assert exporter(source.copy(), "xlsx", cache) is xlsx
+    exporter(source, "csv", cache)
+    modifie = source.copy()
+    modifie.loc[modifie.index[0], "Débit"] += 1
+    exporter(modifie, "xlsx", cache)
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+    assert cache.stats()["entrees"] == 3
+
+
+def test_gros_export_pas_garde_en_cache():
+    cache = ExportCache(taille_max_entree=1024)
+    source = journal_achats(500, seed=0)
+
+    data = exporter(source, "csv", cache)
+    assert len(data) > 1024
+    assert cache.stats()["entrees"] == 0
+    assert exporter(source, "csv", cache) == data
+    assert cache.stats()["hits"] == 0
+
+
+def test_format_inconnu():
+    with pytest.raises(ValueError, match="Format d'export inconnu : ods"):
+        exporter(journal_achats(20), "ods", ExportCache())
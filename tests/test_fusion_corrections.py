@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fusion_corrections import COLONNES_JOURNAL, appliquer_corrections, cumuler, journal_vide
+
+COLONNES_ACHATS = ["Compte Tiers", "Débit(€)", "Crédit (€)", "Libelle", "Concierge"]
+
+
+def _achats():
+    # Deux pièces : une ligne 401000 et une ligne de charge chacune
+    return pd.DataFrame({
+        "n° de piece": ["01-1", "01-1", "01-2", "01-2"],
+        "Compte Généraux": ["401000", "604000", "401000", "604000"],
+        "Compte Tiers": ["401F1", None, "401F2", None],
+        "Débit(€)": [0.0, 120.0, 0.0, 80.0],
+        "Crédit (€)": [120.0, 0.0, 80.0, 0.0],
+        "Libelle": ["Loyer", "Loyer", np.nan, np.nan],
+        "Concierge": [None, None, None, None],
+    })
+
+
+def _masque_401(df):
+    return (df["Compte Généraux"] == "401000").to_numpy(dtype=bool)
+
+
+def _edite_achats(df):
+    # Ce que rend le data_editor des pièces KO : les lignes 401000, sans l'index du tableau
+    return df[_masque_401(df)][["n° de piece"] + COLONNES_ACHATS].reset_index(drop=True)
+
+
+def _ventes():
+    return pd.DataFrame({
+        "Numéro de facture": ["F1", "F1", "F2", "F2"],
+        "Compte général": ["411000", "706000", "411000", "706000"],
+        "Débit": [100.0, 0.0, 50.0, 0.0],
+        "Crédit": [0.0, 100.0, 0.0, 50.0],
+        "Libellé": ["Client A", "Client A", "Client B", "Client B"],
+    }, index=[10, 11, 12, 13])
+
+
+# -- achats : par n° de pièce, sur les lignes 401000 ---------------------------------------
+
+def test_achats_par_cle_sur_lignes_401():
+    df = _achats()
+    edite = _edite_achats(df).astype({"Crédit (€)": object})
+    edite.loc[edite["n° de piece"] == "01-2", "Crédit (€)"] = "85.5"
+    edite.loc[edite["n° de piece"] == "01-2", "Compte Tiers"] = "401F9"
+
+    journal = appliquer_corrections(df, edite, COLONNES_ACHATS, cle="n° de piece", masque=_masque_401(df))
+
+    # Seule la ligne 401000 de la pièce 01-2 change ; la ligne de charge garde ses valeurs
+    assert df.loc[2, "Crédit (€)"] == 85.5
+    assert df.loc[2, "Compte Tiers"] == "401F9"
+    assert df["Crédit (€)"].dtype == float
+    pd.testing.assert_frame_equal(df.drop(index=2), _achats().drop(index=2))
+    assert list(journal.columns) == COLONNES_JOURNAL
+    assert sorted(journal["colonne"]) == ["Compte Tiers", "Crédit (€)"]
+    assert set(journal["index"]) == {2}
+    assert set(journal["groupe"]) == {"01-2"}
+    assert journal.set_index("colonne").loc["Crédit (€)", "avant"] == 80.0
+
+
+def test_achats_cle_editee_deux_fois_garde_la_derniere_saisie():
+    df = _achats()
+    edite = _edite_achats(df)
+    doublon = edite[edite["n° de piece"] == "01-1"].assign(Libelle="Loyer juin")
+    edite.loc[edite["n° de piece"] == "01-1", "Libelle"] = "Loyer mai"
+
+    appliquer_corrections(df, pd.concat([edite, doublon]), COLONNES_ACHATS, cle="n° de piece", masque=_masque_401(df))
+
+    assert df.loc[0, "Libelle"] == "Loyer juin"
+    assert df.loc[1, "Libelle"] == "Loyer"
+
+
+def test_achats_sans_masque_toutes_les_lignes_de_la_piece():
+    df = _achats()
+    edite = _edite_achats(df)
+    edite["Libelle"] = "Nouveau"
+
+    appliquer_corrections(df, edite, ["Libelle"], cle="n° de piece")
+
+    assert (df["Libelle"] == "Nouveau").all()
+
+
+# -- ventes : par index de ligne --------------------------------------------------------------
+
+def test_ventes_par_index():
+    df = _ventes()
+    edite = df.loc[[12, 13]].copy()
+    edite.loc[13, "Crédit"] = 55
+    edite.loc[12, "Débit"] = 55
+
+    journal = appliquer_corrections(df, edite, list(edite.columns), groupe="Numéro de facture")
+
+    assert df.loc[[12, 13], ["Débit", "Crédit"]].to_numpy().tolist() == [[55.0, 0.0], [0.0, 55.0]]
+    pd.testing.assert_frame_equal(df.loc[[10, 11]], _ventes().loc[[10, 11]])
+    assert sorted(journal["index"]) == [12, 13]
+    assert set(journal["groupe"]) == {"F2"}
+
+
+def test_ventes_index_inconnu_refuse():
+    df = _ventes()
+    edite = df.loc[[12]].rename(index={12: 99})
+    with pytest.raises(ValueError, match="absentes du tableau : 99"):
+        appliquer_corrections(df, edite, ["Débit"], groupe="Numéro de facture")
+
+
+# -- conversions ------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("saisie", ["abc", "12 €", "1,5"])
+def test_montant_non_numerique_refuse(saisie):
+    df = _ventes()
+    edite = df.loc[[10]].astype({"Débit": object})
+    edite.loc[10, "Débit"] = saisie
+
+    with pytest.raises(ValueError, match="Colonne Débit : valeurs non numériques"):
+        appliquer_corrections(df, edite, ["Débit"])
+    # Rien n'est écrit, le type de la colonne est conservé
+    pd.testing.assert_frame_equal(df, _ventes())
+
+
+def test_vide_et_manquant_inchanges():
+    df = _achats()
+    edite = _edite_achats(df)
+    # Le data_editor rend "" pour Concierge et Libelle manquants, None pour un montant effacé
+    edite["Concierge"] = ""
+    edite.loc[edite["n° de piece"] == "01-2", "Libelle"] = ""
+    df.loc[0, "Débit(€)"] = np.nan
+    edite.loc[edite["n° de piece"] == "01-1", "Débit(€)"] = None
+    avant = df.copy()
+
+    journal = appliquer_corrections(df, edite, COLONNES_ACHATS, cle="n° de piece", masque=_masque_401(df))
+
+    assert journal.empty
+    assert list(journal.columns) == COLONNES_JOURNAL
+    pd.testing.assert_frame_equal(df, avant)
+
+
+def test_montant_vide_devient_manquant():
+    df = _ventes()
+    edite = df.loc[[10]].astype({"Débit": object})
+    edite.loc[10, "Débit"] = " "
+
+    journal = appliquer_corrections(df, edite, ["Débit"])
+
+    assert np.isnan(df.loc[10, "Débit"])
+    assert journal["avant"].tolist() == [100.0]
+
+
+def test_nouvelle_valeur_dans_colonne_categorielle():
+    df = _achats().astype({"Compte Tiers": "category"})
+    edite = _edite_achats(df).astype({"Compte Tiers": object})
+    edite.loc[edite["n° de piece"] == "01-1", "Compte Tiers"] = "401NOUVEAU"
+
+    journal = appliquer_corrections(df, edite, ["Compte Tiers"], cle="n° de piece", masque=_masque_401(df))
+
+    assert isinstance(df["Compte Tiers"].dtype, pd.CategoricalDtype)
+    assert "401NOUVEAU" in df["Compte Tiers"].cat.categories
+    assert df.loc[0, "Compte Tiers"] == "401NOUVEAU"
+    assert journal[["avant", "apres"]].to_numpy().tolist() == [["401F1", "401NOUVEAU"]]
+
+
+def test_colonne_entiere_passe_en_float_si_necessaire():
+    df = _ventes().astype({"Débit": "int64"})
+    edite = df.loc[[10, 12]].astype({"Débit": object})
+    edite.loc[10, "Débit"] = "90"
+
+    appliquer_corrections(df, edite, ["Débit"])
+    assert df["Débit"].dtype == "int64"
+    assert df.loc[10, "Débit"] == 90
+
+    edite.loc[12, "Débit"] = "50.5"
+    appliquer_corrections(df, edite, ["Débit"])
+    assert df["Débit"].dtype == float
+    assert df.loc[12, "Débit"] == 50.5
+
+
+def test_cumuler():
+    premier = pd.DataFrame([[0, "01-1", "Libelle", "a", "b"]], columns=COLONNES_JOURNAL)
+    second = pd.DataFrame([[2, "01-2", "Libelle", "c", "d"]], columns=COLONNES_JOURNAL)
+
+    assert cumuler(None, premier) is premier
+    assert cumuler(premier, journal_vide()) is premier
+    assert cumuler(premier, second)["groupe"].tolist() == ["01-1", "01-2"]
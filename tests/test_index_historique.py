@@ -0,0 +1,79 @@
+import pandas as pd
+
+from generateur_journaux import journal_ventes
+from index_historique import IndexHistorique, controler_resume, source_fichier
+
+
+def _resume(numeros, montant=10_000):
+    return pd.DataFrame({
+        "numero": numeros,
+        "date": "2025-03-03",
+        "tiers": "411-C1",
+        "montant": montant,
+    })
+
+
+def _index(tmp_path):
+    return IndexHistorique(str(tmp_path / "index.sqlite"))
+
+
+def test_source_nom_et_contenu():
+    assert source_fichier("/exports/client_a/export.xlsx", b"a") == source_fichier("export.xlsx", b"a")
+    assert source_fichier("export.xlsx", b"a") != source_fichier("export.xlsx", b"b")
+
+
+def test_doublon_signale_avec_sa_source(tmp_path):
+    index = _index(tmp_path)
+    controler_resume(index, "ventes", _resume(["F0001", "F0002"]), "octobre.xlsx #1")
+    logs = controler_resume(index, "ventes", _resume(["F0002", "F0003"]), "novembre.xlsx #2")
+    assert logs == [
+        "⚠️ Facture F0002 déjà comptabilisée dans octobre.xlsx #1 (date 2025-03-03, tiers 411-C1, montant 100.00)"
+    ]
+
+
+def test_trous_de_numerotation(tmp_path):
+    index = _index(tmp_path)
+    controler_resume(index, "ventes", _resume(["F0001", "F0002"]), "octobre.xlsx #1")
+    logs = controler_resume(index, "ventes", _resume(["F0005", "F0006", "F0008"]), "novembre.xlsx #2")
+    assert logs == ["⚠️ Numérotation : F0003 à F0004 manquants", "⚠️ Numérotation : F0007 manquant"]
+
+
+def test_fichier_recontrole_ne_se_signale_pas(tmp_path):
+    index = _index(tmp_path)
+    controler_resume(index, "ventes", _resume(["F0001"]), "octobre.xlsx #1")
+    assert controler_resume(index, "ventes", _resume(["F0001"]), "octobre.xlsx #1") == []
+
+
+def test_homonymes_de_contenus_differents_gardes(tmp_path):
+    index = _index(tmp_path)
+    controler_resume(index, "ventes", _resume(["F0001"]), source_fichier("export.xlsx", b"client a"))
+    controler_resume(index, "ventes", _resume(["F0002"]), source_fichier("export.xlsx", b"client b"))
+    logs = controler_resume(index, "ventes", _resume(["F0001", "F0002"]), "autre.xlsx #3", enregistrer=False)
+    assert len(logs) == 2
+
+
+def test_consultation_sans_enregistrement(tmp_path):
+    index = _index(tmp_path)
+    controler_resume(index, "ventes", _resume(["F0001"]), "octobre.xlsx #1", enregistrer=False)
+    assert controler_resume(index, "ventes", _resume(["F0001"]), "novembre.xlsx #2") == []
+
+
+def test_groupes_ko_non_enregistres(tmp_path):
+    index = _index(tmp_path)
+    controler_resume(index, "ventes", _resume(["F0001", "F0002"]), "octobre.xlsx #1", ko=["F0002"])
+    logs = controler_resume(index, "ventes", _resume(["F0001", "F0002"]), "novembre.xlsx #2")
+    assert [ligne for ligne in logs if "F0002" in ligne] == []
+    assert len(logs) == 1
+
+
+def test_run_checks_ventes_signale_les_doublons(tmp_path):
+    import controle_ventes_logic as ventes
+    from taux_change import StubProvider
+
+    index = _index(tmp_path)
+    df = journal_ventes(200, taux_erreurs=0, devises={"€": 1.0}, seed=0)
+    _, ko, *_ = ventes.run_ventes_checks_console(df.copy(), StubProvider(), index=index, source="a.xlsx #1")
+    logs, *_ = ventes.run_ventes_checks_console(df.copy(), StubProvider(), index=index, source="b.xlsx #2")
+    # Seules les factures validées (non KO) du premier fichier sont enregistrées
+    nb_valides = df["Numéro de facture"].nunique() - len(ko)
+    assert sum("déjà comptabilisée dans a.xlsx #1" in ligne for ligne in logs) == nb_valides
@@ -0,0 +1,59 @@
+import threading
+import tracemalloc
+
+import profilage
+from profilage import Profil
+
+
+def test_tracemalloc_arrete_par_le_dernier_profil():
+    assert not tracemalloc.is_tracing()
+    premier, second = Profil(memoire=True), Profil(memoire=True)
+    premier.__enter__()
+    second.__enter__()
+    premier.__exit__(None, None, None)
+    assert tracemalloc.is_tracing()
+    second.__exit__(None, None, None)
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracemalloc_deja_lance_reste_actif():
+    tracemalloc.start()
+    try:
+        with Profil(memoire=True):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_pas_de_remise_a_zero_pendant_un_autre_profil(monkeypatch):
+    remises = []
+    reset_peak = tracemalloc.reset_peak
+    monkeypatch.setattr(tracemalloc, "reset_peak", lambda: (remises.append(1), reset_peak()))
+
+    ouvert, fin = threading.Event(), threading.Event()
+
+    def travail():
+        with Profil(memoire=True) as profil, profil.etape("long"):
+            ouvert.set()
+            fin.wait(5)
+
+    thread = threading.Thread(target=travail)
+    thread.start()
+    ouvert.wait(5)
+    remises.clear()
+    with Profil(memoire=True) as profil:
+        with profil.etape("court"):
+            donnees = bytearray(2 * 1024 ** 2)
+        del donnees
+    assert remises == []
+    fin.set()
+    thread.join()
+
+    with Profil(memoire=True) as profil:
+        with profil.etape("seul"):
+            donnees = bytearray(2 * 1024 ** 2)
+        del donnees
+    assert remises
+    assert profil.etapes[0].pic_octets >= 2 * 1024 ** 2
+    assert profilage._profils_memoire == 0
@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from generateur_journaux import journal_achats, journal_ventes
+from rapport_controle import BLOQUANTE, CORRECTION, SUPPRESSION, filtrer
+from taux_change import StubProvider
+from validation_incrementale import IncrementalAchats, IncrementalVentes
+
+# Le Rapport rend le log texte historique à l'octet près, et ses KO (constats bloquants)
+# sont ceux que donnait la recherche de texte sur les messages d'erreur
+
+
+# Rendu d'avant les constats : erreurs en texte, KO par recherche de « COMPTE TIERS INVALIDE »
+# en achats, KO dès qu'une facture a une erreur en ventes
+
+def _logs_piece_texte(npiece, err, corr, is_avoir, lignes_vides):
+    ko = any("COMPTE TIERS INVALIDE" in e.upper() for e in err)
+    logs = [f"{'❌' if ko else '✅'} Achat {npiece} : {'KO' if ko else 'OK'}"]
+    logs.extend(f"   🛠️  {c}" for c in corr)
+    if is_avoir:
+        logs.append(f"   🔄 Achat {npiece} détecté comme AVOIR")
+    for e in err:
+        logs.append(f"   {'🔻' if 'COMPTE TIERS INVALIDE' in e.upper() else '🟢'} {e}")
+    logs.extend(f"   🗑️  Suppression ligne vide (index {idx}, Compte {compte})" for idx, compte in lignes_vides)
+    return logs, ko
+
+
+def _logs_facture_texte(num, erreurs):
+    logs = [f"{'❌' if erreurs else '✅'} Facture {num} : {'KO' if erreurs else 'OK'}"]
+    logs.extend(f"   🔻 {e}" for e in erreurs)
+    return logs
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_achats_logs_et_ko_identiques_au_texte(seed, vectorized):
+    source = journal_achats(800, taux_erreurs=0.2, seed=seed)
+
+    df_texte = source.copy()
+    logs_texte, ko_texte, _ = achats.run_checks(df_texte, vectorized)
+    rapport, ko, nb_ko = IncrementalAchats(vectorized).run(source.copy())
+
+    assert "\n".join(rapport.logs()) == "\n".join(logs_texte)
+    assert ko == rapport.ko == ko_texte
+    assert ko_texte
+    assert nb_ko == len(ko_texte)
+
+    logs, ko_legacy = [], []
+    for npiece, err, corr, is_avoir, lignes_vides in rapport.resultats:
+        lignes, statut_ko = _logs_piece_texte(npiece, [c.message for c in err], corr, is_avoir, lignes_vides)
+        logs.extend(lignes)
+        if statut_ko:
+            ko_legacy.append(npiece)
+    assert rapport.ko == ko_legacy
+    assert rapport.logs() == rapport.entete + logs + rapport.pied
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_ventes_logs_et_ko_identiques_au_texte(seed):
+    source = journal_ventes(800, taux_erreurs=0.2, seed=seed)
+
+    logs_texte, ko_texte, _, _ = ventes.run_ventes_checks_console(source.copy(), StubProvider())
+    rapport, ko, nb_ko, _ = IncrementalVentes(StubProvider()).run(source.copy())
+
+    assert "\n".join(rapport.logs()) == "\n".join(logs_texte)
+    assert ko == rapport.ko == ko_texte
+    assert ko_texte
+    assert nb_ko == len(ko_texte)
+
+    logs = [ligne for _, ligne in rapport.conversions]
+    for num, erreurs in rapport.resultats:
+        logs.extend(_logs_facture_texte(num, [c.message for c in erreurs]))
+    assert rapport.ko == [num for num, erreurs in rapport.resultats if erreurs]
+    assert rapport.logs() == logs + rapport.pied
+
+
+def test_constats_achats():
+    source = journal_achats(1500, taux_erreurs=0.2, seed=0)
+    rapport, _, _ = IncrementalAchats().run(source)
+    constats = rapport.constats()
+
+    bloquants = constats.loc[constats["severite"] == BLOQUANTE, "groupe"]
+    assert list(pd.unique(bloquants)) == rapport.ko
+    # Une ligne de constat par correction, ligne vide supprimée et erreur, dans l'ordre des logs
+    nb = sum(len(corr) + is_avoir + len(err) + len(vides) for _, err, corr, is_avoir, vides in rapport.resultats)
+    assert len(constats) == nb
+    assert (constats["severite"] == CORRECTION).sum() == sum(len(r[2]) for r in rapport.resultats)
+    assert (constats["severite"] == SUPPRESSION).sum() == sum(len(r[4]) for r in rapport.resultats)
+
+    vue = filtrer(constats, severites=[BLOQUANTE], groupes=rapport.ko[:2])
+    assert set(vue["groupe"]) == set(rapport.ko[:2])
+    assert (vue["severite"] == BLOQUANTE).all()
+    assert filtrer(constats, recherche=rapport.ko[0])["groupe"].str.contains(rapport.ko[0]).all()
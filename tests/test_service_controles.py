@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+import controle_achats_logic as achats
+import profilage
+from generateur_journaux import journal_achats
+from service_controles import ECHEC, EN_ATTENTE, EN_COURS, TERMINE, ServiceControles
+from validation_incrementale import IncrementalAchats
+
+# Service piloté directement, sans Streamlit : les travaux bloquent sur des Event pour
+# observer la file d'attente
+
+
+def _attendre(travail, delai=30):
+    limite = time.time() + delai
+    while not travail.termine:
+        assert time.time() < limite, f"travail {travail.id} toujours {travail.etat}"
+        time.sleep(0.01)
+    return travail
+
+
+def _bloquant(feu, demarre=None):
+    def fonction(travail):
+        if demarre is not None:
+            demarre.set()
+        assert feu.wait(30)
+        return travail.id
+    return fonction
+
+
+@pytest.fixture
+def service():
+    service = ServiceControles(workers=1)
+    yield service
+    service.arreter()
+
+
+def test_file_et_position(service):
+    feu, demarre = threading.Event(), threading.Event()
+    premier = service.soumettre(_bloquant(feu, demarre), "premier")
+    assert demarre.wait(30)
+    second = service.soumettre(_bloquant(feu), "second")
+    troisieme = service.soumettre(_bloquant(feu), "troisième")
+
+    # Un seul worker : le premier tourne, les suivants attendent dans l'ordre de soumission
+    assert premier.etat == EN_COURS
+    assert (second.etat, troisieme.etat) == (EN_ATTENTE, EN_ATTENTE)
+    assert [service.position(t) for t in (premier, second, troisieme)] == [0, 1, 2]
+    assert service.stats() == {EN_ATTENTE: 2, EN_COURS: 1, TERMINE: 0, ECHEC: 0}
+
+    feu.set()
+    for travail in (premier, second, troisieme):
+        _attendre(travail)
+    assert [t.resultat for t in (premier, second, troisieme)] == [premier.id, second.id, troisieme.id]
+    assert premier.fin <= second.debut and second.fin <= troisieme.debut
+    assert service.position(troisieme) == 0
+    assert service.stats()[TERMINE] == 3
+
+
+def test_echec_rapporte(service):
+    def fonction(travail):
+        travail.avertir("⚠️ Ligne d'en-tête introuvable")
+        raise ValueError("Classeur illisible")
+
+    travail = _attendre(service.soumettre(fonction, "échec"))
+
+    assert travail.etat == ECHEC
+    assert isinstance(travail.erreur, ValueError)
+    assert str(travail.erreur) == "Classeur illisible"
+    assert travail.resultat is None
+    assert travail.avertissements == ["⚠️ Ligne d'en-tête introuvable"]
+    # Un échec ne bloque pas le worker
+    assert _attendre(service.soumettre(lambda t: 42)).resultat == 42
+
+
+def test_avancement_par_etapes(service):
+    feu, demarre = threading.Event(), threading.Event()
+
+    def fonction(travail):
+        with profilage.etape("lecture"):
+            pass
+        with profilage.etape("controles"):
+            demarre.set()
+            assert feu.wait(30)
+        return "ok"
+
+    travail = service.soumettre(fonction, "achats", ["lecture", "controles"])
+    assert demarre.wait(30)
+    assert travail.etape() == "controles"
+    assert travail.avancement() == 0.5
+
+    feu.set()
+    _attendre(travail)
+    assert travail.avancement() == 1.0
+    assert travail.duree() > 0
+
+
+def test_resultat_garde_puis_oublie(service):
+    feu = threading.Event()
+    travail = service.soumettre(_bloquant(feu), "achats")
+
+    # Un travail en cours ne s'oublie pas
+    service.oublier(travail.id)
+    assert service.travail(travail.id) is travail
+
+    feu.set()
+    _attendre(travail)
+    # Relu à chaque rerun tant que la page ne l'a pas oublié
+    assert service.travail(travail.id) is travail
+    assert service.travail(travail.id).resultat == travail.id
+    service.oublier(travail.id)
+    assert service.travail(travail.id) is None
+    service.oublier(travail.id)
+    service.oublier(None)
+
+
+def test_travaux_termines_purges_apres_conservation():
+    service = ServiceControles(workers=1, conservation=0.05)
+    try:
+        ancien = _attendre(service.soumettre(lambda t: 1))
+        time.sleep(0.1)
+        recent = service.soumettre(lambda t: 2)
+        assert service.travail(ancien.id) is None
+        assert service.travail(recent.id) is recent
+    finally:
+        service.arreter()
+
+
+def test_validateur_reutilise_d_une_soumission_a_l_autre(service):
+    # Le validateur vit hors du worker : la seconde soumission ne recontrôle que la pièce modifiée
+    validateur = IncrementalAchats()
+    df = journal_achats(1000, taux_erreurs=0.2, seed=0)
+
+    premier = _attendre(service.soumettre(lambda t: validateur.validate(df), "achats"))
+    assert premier.etat == TERMINE
+
+    # Correction saisie sur le tableau contrôlé (cf. st.session_state.df_source)
+    piece = df["n° de piece"].iloc[0]
+    df.loc[(df["n° de piece"] == piece) & (df["Compte Généraux"] != "401000"), "Libelle"] = "modifié"
+    corrige = df.copy()
+    second = _attendre(service.soumettre(lambda t: validateur.validate(corrige), "achats"))
+
+    rapport, ko, nb_ko = second.resultat
+    logs, ko_complet, nb_ko_complet = achats.run_checks(df.copy())
+    assert (rapport.logs(), ko, nb_ko) == (logs, ko_complet, nb_ko_complet)
+    assert second.profil.compteurs["pieces_controlees"] < premier.profil.compteurs["pieces_controlees"]
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import taux_change
+from controle_ventes_logic import TAUX_SECOURS, get_conversion_rate_frankfurter
+from taux_change import RateCache, get_rates
+
+
+class FournisseurCompteur:
+    # Série des jours ouvrés (hors fériés) à taux croissant ; note chaque requête
+    def __init__(self, feries=()):
+        self.feries = set(feries)
+        self.appels = []
+
+    def fetch_series(self, devise, debut, fin, cible="EUR"):
+        self.appels.append((devise, debut, fin))
+        jour, serie = date.fromisoformat(debut), {}
+        while jour <= date.fromisoformat(fin):
+            if jour.weekday() < 5 and jour.isoformat() not in self.feries:
+                serie[jour.isoformat()] = 1 + jour.toordinal() % 1000 / 1000
+            jour += timedelta(days=1)
+        return serie
+
+
+def _taux(jour):
+    return 1 + date.fromisoformat(jour).toordinal() % 1000 / 1000
+
+
+def test_doublons_demandes_une_fois():
+    fournisseur = FournisseurCompteur()
+    demandes = [("2025-03-03", "USD")] * 5 + [("2025-03-04", "USD")] * 3
+    taux, erreurs = get_rates(demandes, fournisseur)
+    assert erreurs == {}
+    assert taux == {("2025-03-03", "USD"): _taux("2025-03-03"), ("2025-03-04", "USD"): _taux("2025-03-04")}
+    assert len(fournisseur.appels) == 1
+
+
+def test_une_serie_par_devise():
+    fournisseur = FournisseurCompteur()
+    demandes = [(f"2025-03-{j:02d}", devise) for j in (3, 10, 17, 24) for devise in ("USD", "GBP", "CHF")]
+    taux, _ = get_rates(demandes, fournisseur)
+    assert len(taux) == len(demandes)
+    assert sorted(devise for devise, _, _ in fournisseur.appels) == ["CHF", "GBP", "USD"]
+    # Chaque série couvre toute la plage demandée, marge comprise
+    for _, debut, fin in fournisseur.appels:
+        assert debut == (date(2025, 3, 3) - timedelta(days=taux_change.MARGE_JOURS)).isoformat()
+        assert fin == "2025-03-24"
+
+
+def test_cache_sert_les_demandes_suivantes(tmp_path):
+    cache = RateCache(str(tmp_path / "taux.sqlite"))
+    demandes = [("2025-03-03", "USD"), ("2025-03-05", "GBP")]
+    fournisseur = FournisseurCompteur()
+    premier, _ = get_rates(demandes, fournisseur, cache)
+    assert len(fournisseur.appels) == 2
+
+    # Nouvelle instance sur le même fichier : aucune requête
+    fournisseur = FournisseurCompteur()
+    second, _ = get_rates(demandes, fournisseur, RateCache(cache.chemin))
+    assert second == premier
+    assert fournisseur.appels == []
+
+
+def test_week_end_et_ferie_reprennent_le_taux_precedent(tmp_path):
+    fournisseur = FournisseurCompteur(feries={"2025-12-25", "2025-12-26"})
+    demandes = [("2025-03-08", "USD"), ("2025-03-09", "USD"), ("2025-12-25", "USD"), ("2025-12-27", "USD")]
+    taux, _ = get_rates(demandes, fournisseur, RateCache(str(tmp_path / "taux.sqlite")))
+    assert taux[("2025-03-08", "USD")] == taux[("2025-03-09", "USD")] == _taux("2025-03-07")
+    assert taux[("2025-12-25", "USD")] == taux[("2025-12-27", "USD")] == _taux("2025-12-24")
+
+
+def test_devise_en_erreur_sans_taux():
+    class FournisseurEnPanne:
+        def fetch_series(self, devise, debut, fin, cible="EUR"):
+            raise ConnectionError("hors ligne")
+
+    taux, erreurs = get_rates([("2025-03-03", "USD")], FournisseurEnPanne())
+    assert taux == {}
+    assert erreurs == {"USD": "hors ligne"}
+
+
+class _Serveur(BaseHTTPRequestHandler):
+    # Réponses successives du test : code HTTP ou délai (s) avant de répondre 200
+    reponses = []
+    requetes = 0
+
+    def do_GET(self):
+        classe = type(self)
+        reponse = classe.reponses[min(classe.requetes, len(classe.reponses) - 1)]
+        classe.requetes += 1
+        if isinstance(reponse, float):
+            time.sleep(reponse)
+            reponse = 200
+        corps = json.dumps({"rates": {"EUR": 0.9}}).encode()
+        self.send_response(reponse)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def serveur(monkeypatch):
+    monkeypatch.setattr(taux_change, "ATTENTE", 0.01)
+    _Serveur.reponses, _Serveur.requetes = [200], 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Serveur)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield _Serveur, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_get_json_reessaie_les_erreurs_temporaires(serveur):
+    handler, url = serveur
+    handler.reponses = [503, 429, 200]
+    assert taux_change.get_json(url, {"from": "USD"}) == {"rates": {"EUR": 0.9}}
+    assert handler.requetes == 3
+
+
+def test_get_json_abandonne_apres_les_tentatives(serveur):
+    handler, url = serveur
+    handler.reponses = [500]
+    with pytest.raises(taux_change.ErreurTemporaire):
+        taux_change.get_json(url, {})
+    assert handler.requetes == taux_change.TENTATIVES
+
+
+def test_get_json_timeout_reessaye(serveur):
+    handler, url = serveur
+    handler.reponses = [0.5, 200]
+    assert taux_change.get_json(url, {}, timeout=0.1) == {"rates": {"EUR": 0.9}}
+    assert handler.requetes == 2
+
+    handler.reponses, handler.requetes = [0.5], 0
+    with pytest.raises(requests.Timeout):
+        taux_change.get_json(url, {}, timeout=0.1)
+    assert handler.requetes == taux_change.TENTATIVES
+
+
+def test_taux_unique_secours_signale(tmp_path):
+    class FournisseurVide:
+        def fetch_series(self, devise, debut, fin, cible="EUR"):
+            return {}
+
+    logs = []
+    taux = get_conversion_rate_frankfurter("2025-03-03", "USD", logs=logs, provider=FournisseurVide(),
+                                            cache=RateCache(str(tmp_path / "taux.sqlite")))
+    assert taux == TAUX_SECOURS
+    assert logs == ["⚠️ Conversion USD : aucun taux USD→EUR au 2025-03-03, taux de secours 1.0 appliqué"]
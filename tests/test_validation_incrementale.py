@@ -0,0 +1,148 @@
+import pandas as pd
+import pytest
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+import validation_incrementale
+from generateur_journaux import journal_achats, journal_ventes
+from taux_change import StubProvider
+from validation_incrementale import IncrementalAchats, IncrementalVentes
+
+# Après une correction, validate() doit rendre ce qu'un contrôle complet du tableau corrigé
+# rendrait : mêmes logs, mêmes groupes KO, même tableau
+
+
+def _piece(df, cle, rang=3):
+    return pd.unique(df[cle])[rang]
+
+
+def _ligne(df, cle, compte_col, contrepartie, rang=3):
+    # Une ligne de la pièce / facture hors 401000 / 411000
+    lignes = df[(df[cle] == _piece(df, cle, rang)) & (df[compte_col].astype(str) != contrepartie)]
+    return lignes.index[0]
+
+
+# -- achats -------------------------------------------------------------------------------
+
+def _montant_achat(df):
+    df.loc[_ligne(df, "n° de piece", "Compte Généraux", "401000"), "Débit(€)"] += 12.5
+    return df
+
+
+def _renumeroter_achat(df):
+    piece = _piece(df, "n° de piece")
+    df.loc[df["n° de piece"] == piece, "n° de piece"] = "12-99999"
+    return df
+
+
+def _fusionner_achats(df):
+    # Une pièce prend le n° d'une autre, qui doit être recontrôlée avec elle
+    df.loc[df["n° de piece"] == _piece(df, "n° de piece", 3), "n° de piece"] = _piece(df, "n° de piece", 5)
+    return df
+
+
+def _cle_normalisee_achat(df):
+    # « 03-15 » avec espaces : la normalisation en fait le n° d'une pièce non touchée
+    df.loc[df["n° de piece"] == _piece(df, "n° de piece", 3), "n° de piece"] = f" {_piece(df, 'n° de piece', 5)} "
+    return df
+
+
+def _ajouter_ligne_achat(df):
+    ligne = df.loc[[_ligne(df, "n° de piece", "Compte Généraux", "401000")]].copy()
+    ligne.index = [df.index.max() + 1]
+    ligne["Débit(€)"] = 99.99
+    return pd.concat([df, ligne])
+
+
+def _retirer_ligne_achat(df):
+    return df.drop(index=_ligne(df, "n° de piece", "Compte Généraux", "401000"))
+
+
+def _compter_complets(validateur):
+    # Contrôles complets lancés par validate() (repli quand la fusion est impossible…)
+    complets = []
+    run = validateur.run
+    validateur.run = lambda df: complets.append(1) or run(df)
+    return complets
+
+
+# (édition, repli attendu sur un contrôle complet)
+@pytest.mark.parametrize("editer, repli", [
+    (_montant_achat, False), (_renumeroter_achat, False), (_fusionner_achats, False),
+    (_cle_normalisee_achat, True), (_ajouter_ligne_achat, False), (_retirer_ligne_achat, False),
+])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_achats_validate_egal_controle_complet(editer, repli, seed):
+    validateur = IncrementalAchats()
+    df = journal_achats(600, taux_erreurs=0.2, seed=seed)
+    validateur.run(df)
+    complets = _compter_complets(validateur)
+
+    edite = editer(df.copy())
+    complet = edite.copy()
+    logs, ko, nb_ko = achats.run_checks(complet)
+
+    rapport, ko_inc, nb_inc = validateur.validate(edite)
+    assert bool(complets) == repli
+    assert rapport.logs() == logs
+    assert (ko_inc, nb_inc) == (ko, nb_ko)
+    pd.testing.assert_frame_equal(edite.astype(object), complet.astype(object), check_exact=True)
+
+
+def test_achats_trop_de_groupes_controle_complet(monkeypatch):
+    validateur = IncrementalAchats()
+    df = journal_achats(300, seed=0)
+    validateur.run(df)
+    complets = _compter_complets(validateur)
+    monkeypatch.setattr(validation_incrementale, "SEUIL_COMPLET", 0.0)
+    validateur.validate(_montant_achat(df.copy()))
+    assert complets == [1]
+
+
+# -- ventes -------------------------------------------------------------------------------
+
+def _montant_vente(df):
+    df.loc[_ligne(df, "Numéro de facture", "Compte général", "411000"), "Crédit"] += 7.25
+    return df
+
+
+def _renumeroter_vente(df):
+    num = _piece(df, "Numéro de facture")
+    df.loc[df["Numéro de facture"] == num, "Numéro de facture"] = "FV9999999"
+    return df
+
+
+def _fusionner_ventes(df):
+    num, autre = _piece(df, "Numéro de facture", 3), _piece(df, "Numéro de facture", 5)
+    df.loc[df["Numéro de facture"] == num, "Numéro de facture"] = autre
+    return df
+
+
+def _ajouter_ligne_vente(df):
+    ligne = df.loc[[_ligne(df, "Numéro de facture", "Compte général", "411000")]].copy()
+    ligne.index = [df.index.max() + 1]
+    ligne["Crédit"] = 42.0
+    return pd.concat([df, ligne])
+
+
+def _retirer_ligne_vente(df):
+    return df.drop(index=_ligne(df, "Numéro de facture", "Compte général", "411000"))
+
+
+@pytest.mark.parametrize("editer", [
+    _montant_vente, _renumeroter_vente, _fusionner_ventes, _ajouter_ligne_vente, _retirer_ligne_vente,
+])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_ventes_validate_egal_controle_complet(editer, seed):
+    validateur = IncrementalVentes(provider=StubProvider())
+    _, _, _, df = validateur.run(journal_ventes(600, taux_erreurs=0.2, seed=seed))
+    complets = _compter_complets(validateur)
+
+    edite = editer(df.copy())
+    logs, ko, nb_ko, complet = ventes.run_ventes_checks_console(edite.copy(), StubProvider())
+
+    rapport, ko_inc, nb_inc, df_inc = validateur.validate(edite)
+    assert complets == []
+    assert rapport.logs() == logs
+    assert (ko_inc, nb_inc) == (ko, nb_ko)
+    pd.testing.assert_frame_equal(df_inc.astype(object), complet.astype(object), check_exact=True)
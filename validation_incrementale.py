@@ -0,0 +1,222 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+import controle_achats_logic as achats
+import controle_ventes_logic as ventes
+from rapport_controle import Rapport
+from regles import Constat
+
+# Revalidation incrémentale : on garde le résultat de chaque pièce / facture du dernier
+# contrôle et l'empreinte de chaque ligne du tableau corrigé. Après des corrections, seuls
+# les groupes dont une ligne a changé (ou a été ajoutée / retirée) sont recontrôlés.
+#
+# Un groupe non modifié est restitué tel qu'un second contrôle complet le verrait, une fois
+# ses corrections automatiques et suppressions de lignes vides appliquées. Avec une règle de
+# portée fichier active (cf. regles), tout le tableau est recontrôlé.
+#
+# Les deux validateurs rendent un Rapport (cf. rapport_controle) : les constats des groupes
+# non recontrôlés sont repris tels quels, le log texte n'est produit qu'à la demande.
+
+# Au-delà de cette part de groupes touchés, un contrôle complet est plus simple et aussi rapide
+SEUIL_COMPLET = 0.5
+
+
+def _empreintes(df: pd.DataFrame) -> pd.Series:
+    return pd.util.hash_pandas_object(df, index=True)
+
+
+class _Etat:
+    def __init__(self, df: pd.DataFrame, cle: str):
+        self.colonnes = list(df.columns)
+        self.empreintes = _empreintes(df)
+        self.cles = df[cle].copy()
+
+    def groupes_touches(self, df: pd.DataFrame, cle: str) -> Optional[Set]:
+        if list(df.columns) != self.colonnes or not df.index.is_unique:
+            return None
+        empreintes = _empreintes(df)
+        communs = empreintes.index.intersection(self.empreintes.index)
+        differents = empreintes.loc[communs].to_numpy() != self.empreintes.loc[communs].to_numpy()
+        modifies = communs[differents]
+        ajoutes = empreintes.index.difference(self.empreintes.index)
+        retires = self.empreintes.index.difference(empreintes.index)
+        return set(df.loc[modifies.union(ajoutes), cle]) | set(self.cles.loc[modifies.union(retires)])
+
+
+def _reinjecter(df: pd.DataFrame, sous: pd.DataFrame) -> None:
+    # Les colonnes catégorielles (cf. schema_journal) du sous-tableau recontrôlé n'ont pas les
+    # mêmes catégories que le tableau complet : on les réunit avant de recopier les lignes.
+    for col in sous.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and isinstance(sous[col].dtype, pd.CategoricalDtype):
+            categories = df[col].cat.categories.union(sous[col].cat.categories)
+            df[col] = df[col].cat.set_categories(categories)
+            sous[col] = sous[col].cat.set_categories(categories)
+    df.loc[sous.index, sous.columns] = sous
+
+
+def _trop_de_groupes(touches: Set, nb_groupes: int) -> bool:
+    return len(touches) > SEUIL_COMPLET * max(nb_groupes, 1)
+
+
+def _fusion_impossible(df: pd.DataFrame, sous: pd.DataFrame, cle: str, touches: Set) -> bool:
+    # La normalisation peut transformer une clé modifiée (« fa12 » → « FA12 ») en celle d'un
+    # groupe non recontrôlé : il faudrait alors recontrôler ce groupe aussi.
+    nouvelles = set(sous[cle]) - touches
+    reste = df.loc[df.index.difference(sous.index), cle]
+    return bool(nouvelles & set(reste))
+
+
+class IncrementalAchats:
+    def __init__(self, vectorized: bool = True):
+        self.vectorized = vectorized
+        self._entete: List[str] = []
+        self._resultats: Dict[str, achats.ResultatAchat] = {}
+        self._etat: Optional[_Etat] = None
+
+    def _memoriser(self, df: pd.DataFrame, resultats: List[achats.ResultatAchat]) -> None:
+        # Une pièce corrigée ou allégée de lignes vides n'aura plus le même résultat au
+        # contrôle suivant : on la recontrôle tout de suite sur le tableau corrigé.
+        a_revoir = [r[0] for r in resultats if r[2] or r[4]]
+        if a_revoir:
+            sous = df[df["n° de piece"].isin(a_revoir)].copy()
+            resultats = [r for r in resultats if not (r[2] or r[4])]
+            resultats += achats.check_pieces_resultats(sous, self.vectorized)
+        for resultat in resultats:
+            self._resultats[resultat[0]] = resultat
+        self._etat = _Etat(df, "n° de piece")
+
+    def _rendre(self, ordre, nouveaux: Dict[str, achats.ResultatAchat]) -> Tuple[List[achats.ResultatAchat], List[int]]:
+        resultats = [nouveaux.get(npiece) or self._resultats[npiece] for npiece in ordre]
+        return resultats, [idx for r in resultats for idx, _ in r[4]]
+
+    def _terminer(self, resultats: List[achats.ResultatAchat], indices_a_suppr: List[int]) -> Tuple[Rapport, List[str], int]:
+        nb_ko = sum(achats.piece_ko(r) for r in resultats)
+        rapport = Rapport("achats", resultats, self._entete, achats.summary_logs(len(indices_a_suppr), nb_ko))
+        return rapport, rapport.ko, nb_ko
+
+    def run(self, df: pd.DataFrame) -> Tuple[Rapport, List[str], int]:
+        self._entete = achats.prepare_achats(df, self.vectorized)
+        resultats = achats.check_pieces_resultats(df, self.vectorized)
+        nouveaux = {r[0]: r for r in resultats}
+
+        self._resultats = {}
+        rendus, indices_a_suppr = self._rendre(nouveaux, nouveaux)
+        if indices_a_suppr:
+            df.drop(index=indices_a_suppr, inplace=True)
+        self._memoriser(df, resultats)
+
+        return self._terminer(rendus, indices_a_suppr)
+
+    def validate(self, df: pd.DataFrame) -> Tuple[Rapport, List[str], int]:
+        touches = self._etat.groupes_touches(df, "n° de piece") if self._etat else None
+        if (
+            touches is None
+            or _trop_de_groupes(touches, len(self._resultats))
+            or "" in touches
+            or any(pd.isna(t) for t in touches)
+            or achats.regles_achats().portee_fichier()
+        ):
+            return self.run(df)
+
+        sous = df[df["n° de piece"].isin(touches)].copy()
+        achats.prepare_achats(sous, self.vectorized)
+        if _fusion_impossible(df, sous, "n° de piece", touches):
+            return self.run(df)
+
+        resultats = achats.check_pieces_resultats(sous, self.vectorized)
+        _reinjecter(df, sous)
+        for npiece in touches:
+            self._resultats.pop(npiece, None)
+        nouveaux = {r[0]: r for r in resultats}
+
+        rendus, indices_a_suppr = self._rendre(pd.unique(df["n° de piece"]), nouveaux)
+        if indices_a_suppr:
+            df.drop(index=indices_a_suppr, inplace=True)
+        self._memoriser(df, resultats)
+
+        return self._terminer(rendus, indices_a_suppr)
+
+
+class IncrementalVentes:
+    def __init__(self, provider=None, cache=None):
+        self.provider = provider
+        self.cache = cache
+        self._conversions: Dict[str, List[str]] = {}
+        self._resultats: Dict[str, List[Constat]] = {}
+        self._etat: Optional[_Etat] = None
+
+    def _memoriser(self, df: pd.DataFrame, conversions: List[Tuple[str, str]], resultats) -> None:
+        # Seules les factures restées hors euro (devise inconnue, erreur) relogueront leur
+        # conversion ; les autres sont déjà en € au contrôle suivant.
+        non_converties = set(df.loc[df["Monnaie"] != "€", "Numéro de facture"])
+        for num in {num for num, _ in conversions} | {num for num, _ in resultats}:
+            self._conversions.pop(num, None)
+        for num, ligne in conversions:
+            if num in non_converties:
+                self._conversions.setdefault(num, []).append(ligne)
+        for num, erreurs in resultats:
+            self._resultats[num] = erreurs
+        self._etat = _Etat(df, "Numéro de facture")
+
+    def _rendre(self, ordre, conversions, resultats) -> Tuple[List[Tuple[str, str]], List[ventes.ResultatVente]]:
+        nouvelles_conv: Dict[str, List[str]] = {}
+        for num, ligne in conversions:
+            nouvelles_conv.setdefault(num, []).append(ligne)
+        nouveaux = dict(resultats)
+
+        rendues: List[Tuple[str, str]] = []
+        for num in ordre:
+            lignes = nouvelles_conv.get(num, []) if num in nouveaux else self._conversions.get(num, [])
+            rendues.extend((num, ligne) for ligne in lignes)
+        rendus = [
+            (num, nouveaux[num] if num in nouveaux else self._resultats[num])
+            for num in ordre
+            if num in nouveaux or num in self._resultats
+        ]
+        return rendues, rendus
+
+    def _terminer(self, df, conversions, resultats) -> Tuple[Rapport, List[str], int, pd.DataFrame]:
+        factures_ko = [num for num, erreurs in resultats if ventes.facture_ko(erreurs)]
+        pied = ventes.summary_logs(factures_ko, "Concierge" in df.columns)
+        rapport = Rapport("ventes", resultats, pied=pied, conversions=conversions)
+        if not factures_ko and "Concierge" in df.columns:
+            df = df.drop(columns=["Concierge"])
+        return rapport, factures_ko, len(factures_ko), df
+
+    def run(self, df: pd.DataFrame) -> Tuple[Rapport, List[str], int, pd.DataFrame]:
+        df = ventes.prepare_ventes(df)
+        conversions = ventes.convert_currencies_par_facture(df, self.provider, self.cache)
+        resultats = ventes.check_factures_resultats(df)
+
+        self._conversions, self._resultats = {}, {}
+        ordre = pd.unique(df["Numéro de facture"])
+        rendues, rendus = self._rendre(ordre, conversions, resultats)
+        self._memoriser(df, conversions, resultats)
+        return self._terminer(df, rendues, rendus)
+
+    def validate(self, df: pd.DataFrame) -> Tuple[Rapport, List[str], int, pd.DataFrame]:
+        touches = self._etat.groupes_touches(df, "Numéro de facture") if self._etat else None
+        if (
+            touches is None
+            or _trop_de_groupes(touches, len(self._resultats))
+            or any(pd.isna(t) for t in touches)
+            or ventes.regles_ventes().portee_fichier()
+        ):
+            return self.run(df)
+
+        sous = ventes.prepare_ventes(df[df["Numéro de facture"].isin(touches)].copy())
+        if _fusion_impossible(df, sous, "Numéro de facture", touches):
+            return self.run(df)
+
+        conversions = ventes.convert_currencies_par_facture(sous, self.provider, self.cache)
+        resultats = ventes.check_factures_resultats(sous)
+        df = df.copy()
+        _reinjecter(df, sous)
+        for num in touches:
+            self._resultats.pop(num, None)
+
+        ordre = pd.unique(df["Numéro de facture"])
+        rendues, rendus = self._rendre(ordre, conversions, resultats)
+        self._memoriser(df, conversions, resultats)
+        return self._terminer(df, rendues, rendus)